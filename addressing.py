@@ -0,0 +1,128 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+from itertools import product
+from string import ascii_uppercase
+
+
+# Filas de una hoja como en Excel: una columna completa (A:A) llega hasta la última
+MAX_ROWS = 1_048_576
+
+# Columnas que se pueden nombrar con hasta tres letras (A..ZZZ)
+MAX_COLS = 18_278
+
+# Letras de columna precalculadas de A a ZZ; las de tres letras (AAA..ZZZ)
+# se calculan una vez y quedan en caché
+LETTERS = list(ascii_uppercase) + ["".join(pair) for pair in product(ascii_uppercase, repeat=2)]
+INDEXES = {letters: index for index, letters in enumerate(LETTERS)}
+
+REF_RE = re.compile(r"(\$?)([A-Za-z]{1,3})(\$?)(\d+)")
+
+# Una celda (A1, $B$2), un rango (C3:F900) o columnas completas (A:A, $B:D)
+AREA_RE = re.compile(r"""
+    \$?(?P<c0>[A-Za-z]{1,3})\$?(?P<r0>\d+)(?::\$?(?P<c1>[A-Za-z]{1,3})\$?(?P<r1>\d+))?
+  | \$?(?P<col0>[A-Za-z]{1,3}):\$?(?P<col1>[A-Za-z]{1,3})
+""", re.VERBOSE)
+
+
+@lru_cache(maxsize=4096)
+def compute_letter(col):
+    letters = ""
+    while col >= 0:
+        letters = chr(col % 26 + 65) + letters
+        col = col // 26 - 1
+    return letters
+
+
+@lru_cache(maxsize=4096)
+def compute_index(letters):
+    index = 0
+    for char in letters.upper():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def column_letter(col):
+    """Convierte número de columna a letras (0=A, 1=B, ..., 26=AA)"""
+    if 0 <= col < len(LETTERS):
+        return LETTERS[col]
+    return compute_letter(col)
+
+
+def column_index(letters):
+    """Convierte letras de columna a número (A=0, B=1, ..., AA=26)"""
+    index = INDEXES.get(letters)
+    if index is None:
+        return compute_index(letters)
+    return index
+
+
+def cell_name(row, col):
+    """Nombre A1 de la celda (fila, col) contadas desde 0"""
+    return f"{column_letter(col)}{row + 1}"
+
+
+def parse_ref(text):
+    """Convierte una referencia A1 en (fila, col)"""
+    match = REF_RE.fullmatch(text)
+    return int(match.group(4)) - 1, column_index(match.group(2))
+
+
+class Area(namedtuple("Area", "r0 c0 r1 c1")):
+    """Rectángulo [r0, r1] x [c0, c1] de una referencia, sin expandir.
+    
+    Las celdas se recorren con `cells()` a medida que se piden: un rango como
+    A:A no arma nunca la lista de su millón de celdas.
+    """
+    
+    __slots__ = ()
+    
+    @property
+    def whole_columns(self):
+        return self.r0 == 0 and self.r1 == MAX_ROWS - 1
+    
+    @property
+    def size(self):
+        return (self.r1 - self.r0 + 1) * (self.c1 - self.c0 + 1)
+    
+    def contains(self, row, col):
+        return self.r0 <= row <= self.r1 and self.c0 <= col <= self.c1
+    
+    def clip(self, num_rows):
+        """El área sin las filas desde `num_rows` (p. ej. A:A hasta el final de la hoja)"""
+        return self._replace(r1=min(self.r1, num_rows - 1))
+    
+    def cells(self):
+        """(fila, col) por filas y de izquierda a derecha"""
+        cols = range(self.c0, self.c1 + 1)
+        for row in range(self.r0, self.r1 + 1):
+            for col in cols:
+                yield row, col
+    
+    def __str__(self):
+        if self.whole_columns:
+            return f"{column_letter(self.c0)}:{column_letter(self.c1)}"
+        start = cell_name(self.r0, self.c0)
+        if (self.r0, self.c0) == (self.r1, self.c1):
+            return start
+        return f"{start}:{cell_name(self.r1, self.c1)}"
+
+
+def parse_area(text):
+    """Lee "A1", "$B$2", "C3:F900" o "A:C" como un Area (ValueError si no es
+    una referencia)"""
+    match = AREA_RE.fullmatch(text.strip())
+    if match is None:
+        raise ValueError(f"Referencia no válida: {text.strip()}")
+    if match.group("col0") is not None:
+        c0, c1 = column_index(match.group("col0")), column_index(match.group("col1"))
+        return Area(0, min(c0, c1), MAX_ROWS - 1, max(c0, c1))
+    
+    r0, c0 = int(match.group("r0")) - 1, column_index(match.group("c0"))
+    if match.group("c1") is None:
+        r1, c1 = r0, c0
+    else:
+        r1, c1 = int(match.group("r1")) - 1, column_index(match.group("c1"))
+    if min(r0, r1) < 0:
+        raise ValueError(f"Referencia no válida: {text.strip()}")
+    return Area(min(r0, r1), min(c0, c1), max(r0, r1), max(c0, c1))
@@ -0,0 +1,240 @@
+import math
+import re
+from array import array
+
+from sheet_model import NAN, parse_number
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class CellRange:
+    """Rango rectangular [r0, r1] x [c0, c1] que se pasa sin copiar a las funciones"""
+    
+    __slots__ = ("engine", "r0", "c0", "r1", "c1")
+    
+    def __init__(self, engine, r0, c0, r1, c1):
+        self.engine = engine
+        self.r0 = r0
+        self.c0 = c0
+        self.r1 = r1
+        self.c1 = c1
+    
+    @property
+    def height(self):
+        return self.r1 - self.r0 + 1
+    
+    @property
+    def width(self):
+        return self.c1 - self.c0 + 1
+    
+    def values(self):
+        """Valores celda a celda, por filas"""
+        return self.engine.range_values(self.r0, self.c0, self.r1, self.c1)
+    
+    def numeric_columns(self):
+        for col in range(self.c0, self.c1 + 1):
+            yield numeric_slice(self.engine, col, self.r0, self.r1)
+    
+    def shifted(self, other):
+        """Rango del mismo tamaño que `other` empezando en la esquina de este"""
+        return CellRange(
+            self.engine, self.r0, self.c0,
+            self.r0 + other.height - 1, self.c0 + other.width - 1,
+        )
+
+
+def numeric_slice(engine, col, r0, r1):
+    """Buffer array('d') contiguo de una columna (NaN = vacía o texto), con los
+    valores ya calculados de las fórmulas del rango"""
+    size = r1 - r0 + 1
+    numbers = engine.sheet.numbers(col)
+    if numbers is None:
+        buffer = array("d", [NAN]) * size
+    else:
+        buffer = numbers[r0:r1 + 1]
+        if len(buffer) < size:
+            buffer.extend(array("d", [NAN]) * (size - len(buffer)))
+    
+    for row in engine.formula_rows_in(col, r0, r1):
+        value = engine.values.get((row, col), "")
+        if isinstance(value, Exception):
+            raise value
+        buffer[row - r0] = value if isinstance(value, float) else NAN
+    return buffer
+
+
+def text_slice(engine, col, r0, r1):
+    """Textos de una columna en el rango, con las fórmulas ya calculadas"""
+    column = engine.sheet.column(col)
+    texts = column.slice(r0, r1 + 1) if column is not None else [""] * (r1 - r0 + 1)
+    for row in engine.formula_rows_in(col, r0, r1):
+        value = engine.values.get((row, col), "")
+        if isinstance(value, Exception):
+            raise value
+        texts[row - r0] = value if isinstance(value, str) else ""
+    return texts
+
+
+# Agregados sobre un buffer: NumPy si está disponible, Python puro si no
+
+def buffer_stats(buffer):
+    """Devuelve (suma, cantidad, mínimo, máximo) de los números del buffer"""
+    if np is not None:
+        values = np.frombuffer(buffer, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return 0.0, 0, None, None
+        return float(values.sum()), int(values.size), float(values.min()), float(values.max())
+    
+    values = [value for value in buffer if value == value]
+    if not values:
+        return 0.0, 0, None, None
+    return math.fsum(values), len(values), min(values), max(values)
+
+
+def buffer_sum(buffer):
+    if np is not None:
+        return float(np.nansum(np.frombuffer(buffer, dtype=np.float64)))
+    return math.fsum(value for value in buffer if value == value)
+
+
+def buffer_count(buffer):
+    if np is not None:
+        return int(np.count_nonzero(~np.isnan(np.frombuffer(buffer, dtype=np.float64))))
+    return sum(1 for value in buffer if value == value)
+
+
+def range_sum(cells):
+    return sum(buffer_sum(buffer) for buffer in cells.numeric_columns())
+
+
+def range_count(cells):
+    return sum(buffer_count(buffer) for buffer in cells.numeric_columns())
+
+
+def range_stats(cells):
+    total, count, low, high = 0.0, 0, None, None
+    for buffer in cells.numeric_columns():
+        column_total, column_count, column_low, column_high = buffer_stats(buffer)
+        total += column_total
+        count += column_count
+        if column_count:
+            low = column_low if low is None else min(low, column_low)
+            high = column_high if high is None else max(high, column_high)
+    return total, count, low, high
+
+
+# Criterios de SUMIF / COUNTIF (">100", "<>0", "caja", "ca*", ...)
+
+CRITERIA_RE = re.compile(r"(<>|<=|>=|=|<|>)?(.*)", re.DOTALL)
+
+
+def parse_criteria(criteria):
+    """Devuelve (operador, número o None, texto en minúsculas)"""
+    if isinstance(criteria, bool):
+        return "=", None, "verdadero" if criteria else "falso"
+    if isinstance(criteria, float):
+        return "=", criteria, None
+    op, operand = CRITERIA_RE.fullmatch(criteria).groups()
+    return op or "=", parse_number(operand), operand.lower()
+
+
+def wildcard_regex(text):
+    """Convierte los comodines * y ? de Excel en una expresión regular"""
+    pattern = "".join(
+        ".*" if char == "*" else "." if char == "?" else re.escape(char)
+        for char in text
+    )
+    return re.compile(pattern, re.DOTALL)
+
+
+def criteria_mask(criteria, cells, col_offset):
+    """Máscara booleana de las filas de una columna del rango que cumplen el criterio"""
+    op, number, text = criteria
+    col = cells.c0 + col_offset
+    
+    if number is not None:
+        # Criterio numérico: comparación vectorizada sobre el buffer
+        buffer = numeric_slice(cells.engine, col, cells.r0, cells.r1)
+        if np is not None:
+            values = np.frombuffer(buffer, dtype=np.float64)
+            if op == "<>":
+                return ~(values == number)
+            return NUMPY_COMPARE[op](values, number)
+        if op == "<>":
+            return [not value == number for value in buffer]
+        compare = PYTHON_COMPARE[op]
+        return [value == value and compare(value, number) for value in buffer]
+    
+    # Criterio de texto: igualdad (con comodines) u orden sin mayúsculas
+    texts = text_slice(cells.engine, col, cells.r0, cells.r1)
+    if op in ("=", "<>"):
+        if "*" in text or "?" in text:
+            matcher = wildcard_regex(text).fullmatch
+            matches = [matcher(value.lower()) is not None for value in texts]
+        elif text == "":
+            numbers = numeric_slice(cells.engine, col, cells.r0, cells.r1)
+            matches = [value == "" and number != number for value, number in zip(texts, numbers)]
+        elif np is not None:
+            matches = np.char.lower(np.array(texts, dtype=str)) == text
+        else:
+            matches = [value.lower() == text for value in texts]
+        if op == "<>":
+            return ~np.asarray(matches, dtype=bool) if np is not None else [not match for match in matches]
+        return matches
+    
+    compare = PYTHON_COMPARE[op]
+    return [value != "" and compare(value.lower(), text) for value in texts]
+
+
+PYTHON_COMPARE = {
+    "=": lambda a, b: a == b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+}
+
+if np is not None:
+    NUMPY_COMPARE = {
+        "=": np.equal,
+        "<": np.less,
+        ">": np.greater,
+        "<=": np.less_equal,
+        ">=": np.greater_equal,
+    }
+
+
+def conditional_stats(cells, criteria, sum_cells=None):
+    """Suma y cantidad de las celdas de `sum_cells` cuya celda de `cells` cumple el criterio"""
+    criteria = parse_criteria(criteria)
+    sum_cells = cells.shifted(cells) if sum_cells is None else sum_cells.shifted(cells)
+    total, count = 0.0, 0
+    for offset, buffer in enumerate(sum_cells.numeric_columns()):
+        mask = criteria_mask(criteria, cells, offset)
+        if np is not None:
+            values = np.frombuffer(buffer, dtype=np.float64)[np.asarray(mask, dtype=bool)]
+            values = values[~np.isnan(values)]
+            total += float(values.sum())
+            count += int(values.size)
+        else:
+            selected = [value for value, match in zip(buffer, mask) if match and value == value]
+            total += math.fsum(selected)
+            count += len(selected)
+    return total, count
+
+
+def conditional_count(cells, criteria):
+    """Cantidad de celdas del rango que cumplen el criterio (COUNTIF)"""
+    criteria = parse_criteria(criteria)
+    count = 0
+    for offset in range(cells.width):
+        mask = criteria_mask(criteria, cells, offset)
+        if np is not None:
+            count += int(np.count_nonzero(mask))
+        else:
+            count += sum(1 for match in mask if match)
+    return count
@@ -0,0 +1,175 @@
+import os
+import threading
+
+from journal import EditJournal, journal_path, read_journal
+from workbook_format import adopt_saved, open_workbook, save_workbook, snapshot_sheet
+
+
+# Documento de una hoja nueva que todavía no se guardó
+UNTITLED = "sin_titulo"
+
+
+def checkpoint_path(document):
+    """Punto de control del documento: el propio libro o, para un CSV, un .csmt al lado"""
+    if document.endswith(".csmt"):
+        return document
+    return document + ".checkpoint.csmt"
+
+
+def current_checkpoint(document):
+    """Ruta del punto de control si sigue vigente (no es más viejo que el documento)"""
+    path = checkpoint_path(document)
+    if not os.path.exists(path):
+        return None
+    if path != document and os.path.exists(document):
+        if os.path.getmtime(path) < os.path.getmtime(document):
+            return None
+    return path
+
+
+def load_recovery(document):
+    """Estado guardado automáticamente de `document`.
+    
+    Devuelve (hoja del punto de control o None, sus fórmulas, registros del diario).
+    """
+    records, _ = read_journal(journal_path(document))
+    path = current_checkpoint(document)
+    if path is None:
+        return None, [], records
+    sheet, formulas = open_workbook(path)
+    return sheet, formulas, records
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def discard_recovery(document):
+    """Borra el diario y el punto de control de `document` (nunca el libro mismo)"""
+    remove_quietly(journal_path(document))
+    if checkpoint_path(document) != document:
+        remove_quietly(checkpoint_path(document))
+
+
+class Autosave:
+    """Diario de ediciones y puntos de control del documento abierto.
+    
+    Cada edición se agrega al diario `<documento>.journal`; cuando crece se
+    vuelca a un punto de control (el propio libro .csmt, o un .csmt junto al
+    CSV) copiando la hoja con el candado y escribiendo sin él, así el
+    autoguardado cuesta O(ediciones).
+    
+    Salvo `checkpoint`, los métodos se llaman con el candado de la hoja tomado.
+    """
+    
+    def __init__(self, lock, checkpoint_size=4 * 1024 * 1024):
+        self.lock = lock
+        # Serializa puntos de control y guardados: ambos recortan el diario,
+        # y la marca de uno no vale si el otro lo recorta en el medio
+        self.write_lock = threading.Lock()
+        self.checkpoint_size = checkpoint_size
+        self.document = None
+        self.journal = None
+        self.checkpoint_pending = False
+    
+    def attach(self, document, keep=True):
+        """Empieza a registrar las ediciones de `document`; si `keep` se conservan
+        las que ya tenga su diario (ediciones recuperadas que aún no se guardaron)"""
+        self.detach()
+        self.document = document
+        if not keep:
+            discard_recovery(document)
+        self.journal = EditJournal(journal_path(document), checkpoint_size=self.checkpoint_size)
+    
+    def detach(self):
+        """Deja de registrar (el diario queda en disco)"""
+        if self.journal is not None:
+            self.journal.close()
+        self.document = None
+        self.journal = None
+    
+    def open(self, document, previous):
+        """Registra `document` recién abierto en lugar de `previous`, cuyo
+        trabajo sin guardar se descarta junto con su hoja"""
+        self.attach(document)
+        if previous is not None and previous != document:
+            discard_recovery(previous)
+    
+    def mark(self):
+        """Posición del diario, tomada junto a la copia de la hoja"""
+        return self.journal.size() if self.journal is not None else 0
+    
+    def log(self, row, col, text):
+        """Anota una edición; devuelve True si hay que lanzar un punto de control"""
+        if self.journal is None:
+            return False
+        self.journal.append(row, col, text)
+        return self.request_checkpoint()
+    
+    def log_cells(self, cells):
+        """Anota varias ediciones (fila, col, texto) en una sola escritura"""
+        if self.journal is None:
+            return False
+        self.journal.append_cells(cells)
+        return self.request_checkpoint()
+    
+    def log_clear(self):
+        if self.journal is not None:
+            self.journal.append_clear()
+    
+    def log_sheet(self, sheet):
+        """Anota la hoja entera tras reemplazar su contenido (p. ej. al deshacer
+        una carga); devuelve True si hay que lanzar un punto de control"""
+        if self.journal is None:
+            return False
+        self.journal.append_clear()
+        self.journal.append_cells(sheet.iter_cells())
+        return self.request_checkpoint()
+    
+    def request_checkpoint(self):
+        if self.checkpoint_pending or not self.journal.needs_checkpoint():
+            return False
+        self.checkpoint_pending = True
+        return True
+    
+    def checkpoint(self, engine):
+        """Vuelca la hoja al punto de control y recorta el diario"""
+        try:
+            with self.write_lock:
+                with self.lock:
+                    if self.journal is None:
+                        return
+                    journal, document, sheet = self.journal, self.document, engine.sheet
+                    snapshot, origin = snapshot_sheet(sheet)
+                    formulas = list(engine.formulas)
+                    mark = journal.size()
+                
+                save_workbook(snapshot, checkpoint_path(document), formulas)
+                
+                with self.lock:
+                    # Si mientras tanto se abrió otro documento el resultado no aplica
+                    if self.journal is journal and engine.sheet is sheet:
+                        adopt_saved(sheet, snapshot, origin)
+                        journal.discard_until(mark)
+        finally:
+            self.checkpoint_pending = False
+    
+    def saved(self, document, mark):
+        """La hoja se guardó en `document` con el estado de la marca `mark`"""
+        if self.journal is None:
+            self.attach(document, keep=False)
+        elif document == self.document:
+            self.journal.discard_until(mark)
+            # El CSV guardado es ahora la base; su punto de control ya no sirve
+            if checkpoint_path(document) != document:
+                remove_quietly(checkpoint_path(document))
+        else:
+            # Guardar como: lo editado después de la copia pasa al diario nuevo
+            tail = self.journal.tail(mark)
+            previous = self.document
+            self.attach(document, keep=False)
+            self.journal.reset(tail)
+            discard_recovery(previous)
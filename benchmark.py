@@ -0,0 +1,191 @@
+"""Benchmarks del núcleo sin interfaz (SheetDocument, CSV, rejilla).
+
+Mide, para hojas de 10 mil a 1 millón de celdas generadas siempre igual:
+carga y guardado de CSV, construcción de la rejilla, latencia de editar una
+celda y pico de memoria de la carga. Escribe los resultados en JSON para
+comparar entre versiones:
+    
+    python benchmark.py --cells 10000 100000 1000000 --output benchmark.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from addressing import column_letter
+from csv_io import CsvExport, CsvImport
+from sheet_document import SheetDocument
+from virtual_grid import VirtualGrid
+
+
+NUM_COLS = 10
+SEED = 1234
+
+# Por encima de este tamaño no se construye la rejilla completa (solo la ventana)
+FULL_GRID_LIMIT = 100_000
+
+ACCOUNTS = ["Caja", "Banco Nación", "Proveedores", "Ventas", "Sueldos", "IVA crédito fiscal"]
+
+
+def write_csv(path, num_rows, seed=SEED):
+    """CSV de prueba con el aspecto de un libro diario: número, fecha, cuenta,
+    importes con separadores de miles y texto"""
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([column_letter(col) for col in range(NUM_COLS)])
+        for row in range(num_rows):
+            amount = rng.randint(1, 10_000_000) / 100
+            writer.writerow([
+                str(row + 1),
+                f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+                rng.choice(ACCOUNTS),
+                f"{amount:_.2f}".replace(".", ",").replace("_", "."),
+                "" if rng.random() < 0.5 else f"{amount:.2f}".replace(".", ","),
+                str(rng.randint(0, 1000)),
+                f"Asiento {rng.randint(1, 5000)}",
+                rng.choice(["", "conciliado", "pendiente"]),
+                str(rng.randint(1, 12)),
+                f"{rng.random():.4f}",
+            ])
+
+
+def no_thread(fn, *args):
+    # Los puntos de control corren en el momento: cuentan en el tiempo medido
+    fn(*args)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def load(path):
+    doc = SheetDocument(run_thread=no_thread)
+    seconds, (completed, _) = timed(doc.load_csv, CsvImport(path))
+    assert completed
+    return seconds, doc
+
+
+def build_grid(doc, full):
+    sheet = doc.sheet
+    grid = VirtualGrid(
+        sheet.num_rows,
+        sheet.num_cols,
+        get_value=doc.engine.display,
+        on_focus=None,
+        on_change=None,
+        column_letter=column_letter,
+        visible_rows=sheet.num_rows if full else 20,
+        visible_cols=sheet.num_cols if full else 10,
+    )
+    grid.build()
+    return len(grid.cells)
+
+
+def edit_latency(doc, edits, seed=SEED):
+    """Tiempos de editar celdas de importes con una suma que depende de ellas"""
+    rng = random.Random(seed)
+    num_rows = doc.sheet.num_rows
+    doc.set_cell(num_rows, 5, f"=SUM(F1:F{num_rows})")
+    times = []
+    for _ in range(edits):
+        row = rng.randrange(num_rows)
+        seconds, _ = timed(doc.set_cell, row, 5, str(rng.randint(0, 1000)))
+        times.append(seconds)
+    return times
+
+
+def run_case(directory, cells, repeat=3, edits=200, memory=True):
+    """Mide un tamaño de hoja; devuelve un diccionario con los resultados"""
+    num_rows = max(1, cells // NUM_COLS)
+    source = os.path.join(directory, f"bench_{cells}.csv")
+    target = os.path.join(directory, f"bench_{cells}_out.csv")
+    write_csv(source, num_rows)
+    
+    result = {"cells": num_rows * NUM_COLS, "rows": num_rows, "cols": NUM_COLS}
+    result["load_csv_s"] = min(load(source)[0] for _ in range(repeat))
+    
+    _, doc = load(source)
+    result["save_csv_s"] = min(
+        timed(doc.save_csv, CsvExport(target))[0] for _ in range(repeat)
+    )
+    result["grid_window_s"], result["grid_window_controls"] = timed(build_grid, doc, False)
+    if result["cells"] <= FULL_GRID_LIMIT:
+        result["grid_full_s"], result["grid_full_controls"] = timed(build_grid, doc, True)
+    else:
+        result["grid_full_s"] = result["grid_full_controls"] = None
+    
+    times = sorted(edit_latency(doc, edits))
+    result["edit_median_ms"] = statistics.median(times) * 1000
+    result["edit_p95_ms"] = times[int(len(times) * 0.95) - 1] * 1000
+    
+    if memory:
+        # Pasada aparte: tracemalloc hace más lenta la carga medida arriba
+        del doc
+        tracemalloc.start()
+        load(source)
+        result["load_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+
+def environment():
+    """Datos de la máquina y la versión medida"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "seed": SEED,
+    }
+
+
+def run_benchmarks(sizes, repeat=3, edits=200, memory=True):
+    with tempfile.TemporaryDirectory(prefix="contsmart-bench-") as directory:
+        results = [run_case(directory, cells, repeat, edits, memory) for cells in sizes]
+    return {"environment": environment(), "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la hoja de cálculo")
+    parser.add_argument("--cells", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3, help="se informa el mejor tiempo")
+    parser.add_argument("--edits", type=int, default=200)
+    parser.add_argument("--no-memory", action="store_true", help="omite la pasada de memoria")
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args(argv)
+    
+    report = run_benchmarks(args.cells, args.repeat, args.edits, not args.no_memory)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    
+    for result in report["results"]:
+        print(", ".join(
+            f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in result.items()
+        ))
+    print(f"Resultados en {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
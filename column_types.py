@@ -0,0 +1,258 @@
+import re
+from collections import Counter
+from datetime import date
+
+from array import array
+
+from sheet_model import NAN, format_number, parse_number
+
+
+# Separador decimal de nuestros libros (1.234,56); el otro se prueba igual
+DECIMAL = ","
+
+# Las fechas se guardan como días desde esta fecha (como en las planillas)
+EPOCH = date(1899, 12, 30).toordinal()
+
+CURRENCY = "$€£"
+
+# Proporción mínima de la muestra que debe encajar en el tipo
+MATCH_RATIO = 0.9
+SAMPLE_SIZE = 500
+
+
+class ColumnType:
+    """Base de los tipos: `read` lee el formato propio y `format` lo reproduce"""
+    
+    def parse(self, text):
+        """Como `read`, pero acepta también números simples ("12.5")"""
+        value = self.read(text)
+        return value if value is not None else parse_number(text)
+    
+    def quick(self, text):
+        return self.read(text)
+    
+    def pack(self, values):
+        """Convierte una columna de textos en (array de números, {fila: texto}).
+        
+        El texto se guarda aparte solo si `format` no lo reproduce. `quick` no
+        valida el formato: si el número vuelve a dar el mismo texto es correcto,
+        y si no se usa `parse`. Los textos repetidos se convierten una vez.
+        """
+        numbers = array("d", [NAN]) * len(values)
+        text = {}
+        known = {}
+        for row, value in enumerate(values):
+            if value == "":
+                continue
+            entry = known.get(value)
+            if entry is None:
+                number = self.quick(value)
+                if number is not None and number == number and self.format(number) == value:
+                    entry = (number, True)
+                else:
+                    number = self.parse(value)
+                    entry = (NAN if number is None else number, False)
+                known[value] = entry
+            numbers[row] = entry[0]
+            if not entry[1]:
+                text[row] = value
+        return numbers, text
+
+
+class NumberType(ColumnType):
+    """Entero, decimal o moneda con separadores de un idioma ("-$1.234,56").
+    
+    `decimals` es la cantidad fija de decimales, o None si varía.
+    """
+    
+    def __init__(self, decimal=".", thousands="", decimals=0, prefix="", suffix=""):
+        self.decimal = decimal
+        self.thousands = thousands
+        self.decimals = decimals
+        self.prefix = prefix
+        self.suffix = suffix
+        if prefix or suffix:
+            self.name = "currency"
+        else:
+            self.name = "integer" if decimals == 0 else "decimal"
+        
+        integer = r"\d+"
+        if thousands:
+            integer = rf"\d{{1,3}}(?:{re.escape(thousands)}\d{{3}})+|\d+"
+        self.pattern = re.compile(
+            rf"(-?)((?:[{CURRENCY}]\s?)?)({integer})(?:{re.escape(decimal)}(\d+))?((?:\s?[{CURRENCY}])?)"
+        )
+        # Python agrupa los miles con "_" y luego se ponen los separadores propios
+        self.spec_format = f"{'_' if thousands else ''}.{decimals}f"
+    
+    def read(self, text):
+        """Número del texto si respeta el formato del tipo, si no None"""
+        match = self.pattern.fullmatch(text)
+        if match is None:
+            return None
+        sign, _, integer, fraction, _ = match.groups()
+        if self.thousands:
+            integer = integer.replace(self.thousands, "")
+        value = float(f"{integer}.{fraction}" if fraction else integer)
+        return -value if sign else value
+    
+    def quick(self, text):
+        body = text
+        if self.prefix:
+            body = body.replace(self.prefix, "", 1)
+        if self.suffix and body.endswith(self.suffix):
+            body = body[:-len(self.suffix)]
+        if self.thousands:
+            body = body.replace(self.thousands, "")
+        if self.decimal != ".":
+            body = body.replace(self.decimal, ".")
+        try:
+            return float(body)
+        except ValueError:
+            return None
+    
+    def format(self, number):
+        if self.decimals is None:
+            integer, _, fraction = format_number(abs(number)).partition(".")
+            if self.thousands and integer.isdigit():
+                integer = f"{int(integer):_}"
+            body = f"{integer}.{fraction}" if fraction else integer
+        else:
+            body = format(abs(number), self.spec_format)
+        if self.decimal != ".":
+            body = body.replace(".", self.decimal)
+        if self.thousands:
+            body = body.replace("_", self.thousands)
+        sign = "-" if number < 0 else ""
+        return sign + self.prefix + body + self.suffix
+    
+    def spec(self):
+        return {
+            "name": self.name, "decimal": self.decimal, "thousands": self.thousands,
+            "decimals": self.decimals, "prefix": self.prefix, "suffix": self.suffix,
+        }
+
+
+class DateType(ColumnType):
+    """Fecha dd/mm/aaaa (u otro orden y separador), guardada como número de día"""
+    
+    name = "date"
+    
+    def __init__(self, order="dmy", sep="/"):
+        self.order = order
+        self.sep = sep
+    
+    def read(self, text):
+        parts = text.split(self.sep)
+        if len(parts) != 3 or not all(part.isdigit() for part in parts):
+            return None
+        fields = dict(zip(self.order, map(int, parts)))
+        if fields["y"] < 1000:
+            return None
+        try:
+            day = date(fields["y"], fields["m"], fields["d"])
+        except ValueError:
+            return None
+        return float(day.toordinal() - EPOCH)
+    
+    def format(self, number):
+        if not number.is_integer() or not 0 < number + EPOCH <= date.max.toordinal():
+            return format_number(number)
+        day = date.fromordinal(int(number) + EPOCH)
+        fields = {"d": f"{day.day:02d}", "m": f"{day.month:02d}", "y": f"{day.year:04d}"}
+        return self.sep.join(fields[field] for field in self.order)
+    
+    def spec(self):
+        return {"name": self.name, "order": self.order, "sep": self.sep}
+
+
+def type_from_spec(spec):
+    """Tipo guardado en el índice de un libro (ver `spec`)"""
+    if spec["name"] == "date":
+        return DateType(spec["order"], spec["sep"])
+    return NumberType(
+        spec["decimal"], spec["thousands"], spec["decimals"], spec["prefix"], spec["suffix"]
+    )
+
+
+def sample(values, size=SAMPLE_SIZE):
+    """Hasta `size` valores no vacíos repartidos por toda la columna"""
+    step = max(1, len(values) // (size * 2))
+    return [value for value in values[::step] if value != ""][:size]
+
+
+def number_candidate(values, decimal):
+    """Tipo numérico que mejor describe la muestra con ese separador decimal"""
+    thousands = "." if decimal == "," else ","
+    probe = NumberType(decimal, thousands)
+    decimals = Counter()
+    grouped = False
+    prefixes = Counter()
+    suffixes = Counter()
+    for value in values:
+        match = probe.pattern.fullmatch(value)
+        if match is None:
+            continue
+        _, prefix, integer, fraction, suffix = match.groups()
+        decimals[len(fraction or "")] += 1
+        grouped = grouped or thousands in integer
+        prefixes[prefix] += 1
+        suffixes[suffix] += 1
+    if not decimals:
+        return None
+    # Cantidad fija de decimales solo si casi todos la usan ("1.234,50")
+    fixed, count = decimals.most_common(1)[0]
+    if count < sum(decimals.values()) * MATCH_RATIO:
+        fixed = None
+    return NumberType(
+        decimal, thousands if grouped else "", fixed,
+        prefixes.most_common(1)[0][0], suffixes.most_common(1)[0][0],
+    )
+
+
+def date_candidates(values):
+    first = values[0]
+    for sep in "/-.":
+        parts = first.split(sep)
+        if len(parts) == 3:
+            if len(parts[0]) == 4:
+                return [DateType("ymd", sep)]
+            return [DateType("dmy", sep), DateType("mdy", sep)]
+    return []
+
+
+def infer_type(values, decimal=DECIMAL):
+    """Infiere el tipo de una columna de textos a partir de una muestra.
+    
+    Devuelve un NumberType o DateType, o None si la columna es de texto. Si
+    los dos separadores decimales encajan igual ("1.234") gana `decimal`.
+    """
+    values = sample(values)
+    if not values:
+        return None
+    
+    other = "." if decimal == "," else ","
+    candidates = [number_candidate(values, decimal), number_candidate(values, other)]
+    candidates.extend(date_candidates(values))
+    
+    best, best_matches = None, 0
+    for candidate in candidates:
+        if candidate is None:
+            continue
+        matches = sum(1 for value in values if candidate.read(value) is not None)
+        if matches > best_matches:
+            best, best_matches = candidate, matches
+    if best_matches < len(values) * MATCH_RATIO:
+        return None
+    return best
+
+
+def pack_typed_columns(sheet, decimal=DECIMAL):
+    """Empaqueta como NumericColumn las columnas densas cuyo tipo inferido es
+    numérico o fecha; las celdas que no encajan quedan como texto"""
+    for col, column in enumerate(sheet.columns):
+        if column is None or column.kind != "dense":
+            continue
+        column_type = infer_type(column.values, decimal)
+        if column_type is not None:
+            sheet.make_numeric(col, column_type)
@@ -0,0 +1,160 @@
+import contextlib
+import csv
+import os
+import stat
+import tempfile
+
+import perf
+
+
+class CsvImport:
+    """Importación de un CSV por bloques de filas, con progreso y cancelación.
+    
+    Las filas se leen en streaming y se vuelcan a la hoja bloque a bloque,
+    sin tener el archivo completo en memoria.
+    """
+    
+    def __init__(self, path, chunk_size=2000, encoding="utf-8", skip_header=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.skip_header = skip_header
+        
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.rows_loaded = 0
+        self.cancelled = False
+    
+    @property
+    def progress(self):
+        """Fracción del archivo leída (0.0 a 1.0)"""
+        if not self.total_bytes:
+            return 1.0
+        return min(1.0, self.bytes_read / self.total_bytes)
+    
+    def cancel(self):
+        self.cancelled = True
+    
+    def lines(self, f):
+        # Cuenta lo leído para el progreso (aproximado en caracteres)
+        for line in f:
+            self.bytes_read += len(line)
+            yield line
+    
+    def chunks(self):
+        """Genera listas de hasta `chunk_size` filas"""
+        with open(self.path, "r", newline="", encoding=self.encoding) as f:
+            reader = csv.reader(self.lines(f))
+            if self.skip_header:
+                next(reader, None)
+            
+            chunk = []
+            for row in reader:
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = []
+                    if self.cancelled:
+                        return
+            if chunk:
+                yield chunk
+    
+    @perf.traced("csv.load")
+    def run(self, sheet, on_chunk=None, lock=None):
+        """Carga el archivo al final de `sheet`.
+        
+        Llama a `on_chunk(self)` tras cada bloque. Si se pasa `lock`, cada
+        bloque se escribe con él tomado. Devuelve False si se canceló.
+        """
+        try:
+            for chunk in self.chunks():
+                with perf.span("csv.append_rows"), lock or contextlib.nullcontext():
+                    sheet.append_rows(chunk)
+                self.rows_loaded += len(chunk)
+                if on_chunk is not None:
+                    on_chunk(self)
+                if self.cancelled:
+                    return False
+            return True
+        finally:
+            perf.count("csv.bytes_read", self.bytes_read)
+
+
+class CsvExport:
+    """Exportación de la hoja a CSV por bloques de filas, con escritura atómica.
+    
+    Se escribe en un archivo temporal del mismo directorio que luego reemplaza
+    al destino, así nunca queda un CSV a medio escribir.
+    """
+    
+    def __init__(self, path, chunk_size=2000, encoding="utf-8"):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        
+        self.total_rows = 0
+        self.rows_written = 0
+        self.cancelled = False
+    
+    @property
+    def progress(self):
+        """Fracción de filas escritas (0.0 a 1.0)"""
+        if not self.total_rows:
+            return 1.0
+        return self.rows_written / self.total_rows
+    
+    def cancel(self):
+        self.cancelled = True
+    
+    def chunks(self, sheet):
+        """Genera bloques de filas leyendo cada columna por tramos"""
+        num_cols = sheet.num_cols
+        for start in range(0, sheet.num_rows, self.chunk_size):
+            stop = min(start + self.chunk_size, sheet.num_rows)
+            empty = [""] * (stop - start)
+            
+            # Las columnas vacías comparten la misma lista sin consultar celdas
+            columns = []
+            for col in range(num_cols):
+                column = sheet.column(col)
+                columns.append(column.slice(start, stop) if column is not None else empty)
+            yield zip(*columns) if columns else ([] for _ in empty)
+    
+    @perf.traced("csv.save")
+    def run(self, sheet, headers=None, on_chunk=None):
+        """Escribe `sheet` en el archivo.
+        
+        Llama a `on_chunk(self)` tras cada bloque. Devuelve False si se canceló
+        (el archivo de destino queda como estaba).
+        """
+        self.total_rows = sheet.num_rows
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix=".csv-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", newline="", encoding=self.encoding) as f:
+                writer = csv.writer(f)
+                if headers is not None:
+                    writer.writerow(headers)
+                for rows in self.chunks(sheet):
+                    if self.cancelled:
+                        break
+                    writer.writerows(rows)
+                    self.rows_written = min(self.total_rows, self.rows_written + self.chunk_size)
+                    if on_chunk is not None:
+                        on_chunk(self)
+                f.flush()
+                os.fsync(f.fileno())
+                perf.count("csv.bytes_written", f.tell())
+            
+            if self.cancelled:
+                os.remove(temp_path)
+                return False
+            # mkstemp crea el archivo solo legible por el dueño
+            mode = os.stat(self.path).st_mode if os.path.exists(self.path) else 0o644
+            os.chmod(temp_path, stat.S_IMODE(mode))
+            os.replace(temp_path, self.path)
+            return True
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -1,6 +1,14 @@
 import flet as ft
 from flet import Colors, Border
 
+from addressing import cell_name, column_letter
+import perf
+from perf_overlay import PerfOverlay
+from sheet_document import SheetDocument
+from sheet_tabs import SheetTabs
+from update_scheduler import UpdateScheduler
+from virtual_grid import VirtualGrid
+
 
 class ExcelApp:
     def __init__(self, page: ft.Page):
@@ -8,15 +16,17 @@ class ExcelApp:
         self.page.title = "Excel - ContSmart"
         self.page.padding = 10
         
-        # Configuración inicial de filas y columnas
-        self.num_rows = 20
-        self.num_cols = 10
+        # Documento (hoja, fórmulas, historial) sin diario: esta versión no guarda archivos
+        self.doc = SheetDocument()
+        self.engine = self.doc.engine
         
-        # Almacén de datos
-        self.data = {}
+        # Las teclas se confirman y se muestran por cuadros, en un solo envío
+        self.updates = UpdateScheduler(self.page.update, run_thread=self.page.run_thread)
         
         # Controles
         self.selected_cell = None
+        self.grid = None
+        self.tabs = SheetTabs(self.doc, on_select=self.switch_sheet, on_add=self.add_sheet)
         self.formula_bar = ft.TextField(
             hint_text="Celda seleccionada",
             on_submit=self.update_cell_value,
@@ -24,6 +34,13 @@ class ExcelApp:
             text_size=14,
         )
         
+        # Deshacer/rehacer con el teclado
+        self.page.on_keyboard_event = self.on_keyboard
+        # Al cerrar la ventana se detienen los procesos del recálculo
+        self.page.window.prevent_close = True
+        self.page.window.on_event = self.on_window_event
+        self.perf_overlay = PerfOverlay(self.page)
+        
         self.build_ui()
     
     def build_ui(self):
@@ -68,6 +85,16 @@ class ExcelApp:
                     color=Colors.WHITE,
                 ),
             ),
+            ft.OutlinedButton(
+                "Deshacer",
+                icon=ft.Icons.UNDO,
+                on_click=self.undo,
+            ),
+            ft.OutlinedButton(
+                "Rehacer",
+                icon=ft.Icons.REDO,
+                on_click=self.redo,
+            ),
         ], spacing=10)
         
         # Layout principal
@@ -79,131 +106,182 @@ class ExcelApp:
                 actions,
                 formula_container,
                 table_container,
+                self.tabs.build(),
             ], expand=True, spacing=10)
         )
     
+    @perf.traced("create_table")
     def create_table(self):
-        # Crear encabezados de columnas (A, B, C, ...)
-        headers = [ft.Container(
-            content=ft.Text("", width=40, text_align=ft.TextAlign.CENTER),
-            bgcolor=Colors.GREY_300,
-            border=Border.all(1, Colors.GREY_400),
-        )]
-        
-        for col in range(self.num_cols):
-            col_letter = self.get_column_letter(col)
-            headers.append(
-                ft.Container(
-                    content=ft.Text(
-                        col_letter, 
-                        width=100, 
-                        text_align=ft.TextAlign.CENTER,
-                        weight=ft.FontWeight.BOLD,
-                    ),
-                    bgcolor=Colors.BLUE_GREY_100,
-                    border=Border.all(1, Colors.GREY_400),
-                )
-            )
-        
-        # Crear filas
-        rows = [ft.Row(headers, spacing=0)]
-        
-        for row in range(self.num_rows):
-            row_cells = []
-            
-            # Número de fila
-            row_cells.append(
-                ft.Container(
-                    content=ft.Text(
-                        str(row + 1), 
-                        width=40, 
-                        text_align=ft.TextAlign.CENTER,
-                        weight=ft.FontWeight.BOLD,
-                    ),
-                    bgcolor=Colors.BLUE_GREY_100,
-                    border=Border.all(1, Colors.GREY_400),
-                )
-            )
-            
-            # Celdas de datos
-            for col in range(self.num_cols):
-                cell_id = f"{row}_{col}"
-                cell_value = self.data.get(cell_id, "")
-                
-                cell = ft.TextField(
-                    value=cell_value,
-                    width=100,
-                    height=35,
-                    text_size=12,
-                    border_color=Colors.GREY_400,
-                    focused_border_color=Colors.BLUE_400,
-                    on_focus=lambda e, r=row, c=col: self.on_cell_focus(e, r, c),
-                    on_change=lambda e, r=row, c=col: self.on_cell_change(e, r, c),
-                    dense=True,
-                )
-                
-                row_cells.append(cell)
-            
-            rows.append(ft.Row(row_cells, spacing=0))
-        
-        return ft.Column(rows, spacing=0, scroll=ft.ScrollMode.ALWAYS)
+        """Crea la rejilla virtualizada (solo la ventana visible)"""
+        if self.grid is not None:
+            # Al reconstruir se reutilizan los controles de la rejilla anterior
+            self.grid.num_rows, self.grid.num_cols = self.sheet.num_rows, self.sheet.num_cols
+            return self.grid.build()
+        self.grid = VirtualGrid(
+            self.sheet.num_rows,
+            self.sheet.num_cols,
+            get_value=self.engine.display,
+            on_focus=self.on_cell_focus,
+            on_change=self.on_cell_change,
+            on_blur=self.on_cell_blur,
+            on_submit=self.on_cell_submit,
+            column_letter=column_letter,
+        )
+        return self.grid.build()
     
-    def get_column_letter(self, col_num):
-        """Convierte número de columna a letra (0=A, 1=B, ..., 26=AA)"""
-        letter = ""
-        while col_num >= 0:
-            letter = chr(col_num % 26 + 65) + letter
-            col_num = col_num // 26 - 1
-        return letter
+    @property
+    def sheet(self):
+        return self.doc.sheet
     
     def on_cell_focus(self, e, row, col):
         """Cuando una celda recibe el foco"""
+        # Lo pendiente de la celda anterior se confirma antes de leer esta
+        self.updates.run_calls()
         self.selected_cell = (row, col)
-        cell_id = f"{row}_{col}"
-        cell_value = self.data.get(cell_id, "")
-        col_letter = self.get_column_letter(col)
+        cell_value = self.sheet.get(row, col)
         
-        self.formula_bar.label = f"{col_letter}{row + 1}"
+        self.formula_bar.label = cell_name(row, col)
         self.formula_bar.value = cell_value
-        self.formula_bar.update()
+        
+        # Mientras se edita, la celda muestra la fórmula en lugar del resultado;
+        # el eco de la celda con el foco no espera al siguiente cuadro
+        if e.control.value != cell_value:
+            e.control.value = cell_value
+        self.updates.flush(self.formula_bar, e.control)
+    
+    def on_cell_submit(self, e, row, col):
+        """Enter en la celda confirma el texto escrito"""
+        self.updates.run_calls()
+        if e.control.value != self.sheet.get(row, col):
+            self.commit_cell(row, col, e.control.value)
+        self.updates.flush()
+    
+    def on_cell_blur(self, e, row, col):
+        """Cuando una celda pierde el foco confirma lo escrito y muestra el valor calculado"""
+        self.updates.run_calls()
+        if e.control.value != self.sheet.get(row, col):
+            self.commit_cell(row, col, e.control.value)
+        # Lo que se escriba después en la celda es otra entrada del historial
+        self.doc.history.seal()
+        display_value = self.engine.display(row, col)
+        if e.control.value != display_value:
+            e.control.value = display_value
+            self.updates.update(e.control)
+        self.updates.flush()
     
     def on_cell_change(self, e, row, col):
         """Cuando cambia el valor de una celda"""
-        cell_id = f"{row}_{col}"
-        self.data[cell_id] = e.control.value
+        # Las fórmulas se registran al confirmar (Enter o al salir de la celda):
+        # los borradores "=S", "=SU", ... no se compilan con cada tecla. El
+        # texto se confirma una vez por cuadro: solo cuenta la última tecla
+        if not self.engine.is_formula(e.control.value):
+            self.updates.call((row, col), self.commit_cell, row, col, e.control.value)
         
         # Actualizar la barra de fórmulas si es la celda seleccionada
         if self.selected_cell == (row, col):
             self.formula_bar.value = e.control.value
-            self.formula_bar.update()
+            self.updates.update(self.formula_bar)
+    
+    def commit_cell(self, row, col, text):
+        """Guarda el texto de la celda y refresca sus dependientes (la editada no se toca)"""
+        # Cada tecla confirma la celda: se juntan en una sola entrada del historial
+        changed = self.doc.set_cell(row, col, text, merge=True)
+        changed.discard((row, col))
+        self.grid.patch_cells(changed, send=self.updates.update)
     
     def update_cell_value(self, e):
         """Actualiza el valor de la celda desde la barra de fórmulas"""
+        self.updates.flush()
         if self.selected_cell:
             row, col = self.selected_cell
-            cell_id = f"{row}_{col}"
-            self.data[cell_id] = self.formula_bar.value
+            changed = self.doc.set_cell(row, col, self.formula_bar.value)
             
-            # Actualizar la interfaz
-            self.rebuild_table()
+            # Actualizar solo los controles de la celda y sus dependientes
+            self.grid.patch_cells(changed)
     
     def add_row(self, e):
         """Agrega una nueva fila"""
-        self.num_rows += 1
-        self.rebuild_table()
+        self.sheet.add_rows()
+        self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
     
     def add_column(self, e):
         """Agrega una nueva columna"""
-        self.num_cols += 1
-        self.rebuild_table()
+        self.sheet.add_columns()
+        self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
     
     def clear_all(self, e):
         """Limpia todos los datos"""
-        self.data.clear()
+        self.updates.flush()
+        self.doc.clear()
+        self.formula_bar.value = ""
+        self.formula_bar.label = ""
+        self.formula_bar.update()
+        self.grid.patch_all()
+    
+    def switch_sheet(self, index):
+        """Pasa a otra hoja del libro (las demás no se recargan)"""
+        self.updates.flush()
+        self.doc.switch_sheet(index)
+        self.show_sheet()
+    
+    def add_sheet(self):
+        """Agrega una hoja vacía al libro y pasa a ella"""
+        self.updates.flush()
+        self.doc.add_sheet()
+        self.show_sheet()
+    
+    def show_sheet(self):
+        self.selected_cell = None
         self.formula_bar.value = ""
         self.formula_bar.label = ""
         self.rebuild_table()
     
+    def undo(self, e):
+        """Deshace el último cambio"""
+        self.updates.flush()
+        self.show_history(self.doc.undo())
+    
+    def redo(self, e):
+        """Rehace el último cambio deshecho"""
+        self.updates.flush()
+        self.show_history(self.doc.redo())
+    
+    def show_history(self, result):
+        """Refresca la rejilla tras deshacer o rehacer"""
+        if result is None:
+            return
+        entry, changed = result
+        if (self.grid.num_rows, self.grid.num_cols) != (self.sheet.num_rows, self.sheet.num_cols):
+            self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
+        if changed is None:
+            self.grid.patch_all()
+        else:
+            self.grid.patch_cells(changed)
+        
+        if self.selected_cell:
+            self.formula_bar.value = self.sheet.get(*self.selected_cell)
+            self.formula_bar.update()
+    
+    async def on_window_event(self, e):
+        """Cierra el documento antes de cerrar la ventana"""
+        if e.type == ft.WindowEventType.CLOSE:
+            self.doc.close()
+            await self.page.window.destroy()
+    
+    def on_keyboard(self, e):
+        """Ctrl+Z deshace; Ctrl+Y o Ctrl+Mayús+Z rehace; Ctrl+Mayús+P muestra
+        el panel de rendimiento"""
+        if not (e.ctrl or e.meta):
+            return
+        key = e.key.upper()
+        if key == "P" and e.shift:
+            self.perf_overlay.toggle()
+        elif key == "Z" and not e.shift:
+            self.undo(e)
+        elif key in ("Y", "Z"):
+            self.redo(e)
+    
+    @perf.traced("rebuild_table")
     def rebuild_table(self):
         """Reconstruye toda la tabla"""
         self.page.clean()
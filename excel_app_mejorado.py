@@ -1,7 +1,19 @@
 import flet as ft
 from flet import Colors, Border
-import csv
 import os
+from itertools import islice
+
+from addressing import cell_name, column_letter, parse_area
+from csv_io import CsvExport, CsvImport
+from journal import journal_path
+import perf
+from perf_overlay import PerfOverlay
+from pivot import parse_keys, parse_measures
+from sheet_document import SheetDocument
+from sheet_tabs import SheetTabs
+from update_scheduler import UpdateScheduler
+from virtual_grid import VirtualGrid
+from workbook_format import WorkbookTask
 
 
 class ExcelAppMejorado:
@@ -10,15 +22,17 @@ class ExcelAppMejorado:
         self.page.title = "Excel Pro - ContSmart"
         self.page.padding = 10
         
-        # Configuración inicial de filas y columnas
-        self.num_rows = 20
-        self.num_cols = 10
+        # Documento (hoja, fórmulas, historial, diario): la lógica sin interfaz
+        self.doc = SheetDocument(run_thread=self.page.run_thread, on_error=self.checkpoint_failed)
+        self.engine = self.doc.engine
         
-        # Almacén de datos
-        self.data = {}
+        # Las teclas se confirman y se muestran por cuadros, en un solo envío
+        self.updates = UpdateScheduler(self.page.update, run_thread=self.page.run_thread)
         
         # Controles
         self.selected_cell = None
+        self.grid = None
+        self.tabs = SheetTabs(self.doc, on_select=self.switch_sheet, on_add=self.add_sheet)
         self.formula_bar = ft.TextField(
             hint_text="Celda seleccionada",
             on_submit=self.update_cell_value,
@@ -33,7 +47,66 @@ class ExcelAppMejorado:
             text_size=12,
         )
         
+        # Buscar y reemplazar sobre el índice de palabras del documento;
+        # `search_query` es la búsqueda en curso
+        self.search_query = ""
+        self.find_field = ft.TextField(
+            hint_text="Buscar",
+            width=200,
+            text_size=12,
+            on_change=self.on_find_change,
+            on_submit=self.find_next,
+        )
+        self.replace_field = ft.TextField(
+            hint_text="Reemplazar por",
+            width=200,
+            text_size=12,
+        )
+        self.find_status = ft.Text(size=12, italic=True, color=Colors.GREY_700)
+        
+        # Pegar bloques del portapapeles y rellenar rangos
+        self.clipboard = ft.Clipboard()
+        self.range_field = ft.TextField(
+            hint_text="Rango (A1:C20)",
+            width=160,
+            text_size=12,
+            on_submit=self.fill_series,
+        )
+        
+        # Tabla dinámica: columnas de agrupación y resúmenes
+        self.pivot_keys_field = ft.TextField(
+            hint_text="Agrupar por (A, B)",
+            width=160,
+            text_size=12,
+        )
+        self.pivot_values_field = ft.TextField(
+            hint_text="Resumir (suma C, promedio D)",
+            width=220,
+            text_size=12,
+            on_submit=self.add_pivot,
+        )
+        
+        # Operación de archivo en segundo plano (carga o guardado) en curso
+        self.file_task = None
+        
+        # Deshacer/rehacer con el teclado
+        self.page.on_keyboard_event = self.on_keyboard
+        # Al cerrar la ventana se detienen los procesos del recálculo
+        self.page.window.prevent_close = True
+        self.page.window.on_event = self.on_window_event
+        self.perf_overlay = PerfOverlay(self.page)
+        self.progress_bar = ft.ProgressBar(width=200, value=0, visible=False)
+        self.cancel_button = ft.TextButton(
+            "Cancelar",
+            icon=ft.Icons.CANCEL,
+            on_click=self.cancel_file_task,
+            visible=False,
+        )
+        
+        recovered = self.doc.recover_untitled()
         self.build_ui()
+        if recovered:
+            self.show_message(f"✓ Se recuperaron {recovered} ediciones sin guardar", Colors.GREEN_700)
     
     def build_ui(self):
         # Barra de fórmulas
@@ -77,6 +150,16 @@ class ExcelAppMejorado:
                     color=Colors.WHITE,
                 ),
             ),
+            ft.OutlinedButton(
+                "Deshacer",
+                icon=ft.Icons.UNDO,
+                on_click=self.undo,
+            ),
+            ft.OutlinedButton(
+                "Rehacer",
+                icon=ft.Icons.REDO,
+                on_click=self.redo,
+            ),
         ], spacing=10)
         
         # Botones de archivo
@@ -94,6 +177,67 @@ class ExcelAppMejorado:
                 on_click=self.load_from_csv,
                 style=ft.ButtonStyle(bgcolor=Colors.BLUE_700),
             ),
+            ft.OutlinedButton(
+                "Guardar libro",
+                icon=ft.Icons.SAVE_AS,
+                on_click=self.save_to_workbook,
+            ),
+            ft.OutlinedButton(
+                "Abrir libro",
+                icon=ft.Icons.FOLDER_OPEN,
+                on_click=self.load_from_workbook,
+            ),
+            self.progress_bar,
+            self.cancel_button,
+        ], spacing=10)
+        
+        # Buscar y reemplazar
+        find_actions = ft.Row([
+            self.find_field,
+            ft.OutlinedButton(
+                "Siguiente",
+                icon=ft.Icons.SEARCH,
+                on_click=self.find_next,
+            ),
+            self.replace_field,
+            ft.OutlinedButton(
+                "Reemplazar todo",
+                icon=ft.Icons.FIND_REPLACE,
+                on_click=self.replace_all,
+            ),
+            self.find_status,
+        ], spacing=10)
+        
+        # Pegar y rellenar
+        range_actions = ft.Row([
+            ft.OutlinedButton(
+                "Pegar bloque",
+                icon=ft.Icons.CONTENT_PASTE,
+                on_click=self.paste_block,
+            ),
+            self.range_field,
+            ft.OutlinedButton(
+                "Rellenar abajo",
+                icon=ft.Icons.ARROW_DOWNWARD,
+                on_click=self.fill_down,
+            ),
+            ft.OutlinedButton(
+                "Rellenar derecha",
+                icon=ft.Icons.ARROW_FORWARD,
+                on_click=self.fill_right,
+            ),
+            ft.OutlinedButton(
+                "Serie",
+                icon=ft.Icons.TRENDING_UP,
+                on_click=self.fill_series,
+            ),
+            self.pivot_keys_field,
+            self.pivot_values_field,
+            ft.OutlinedButton(
+                "Tabla dinámica",
+                icon=ft.Icons.TABLE_CHART,
+                on_click=self.add_pivot,
+            ),
         ], spacing=10)
         
         # Layout principal
@@ -104,197 +248,516 @@ class ExcelAppMejorado:
                        weight=ft.FontWeight.BOLD),
                 actions,
                 file_actions,
+                find_actions,
+                range_actions,
                 formula_container,
                 table_container,
+                self.tabs.build(),
             ], expand=True, spacing=10)
         )
     
+    @perf.traced("create_table")
     def create_table(self):
-        # Crear encabezados de columnas (A, B, C, ...)
-        headers = [ft.Container(
-            content=ft.Text("", width=40, text_align=ft.TextAlign.CENTER),
-            bgcolor=Colors.GREY_300,
-            border=Border.all(1, Colors.GREY_400),
-        )]
-        
-        for col in range(self.num_cols):
-            col_letter = self.get_column_letter(col)
-            headers.append(
-                ft.Container(
-                    content=ft.Text(
-                        col_letter, 
-                        width=100, 
-                        text_align=ft.TextAlign.CENTER,
-                        weight=ft.FontWeight.BOLD,
-                    ),
-                    bgcolor=Colors.BLUE_GREY_100,
-                    border=Border.all(1, Colors.GREY_400),
-                )
-            )
-        
-        # Crear filas
-        rows = [ft.Row(headers, spacing=0)]
-        
-        for row in range(self.num_rows):
-            row_cells = []
-            
-            # Número de fila
-            row_cells.append(
-                ft.Container(
-                    content=ft.Text(
-                        str(row + 1), 
-                        width=40, 
-                        text_align=ft.TextAlign.CENTER,
-                        weight=ft.FontWeight.BOLD,
-                    ),
-                    bgcolor=Colors.BLUE_GREY_100,
-                    border=Border.all(1, Colors.GREY_400),
-                )
-            )
-            
-            # Celdas de datos
-            for col in range(self.num_cols):
-                cell_id = f"{row}_{col}"
-                cell_value = self.data.get(cell_id, "")
-                
-                cell = ft.TextField(
-                    value=cell_value,
-                    width=100,
-                    height=35,
-                    text_size=12,
-                    border_color=Colors.GREY_400,
-                    focused_border_color=Colors.BLUE_400,
-                    on_focus=lambda e, r=row, c=col: self.on_cell_focus(e, r, c),
-                    on_change=lambda e, r=row, c=col: self.on_cell_change(e, r, c),
-                    dense=True,
-                )
-                
-                row_cells.append(cell)
-            
-            rows.append(ft.Row(row_cells, spacing=0))
-        
-        return ft.Column(rows, spacing=0, scroll=ft.ScrollMode.ALWAYS)
+        """Crea la rejilla virtualizada (solo la ventana visible)"""
+        if self.grid is not None:
+            # Al reconstruir se reutilizan los controles de la rejilla anterior
+            self.grid.num_rows, self.grid.num_cols = self.sheet.num_rows, self.sheet.num_cols
+            return self.grid.build()
+        self.grid = VirtualGrid(
+            self.sheet.num_rows,
+            self.sheet.num_cols,
+            get_value=self.engine.display,
+            on_focus=self.on_cell_focus,
+            on_change=self.on_cell_change,
+            on_blur=self.on_cell_blur,
+            on_submit=self.on_cell_submit,
+            column_letter=column_letter,
+        )
+        return self.grid.build()
     
-    def get_column_letter(self, col_num):
-        """Convierte número de columna a letra (0=A, 1=B, ..., 26=AA)"""
-        letter = ""
-        while col_num >= 0:
-            letter = chr(col_num % 26 + 65) + letter
-            col_num = col_num // 26 - 1
-        return letter
+    @property
+    def sheet(self):
+        # El documento reemplaza la hoja al cargar o abrir un archivo
+        return self.doc.sheet
     
     def on_cell_focus(self, e, row, col):
         """Cuando una celda recibe el foco"""
+        # Lo pendiente de la celda anterior se confirma antes de leer esta
+        self.updates.run_calls()
         self.selected_cell = (row, col)
-        cell_id = f"{row}_{col}"
-        cell_value = self.data.get(cell_id, "")
-        col_letter = self.get_column_letter(col)
+        cell_value = self.sheet.get(row, col)
         
-        self.formula_bar.label = f"{col_letter}{row + 1}"
+        self.formula_bar.label = cell_name(row, col)
         self.formula_bar.value = cell_value
-        self.formula_bar.update()
+        
+        # Mientras se edita, la celda muestra la fórmula en lugar del resultado;
+        # el eco de la celda con el foco no espera al siguiente cuadro
+        if e.control.value != cell_value:
+            e.control.value = cell_value
+        self.updates.flush(self.formula_bar, e.control)
+    
+    def on_cell_submit(self, e, row, col):
+        """Enter en la celda confirma el texto escrito"""
+        self.updates.run_calls()
+        if e.control.value != self.sheet.get(row, col):
+            self.commit_cell(row, col, e.control.value)
+        self.updates.flush()
+    
+    def on_cell_blur(self, e, row, col):
+        """Cuando una celda pierde el foco confirma lo escrito y muestra el valor calculado"""
+        self.updates.run_calls()
+        if e.control.value != self.sheet.get(row, col):
+            self.commit_cell(row, col, e.control.value)
+        # Lo que se escriba después en la celda es otra entrada del historial
+        self.doc.history.seal()
+        display_value = self.engine.display(row, col)
+        if e.control.value != display_value:
+            e.control.value = display_value
+            self.updates.update(e.control)
+        self.updates.flush()
     
     def on_cell_change(self, e, row, col):
         """Cuando cambia el valor de una celda"""
-        cell_id = f"{row}_{col}"
-        self.data[cell_id] = e.control.value
+        # Las fórmulas se registran al confirmar (Enter o al salir de la celda):
+        # los borradores "=S", "=SU", ... no se compilan con cada tecla. El
+        # texto se confirma una vez por cuadro: solo cuenta la última tecla
+        if not self.engine.is_formula(e.control.value):
+            self.updates.call((row, col), self.commit_cell, row, col, e.control.value)
         
         # Actualizar la barra de fórmulas si es la celda seleccionada
         if self.selected_cell == (row, col):
             self.formula_bar.value = e.control.value
-            self.formula_bar.update()
+            self.updates.update(self.formula_bar)
+    
+    def commit_cell(self, row, col, text):
+        """Guarda el texto de la celda y refresca sus dependientes (la editada no se toca)"""
+        # Cada tecla confirma la celda: se juntan en una sola entrada del historial
+        changed = self.doc.set_cell(row, col, text, merge=True)
+        changed.discard((row, col))
+        self.grid.patch_cells(changed, send=self.updates.update)
     
     def update_cell_value(self, e):
         """Actualiza el valor de la celda desde la barra de fórmulas"""
+        self.updates.flush()
         if self.selected_cell:
             row, col = self.selected_cell
-            cell_id = f"{row}_{col}"
-            self.data[cell_id] = self.formula_bar.value
+            changed = self.doc.set_cell(row, col, self.formula_bar.value)
             
-            # Actualizar la interfaz
-            self.rebuild_table()
+            # Actualizar solo los controles de la celda y sus dependientes
+            self.grid.patch_cells(changed)
     
     def add_row(self, e):
         """Agrega una nueva fila"""
-        self.num_rows += 1
-        self.rebuild_table()
+        self.sheet.add_rows()
+        self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
     
     def add_column(self, e):
         """Agrega una nueva columna"""
-        self.num_cols += 1
-        self.rebuild_table()
+        self.sheet.add_columns()
+        self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
     
     def clear_all(self, e):
         """Limpia todos los datos"""
-        self.data.clear()
+        self.updates.flush()
+        self.doc.clear()
+        self.formula_bar.value = ""
+        self.formula_bar.label = ""
+        self.formula_bar.update()
+        self.grid.patch_all()
+    
+    def switch_sheet(self, index):
+        """Pasa a otra hoja del libro (las demás no se recargan)"""
+        self.change_sheet(self.doc.switch_sheet, index)
+    
+    def add_sheet(self):
+        """Agrega una hoja vacía al libro y pasa a ella"""
+        self.change_sheet(self.doc.add_sheet)
+    
+    def add_pivot(self, e):
+        """Agrega una hoja con la tabla dinámica de la hoja activa y pasa a ella"""
+        try:
+            keys = parse_keys(self.pivot_keys_field.value or "")
+            measures = parse_measures(self.pivot_values_field.value or "")
+        except ValueError as ex:
+            self.show_message(f"✗ {str(ex)}", Colors.RED_700)
+            return
+        self.change_sheet(self.doc.add_pivot, keys, measures)
+    
+    def change_sheet(self, change, *args):
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        self.updates.flush()
+        try:
+            change(*args)
+        except Exception as ex:
+            self.show_message(f"✗ Error al cambiar de hoja: {str(ex)}", Colors.RED_700)
+            return
+        self.selected_cell = None
         self.formula_bar.value = ""
         self.formula_bar.label = ""
         self.rebuild_table()
     
     def save_to_csv(self, e):
-        """Guarda los datos en un archivo CSV"""
+        """Guarda los datos en un archivo CSV (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
         filename = self.file_name.value or "datos.csv"
         if not filename.endswith('.csv'):
             filename += '.csv'
         
+        # Lo que se escribió en el último cuadro entra en el archivo
+        self.updates.flush()
+        self.file_task = CsvExport(filename)
+        self.set_loading(True)
+        self.page.run_thread(self.save_worker, filename)
+    
+    def save_worker(self, filename):
+        """Escribe una instantánea por bloques en un temporal que reemplaza al archivo"""
         try:
-            # Preparar datos para CSV
-            csv_data = []
-            for row in range(self.num_rows):
-                row_data = []
-                for col in range(self.num_cols):
-                    cell_id = f"{row}_{col}"
-                    cell_value = self.data.get(cell_id, "")
-                    row_data.append(cell_value)
-                csv_data.append(row_data)
-            
-            # Escribir CSV
-            with open(filename, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                # Escribir encabezados
-                headers = [self.get_column_letter(col) for col in range(self.num_cols)]
-                writer.writerow(headers)
-                # Escribir datos
-                writer.writerows(csv_data)
-            
-            self.show_message(f"✓ Archivo guardado: {filename}", Colors.GREEN_700)
+            if self.doc.save_csv(self.file_task, on_chunk=self.on_file_progress):
+                self.show_message(f"✓ Archivo guardado: {filename}", Colors.GREEN_700)
+            else:
+                self.show_message("Guardado cancelado: el archivo no se modificó", Colors.ORANGE_700)
         except Exception as ex:
             self.show_message(f"✗ Error al guardar: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
     
     def load_from_csv(self, e):
-        """Carga datos desde un archivo CSV"""
+        """Carga datos desde un archivo CSV (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
         filename = self.file_name.value or "datos.csv"
         if not filename.endswith('.csv'):
             filename += '.csv'
         
+        if not os.path.exists(filename):
+            self.show_message(f"✗ Archivo no encontrado: {filename}", Colors.RED_700)
+            return
+        
+        self.updates.flush()
+        self.file_task = CsvImport(filename)
+        self.set_loading(True)
+        self.page.run_thread(self.load_worker, filename)
+    
+    def load_worker(self, filename):
+        """Lee el CSV por bloques sobre la hoja y muestra la primera pantalla en
+        cuanto llega"""
+        importer = self.file_task
         try:
-            if not os.path.exists(filename):
-                self.show_message(f"✗ Archivo no encontrado: {filename}", Colors.RED_700)
-                return
-            
-            # Leer CSV
-            with open(filename, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            
-            # Limpiar datos actuales
-            self.data.clear()
-            
-            # Cargar datos (omitir encabezados)
-            if len(rows) > 1:
-                data_rows = rows[1:]
-                self.num_rows = len(data_rows)
-                self.num_cols = len(data_rows[0]) if data_rows else 0
-                
-                for row_idx, row_data in enumerate(data_rows):
-                    for col_idx, cell_value in enumerate(row_data):
-                        cell_id = f"{row_idx}_{col_idx}"
-                        self.data[cell_id] = cell_value
+            completed, recovered = self.doc.load_csv(importer, on_chunk=self.on_load_chunk)
             
             self.rebuild_table()
-            self.show_message(f"✓ Archivo cargado: {filename}", Colors.GREEN_700)
+            if not completed:
+                self.show_message(
+                    f"Carga cancelada: {importer.rows_loaded} filas leídas", Colors.ORANGE_700
+                )
+            elif recovered:
+                self.show_message(
+                    f"✓ Archivo cargado: {filename} ({recovered} ediciones recuperadas)",
+                    Colors.GREEN_700,
+                )
+            else:
+                self.show_message(f"✓ Archivo cargado: {filename}", Colors.GREEN_700)
         except Exception as ex:
             self.show_message(f"✗ Error al cargar: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
+    
+    def on_load_chunk(self, importer):
+        """Tras cada bloque: muestra la primera pantalla en cuanto llega y avanza el progreso"""
+        if importer.rows_loaded <= importer.chunk_size:
+            self.rebuild_table()
+        else:
+            self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
+        self.on_file_progress(importer)
+    
+    def on_file_progress(self, task):
+        self.progress_bar.value = task.progress
+        self.progress_bar.update()
+    
+    def set_loading(self, loading):
+        """Muestra u oculta la barra de progreso y el botón de cancelar"""
+        self.progress_bar.value = 0
+        self.progress_bar.visible = loading
+        self.cancel_button.visible = loading
+        self.page.update(self.progress_bar, self.cancel_button)
+    
+    def cancel_file_task(self, e):
+        if self.file_task is not None:
+            self.file_task.cancel()
+    
+    def workbook_path(self):
+        """Ruta del libro nativo (.csmt) con el mismo nombre que el CSV"""
+        filename = self.file_name.value or "datos.csv"
+        if filename.endswith('.csv'):
+            filename = filename[:-4]
+        return filename + '.csmt'
+    
+    def save_to_workbook(self, e):
+        """Guarda el libro en formato nativo (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        filename = self.workbook_path()
+        
+        self.updates.flush()
+        self.file_task = WorkbookTask(filename)
+        self.set_loading(True)
+        self.page.run_thread(self.save_workbook_worker, filename)
+    
+    def save_workbook_worker(self, filename):
+        """Guarda el libro sin bloquear la edición"""
+        try:
+            if self.doc.save_workbook(self.file_task, on_chunk=self.on_file_progress):
+                self.show_message(f"✓ Libro guardado: {filename}", Colors.GREEN_700)
+            else:
+                self.show_message("Guardado cancelado: el archivo no se modificó", Colors.ORANGE_700)
+        except Exception as ex:
+            self.show_message(f"✗ Error al guardar: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
+    
+    def load_from_workbook(self, e):
+        """Abre un libro en formato nativo (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        filename = self.workbook_path()
+        if not os.path.exists(filename) and not os.path.exists(journal_path(filename)):
+            self.show_message(f"✗ Archivo no encontrado: {filename}", Colors.RED_700)
+            return
+        
+        self.updates.flush()
+        self.file_task = WorkbookTask(filename)
+        self.set_loading(True)
+        self.page.run_thread(self.load_workbook_worker, filename)
+    
+    def load_workbook_worker(self, filename):
+        """Abre el libro (solo se leen los bloques que se muestran)"""
+        try:
+            recovered = self.doc.open_workbook(self.file_task)
+            if recovered is None:
+                self.show_message("Apertura cancelada", Colors.ORANGE_700)
+                return
+            self.rebuild_table()
+            if recovered:
+                self.show_message(
+                    f"✓ Libro abierto: {filename} ({recovered} ediciones recuperadas)",
+                    Colors.GREEN_700,
+                )
+            else:
+                self.show_message(f"✓ Libro abierto: {filename}", Colors.GREEN_700)
+        except Exception as ex:
+            self.show_message(f"✗ Error al abrir: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
+    
+    def undo(self, e):
+        """Deshace el último cambio"""
+        self.apply_history(self.doc.undo)
+    
+    def redo(self, e):
+        """Rehace el último cambio deshecho"""
+        self.apply_history(self.doc.redo)
+    
+    def apply_history(self, move):
+        """Deshace o rehace y refresca la rejilla"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        self.updates.flush()
+        result = move()
+        if result is not None:
+            self.show_changes(result[1])
+    
+    def show_changes(self, changed):
+        """Refresca la rejilla tras deshacer, rehacer, pegar o rellenar"""
+        if (self.grid.num_rows, self.grid.num_cols) != (self.sheet.num_rows, self.sheet.num_cols):
+            self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
+        if changed is None:
+            self.grid.patch_all()
+        else:
+            self.grid.patch_cells(changed)
+        
+        if self.selected_cell:
+            self.formula_bar.value = self.sheet.get(*self.selected_cell)
+            self.formula_bar.update()
+    
+    async def paste_block(self, e):
+        """Pega desde la celda seleccionada el bloque del portapapeles (TSV de
+        otra hoja de cálculo o CSV) como un solo cambio"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        if self.selected_cell is None:
+            self.show_message("Selecciona la celda donde pegar", Colors.ORANGE_700)
+            return
+        text = await self.clipboard.get()
+        if not text:
+            return
+        self.updates.flush()
+        self.page.run_thread(self.paste_worker, *self.selected_cell, text)
+    
+    def paste_worker(self, row, col, text):
+        area, changed = self.doc.paste(row, col, text)
+        if area is not None:
+            self.show_changes(changed)
+            self.show_message(f"✓ Pegado en {area}", Colors.GREEN_700)
+    
+    def fill_down(self, e):
+        self.fill_range(self.doc.fill_down)
+    
+    def fill_right(self, e):
+        self.fill_range(self.doc.fill_right)
+    
+    def fill_series(self, e):
+        self.fill_range(self.doc.fill_series)
+    
+    def fill_range(self, fill):
+        """Aplica `fill` (rellenar o serie del documento) al rango escrito"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        try:
+            area = parse_area(self.range_field.value or "")
+        except ValueError as ex:
+            self.show_message(f"✗ {str(ex)}", Colors.RED_700)
+            return
+        self.updates.flush()
+        self.page.run_thread(self.fill_worker, fill, area)
+    
+    def fill_worker(self, fill, area):
+        try:
+            changed = fill(area)
+        except ValueError as ex:
+            self.show_message(f"✗ {str(ex)}", Colors.RED_700)
+            return
+        self.show_changes(changed)
+    
+    async def on_window_event(self, e):
+        """Cierra el documento antes de cerrar la ventana"""
+        if e.type == ft.WindowEventType.CLOSE:
+            self.doc.close()
+            await self.page.window.destroy()
+    
+    def on_keyboard(self, e):
+        """Ctrl+Z deshace; Ctrl+Y o Ctrl+Mayús+Z rehace; Ctrl+Mayús+V pega un
+        bloque; Ctrl+Mayús+P muestra el panel de rendimiento"""
+        if not (e.ctrl or e.meta):
+            return
+        key = e.key.upper()
+        if key == "P" and e.shift:
+            self.perf_overlay.toggle()
+        elif key == "V" and e.shift:
+            self.page.run_task(self.paste_block, e)
+        elif key == "Z" and not e.shift:
+            self.undo(e)
+        elif key in ("Y", "Z"):
+            self.redo(e)
+    
+    def on_find_change(self, e):
+        """Busca mientras se escribe (en segundo plano)"""
+        self.search_query = self.find_field.value or ""
+        self.page.run_thread(self.search_worker, self.search_query)
+    
+    def search_worker(self, query):
+        """Lleva a la primera coincidencia en cuanto aparece y sigue contando las demás"""
+        if not query:
+            self.show_find_status("")
+            return
+        if not self.index_sheet(query):
+            return
+        with self.doc.lock:
+            matches = self.doc.search.find(query)
+            first = next(matches, None)
+        if first is None:
+            self.show_find_status("Sin coincidencias")
+            return
+        # Sin quitarle el foco al campo de búsqueda mientras se escribe
+        self.go_to_cell(*first, focus=False)
+        
+        found = 1
+        while True:
+            if self.search_query != query:
+                return
+            with self.doc.lock:
+                batch = sum(1 for _ in islice(matches, 10000))
+            if not batch:
+                break
+            found += batch
+            self.show_find_status(f"Coincidencias: {found}…")
+        self.show_find_status(f"Coincidencias: {found}")
+    
+    def index_sheet(self, query):
+        """Indexa la hoja si hace falta; devuelve False si mientras tanto cambió la búsqueda"""
+        if self.doc.search.missing_columns():
+            self.show_find_status("Indexando…")
+        return self.doc.index_search(cancelled=lambda: self.search_query != query)
+    
+    def find_next(self, e):
+        """Va a la siguiente coincidencia después de la celda seleccionada"""
+        self.search_query = self.find_field.value or ""
+        self.page.run_thread(self.find_next_worker, self.search_query)
+    
+    def find_next_worker(self, query):
+        if not query or not self.index_sheet(query):
+            return
+        with self.doc.lock:
+            cell = self.doc.search.find_next(query, self.selected_cell)
+        if cell is None:
+            self.show_find_status("Sin coincidencias")
+        else:
+            self.go_to_cell(*cell)
+    
+    def replace_all(self, e):
+        """Reemplaza el texto buscado en todas las celdas como un solo cambio"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        query = self.find_field.value or ""
+        if not query:
+            return
+        self.updates.flush()
+        self.search_query = query
+        self.page.run_thread(self.replace_worker, query, self.replace_field.value or "")
+    
+    def replace_worker(self, query, replacement):
+        if not self.index_sheet(query):
+            return
+        replaced, changed = self.doc.replace_all(query, replacement)
+        
+        # Un solo envío con todas las celdas visibles afectadas
+        self.grid.patch_cells(changed)
+        if self.selected_cell in changed:
+            self.formula_bar.value = self.sheet.get(*self.selected_cell)
+            self.formula_bar.update()
+        self.show_find_status("")
+        self.show_message(f"✓ {replaced} celdas reemplazadas", Colors.GREEN_700)
+    
+    def go_to_cell(self, row, col, focus=True):
+        """Selecciona la celda y la muestra en la rejilla"""
+        self.selected_cell = (row, col)
+        self.formula_bar.label = cell_name(row, col)
+        self.formula_bar.value = self.sheet.get(row, col)
+        self.formula_bar.update()
+        if row >= self.grid.num_rows or col >= self.grid.num_cols:
+            self.grid.resize(self.sheet.num_rows, self.sheet.num_cols)
+        self.page.run_task(self.grid.scroll_to, row, col, focus)
+    
+    def show_find_status(self, text):
+        self.find_status.value = text
+        self.find_status.update()
+    
+    def checkpoint_failed(self, ex):
+        self.show_message(f"✗ Error al guardar el punto de control: {str(ex)}", Colors.RED_700)
     
     def show_message(self, message, color):
         """Muestra un mensaje temporal"""
@@ -303,10 +766,9 @@ class ExcelAppMejorado:
             bgcolor=color,
             duration=3000,
         )
-        self.page.overlay.append(snack)
-        snack.open = True
-        self.page.update()
+        self.page.show_dialog(snack)
     
+    @perf.traced("rebuild_table")
     def rebuild_table(self):
         """Reconstruye toda la tabla"""
         self.page.clean()
@@ -1,8 +1,23 @@
 import flet as ft
 from flet import Colors, Border
-import csv
 import os
 
+from addressing import cell_name, column_letter
+from csv_io import CsvExport, CsvImport
+from journal import journal_path
+import perf
+from perf_overlay import PerfOverlay
+from sheet_document import SheetDocument
+from sheet_tabs import SheetTabs
+from sheet_view import SheetView, parse_filters
+from table_pager import TablePager
+from workbook_format import WorkbookTask
+
+
+# Filas por página (0: todas en una sola tabla, sin paginar)
+PAGE_SIZE = 100
+PAGE_SIZES = [50, 100, 500, 1000, 0]
+
 
 class ExcelDataTable:
     def __init__(self, page: ft.Page):
@@ -10,17 +25,58 @@ class ExcelDataTable:
         self.page.title = "Excel DataTable - ContSmart"
         self.page.padding = 20
         
-        # Configuración inicial
-        self.num_rows = 20
-        self.num_cols = 10
+        # Documento (hoja, fórmulas, historial, diario): la lógica sin interfaz
+        self.doc = SheetDocument(run_thread=self.page.run_thread, on_error=self.checkpoint_failed)
+        self.engine = self.doc.engine
         
-        # Almacén de datos
-        self.data = {}
+        # Orden y filtros: la tabla muestra las filas en el orden de la vista,
+        # que se reinicia cuando el documento cambia toda la hoja
+        self.view = SheetView(self.engine)
+        self.doc.on_reset = self.view.reset
+        self.filter_field = ft.TextField(
+            hint_text="Filtro: B>100; C=caja*",
+            width=220,
+            text_size=12,
+            on_submit=self.apply_filters,
+        )
         
         # Cell editing
         self.edit_dialog = None
         self.editing_cell = None
         
+        # Controles de la tabla: (fila, col) -> ft.Text, y filas libres para
+        # reutilizar al reconstruir, ordenar o filtrar
+        self.datatable = None
+        self.info = None
+        self.cell_texts = {}
+        self.free_rows = []
+        # Filas de la hoja que muestra la tabla, en orden
+        self.shown_rows = []
+        
+        # Paginación: Flutter no virtualiza el DataTable, así que solo se
+        # construyen las filas de la página actual; las vecinas se precargan
+        self.pager = TablePager(self.view, self.row_texts, self.doc.lock, PAGE_SIZE, run_thread=self.page.run_thread)
+        self.page_label = ft.Text(size=12)
+        self.page_field = ft.TextField(
+            hint_text="Ir a",
+            width=70,
+            text_size=12,
+            on_submit=self.jump_to_page,
+        )
+        self.page_size_field = ft.Dropdown(
+            value=str(PAGE_SIZE),
+            options=[
+                ft.DropdownOption(key=str(size), text=str(size) if size else "Todas")
+                for size in PAGE_SIZES
+            ],
+            width=110,
+            text_size=12,
+            label="Filas por página",
+            on_select=self.change_page_size,
+        )
+        self.pager_bar = None
+        self.tabs = SheetTabs(self.doc, on_select=self.switch_sheet, on_add=self.add_sheet)
+        
         # Nombre de archivo
         self.file_name = ft.TextField(
             hint_text="nombre_archivo.csv",
@@ -29,61 +85,52 @@ class ExcelDataTable:
             value="datos.csv",
         )
         
+        # Operación de archivo en segundo plano (carga o guardado) en curso
+        self.file_task = None
+        
+        # Deshacer/rehacer con el teclado
+        self.page.on_keyboard_event = self.on_keyboard
+        # Al cerrar la ventana se detienen los procesos del recálculo
+        self.page.window.prevent_close = True
+        self.page.window.on_event = self.on_window_event
+        self.perf_overlay = PerfOverlay(self.page)
+        self.progress_bar = ft.ProgressBar(width=200, value=0, visible=False)
+        self.cancel_button = ft.TextButton(
+            "Cancelar",
+            icon=ft.Icons.CANCEL,
+            on_click=self.cancel_file_task,
+            visible=False,
+        )
+        
+        recovered = self.doc.recover_untitled()
         self.build_ui()
+        if recovered:
+            self.show_message(f"✓ Se recuperaron {recovered} ediciones sin guardar", Colors.GREEN_700)
     
-    def get_column_letter(self, col_num):
-        """Convierte número de columna a letra"""
-        letter = ""
-        while col_num >= 0:
-            letter = chr(col_num % 26 + 65) + letter
-            col_num = col_num // 26 - 1
-        return letter
+    @property
+    def sheet(self):
+        # El documento reemplaza la hoja al cargar o abrir un archivo
+        return self.doc.sheet
     
+    @perf.traced("create_datatable")
     def create_datatable(self):
         """Crea el DataTable"""
         # Crear columnas
         columns = []
         columns.append(ft.DataColumn(ft.Text("#", weight=ft.FontWeight.BOLD)))
         
-        for col in range(self.num_cols):
-            col_letter = self.get_column_letter(col)
-            columns.append(
-                ft.DataColumn(
-                    ft.Text(col_letter, weight=ft.FontWeight.BOLD),
-                    numeric=False,
-                )
-            )
+        for col in range(self.sheet.num_cols):
+            columns.append(self.create_datacolumn(col))
         
-        # Crear filas
-        rows = []
-        for row_idx in range(self.num_rows):
-            cells = []
-            
-            # Número de fila
-            cells.append(
-                ft.DataCell(
-                    ft.Text(str(row_idx + 1), weight=ft.FontWeight.BOLD)
-                )
-            )
-            
-            # Celdas de datos
-            for col_idx in range(self.num_cols):
-                cell_id = f"{row_idx}_{col_idx}"
-                cell_value = self.data.get(cell_id, "")
-                
-                cells.append(
-                    ft.DataCell(
-                        ft.Text(cell_value if cell_value else ""),
-                        on_tap=lambda e, r=row_idx, c=col_idx: self.edit_cell(r, c),
-                    )
-                )
-            
-            rows.append(ft.DataRow(cells=cells))
+        # Filas de la página en el orden de la vista, reutilizando las de la tabla anterior
+        rows = self.bind_rows(self.pager.rows())
         
         # Crear DataTable
-        datatable = ft.DataTable(
+        self.datatable = ft.DataTable(
             columns=columns,
             rows=rows,
+            sort_column_index=self.sort_column_index(),
+            sort_ascending=not self.view.descending,
             border=Border.all(1, Colors.GREY_400),
             border_radius=10,
             vertical_lines=ft.BorderSide(1, Colors.GREY_300),
@@ -95,25 +142,152 @@ class ExcelDataTable:
             column_spacing=10,
         )
         
-        return datatable
+        return self.datatable
+    
+    def create_datacolumn(self, col):
+        """Crea el encabezado de una columna"""
+        return ft.DataColumn(
+            ft.Text(column_letter(col), weight=ft.FontWeight.BOLD),
+            numeric=False,
+            on_sort=lambda e: self.sort_column(e.column_index - 1, e.ascending),
+        )
+    
+    def sort_column_index(self):
+        """Índice de la columna ordenada en la tabla (la primera es el número de fila)"""
+        return None if self.view.sort_col is None else self.view.sort_col + 1
+    
+    def bind_rows(self, order, texts=None):
+        """Filas del DataTable para las filas de la hoja en `order` (con sus
+        textos ya leídos en `texts`, si los hay).
+        
+        Se reutilizan primero las filas de la tabla (en su misma posición solo
+        cambian los textos), después las libres, y solo faltando se crean.
+        """
+        self.pager.drop()
+        self.shown_rows = order
+        if self.datatable is not None and self.datatable.rows:
+            self.free_rows.extend(reversed(self.datatable.rows[len(order):]))
+            reused = self.datatable.rows[:len(order)]
+        else:
+            reused = []
+        self.cell_texts = {}
+        rows = []
+        for position, row_idx in enumerate(order):
+            if position < len(reused):
+                datarow = reused[position]
+                perf.count("controls.recycled")
+            elif self.free_rows:
+                datarow = self.free_rows.pop()
+                perf.count("controls.recycled")
+            else:
+                datarow = self.create_datarow()
+            self.bind_datarow(datarow, row_idx, None if texts is None else texts[position])
+            rows.append(datarow)
+        return rows
+    
+    def create_datarow(self):
+        """Crea una fila del DataTable (vacía: la llena `bind_datarow`)"""
+        number = ft.DataCell(ft.Text(weight=ft.FontWeight.BOLD))
+        perf.count("controls.created", 3)
+        return ft.DataRow(cells=[number])
+    
+    def bind_datarow(self, datarow, row_idx, texts=None):
+        """Asocia la fila a la fila `row_idx` de la hoja, con una celda por columna"""
+        datarow.cells[0].content.value = str(row_idx + 1)
+        del datarow.cells[self.sheet.num_cols + 1:]
+        while len(datarow.cells) <= self.sheet.num_cols:
+            datarow.cells.append(self.create_datacell())
+        for col_idx in range(self.sheet.num_cols):
+            text = None if texts is None or col_idx >= len(texts) else texts[col_idx]
+            self.bind_datacell(datarow.cells[col_idx + 1], row_idx, col_idx, text)
+    
+    def create_datacell(self):
+        """Crea una celda de datos; el clic lee sus coordenadas de `data`"""
+        perf.count("controls.created", 2)
+        return ft.DataCell(ft.Text(), on_tap=self.on_cell_tap)
+    
+    def bind_datacell(self, cell, row_idx, col_idx, text=None):
+        """Asocia la celda a (fila, col) y la registra en el mapa"""
+        cell.data = (row_idx, col_idx)
+        cell.content.value = self.engine.display(row_idx, col_idx) if text is None else text
+        self.cell_texts[(row_idx, col_idx)] = cell.content
+    
+    def on_cell_tap(self, e):
+        self.edit_cell(*e.control.data)
+    
+    def update_info(self):
+        """Actualiza el texto con el tamaño de la hoja y el de la página"""
+        total = len(self.view.rows()) if self.view.active else self.sheet.num_rows
+        shown = len(self.datatable.rows)
+        if self.pager.page_size and shown:
+            start = self.pager.start
+            rows = f"Filas {start + 1}-{start + shown} de {total}"
+        else:
+            rows = f"Filas: {total}"
+        if total != self.sheet.num_rows:
+            rows += f" (de {self.sheet.num_rows} en la hoja)"
+        self.info.value = (
+            f"📝 Haz clic en cualquier celda para editarla | {rows} | Columnas: {self.sheet.num_cols}"
+        )
+        self.page_label.value = f"Página {self.pager.index + 1} de {self.pager.count(total)}"
+    
+    def row_texts(self, row):
+        """Textos de una fila de la hoja, para las páginas de `pager`"""
+        return [self.engine.display(row, col) for col in range(self.sheet.num_cols)]
+    
+    def go_to_page(self, index):
+        """Muestra la página `index` (desde 0); si se precargó no se lee la hoja"""
+        self.datatable.rows = self.bind_rows(*self.pager.go_to(index))
+        self.update_info()
+        self.page.update(self.datatable, self.info, self.page_label)
+        self.pager.prefetch()
+    
+    def first_page(self, e):
+        self.go_to_page(0)
+    
+    def previous_page(self, e):
+        self.go_to_page(self.pager.index - 1)
+    
+    def next_page(self, e):
+        self.go_to_page(self.pager.index + 1)
+    
+    def last_page(self, e):
+        self.go_to_page(self.pager.last())
+    
+    def jump_to_page(self, e):
+        """Va a la página escrita en el campo de salto"""
+        try:
+            index = int(self.page_field.value) - 1
+        except (TypeError, ValueError):
+            self.show_message("✗ Número de página no válido", Colors.RED_700)
+            return
+        self.page_field.value = ""
+        self.page_field.update()
+        self.go_to_page(index)
+    
+    def change_page_size(self, e):
+        """Cambia las filas por página, manteniendo a la vista la primera fila mostrada"""
+        self.pager.resize(int(self.page_size_field.value))
+        self.pager_bar.visible = bool(self.pager.page_size)
+        self.refresh_rows()
+        self.pager_bar.update()
     
     def edit_cell(self, row, col):
         """Abre un diálogo para editar la celda"""
-        cell_id = f"{row}_{col}"
-        current_value = self.data.get(cell_id, "")
-        col_letter = self.get_column_letter(col)
+        current_value = self.sheet.get(row, col)
+        name = cell_name(row, col)
         
         # Campo de texto para editar
         edit_field = ft.TextField(
             value=current_value,
-            label=f"Celda {col_letter}{row + 1}",
+            label=f"Celda {name}",
             autofocus=True,
             on_submit=lambda e: self.save_cell(row, col, edit_field.value),
         )
         
         # Crear diálogo
         self.edit_dialog = ft.AlertDialog(
-            title=ft.Text(f"Editar {col_letter}{row + 1}"),
+            title=ft.Text(f"Editar {name}"),
             content=edit_field,
             actions=[
                 ft.TextButton("Cancelar", on_click=self.close_dialog),
@@ -125,106 +299,370 @@ class ExcelDataTable:
             actions_alignment=ft.MainAxisAlignment.END,
         )
         
-        self.page.overlay.append(self.edit_dialog)
-        self.edit_dialog.open = True
-        self.page.update()
+        self.page.show_dialog(self.edit_dialog)
     
     def save_cell(self, row, col, value):
         """Guarda el valor de la celda"""
-        cell_id = f"{row}_{col}"
-        self.data[cell_id] = value
+        changed = self.doc.set_cell(row, col, value)
+        with self.doc.lock:
+            moved = self.view.cells_changed(changed)
+        
         self.close_dialog()
-        self.rebuild_table()
+        if moved:
+            self.refresh_rows()
+        else:
+            self.patch_texts(changed)
+    
+    def patch_texts(self, cells):
+        """Actualiza solo los textos de las celdas indicadas"""
+        texts = []
+        for cell in cells:
+            text = self.cell_texts.get(cell)
+            if text is not None:
+                text.value = self.engine.display(*cell)
+                texts.append(text)
+        perf.count("cells.touched", len(texts))
+        self.pager.drop()
+        self.page.update(*texts)
+        self.pager.prefetch()
+    
+    @perf.traced("refresh_rows")
+    def refresh_rows(self):
+        """Vuelve a crear las filas de la página en el orden de la vista"""
+        self.datatable.rows = self.bind_rows(self.pager.rows())
+        self.datatable.sort_column_index = self.sort_column_index()
+        self.datatable.sort_ascending = not self.view.descending
+        self.update_info()
+        self.page.update(self.datatable, self.info, self.page_label)
+        self.pager.prefetch()
+    
+    def sort_column(self, col, ascending):
+        """Ordena la tabla por una columna (clic en el encabezado)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        with self.doc.lock:
+            self.view.sort_by(col, not ascending)
+            self.view.rows()
+        self.pager.index = 0
+        self.refresh_rows()
+    
+    def apply_filters(self, e):
+        """Aplica los filtros escritos ("B>100; C=caja*"), como los criterios de SUMAR.SI"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        try:
+            filters = parse_filters(self.filter_field.value or "")
+        except ValueError as ex:
+            self.show_message(f"✗ {str(ex)}", Colors.RED_700)
+            return
+        with self.doc.lock:
+            for col in list(self.view.filters):
+                if col not in filters:
+                    self.view.set_filter(col, "")
+            for col, criteria in filters.items():
+                current = self.view.filters.get(col)
+                if current is None or current.criteria != criteria:
+                    self.view.set_filter(col, criteria)
+            self.view.rows()
+        self.pager.index = 0
+        self.refresh_rows()
+    
+    def clear_view(self, e):
+        """Vuelve al orden de la hoja, sin filtros"""
+        with self.doc.lock:
+            self.view.clear()
+        self.filter_field.value = ""
+        self.filter_field.update()
+        self.pager.index = 0
+        self.refresh_rows()
     
     def close_dialog(self, e=None):
         """Cierra el diálogo de edición"""
         if self.edit_dialog:
             self.edit_dialog.open = False
-            self.page.update()
+            self.edit_dialog.update()
     
     def add_row(self, e):
         """Agrega una nueva fila"""
-        self.num_rows += 1
-        self.rebuild_table()
-        self.show_message(f"✓ Fila {self.num_rows} agregada", Colors.GREEN_700)
+        self.sheet.add_rows()
+        if self.view.active or self.pager.page_size:
+            # La fila vacía puede cumplir o no los filtros, y caer o no en la página
+            self.refresh_rows()
+        else:
+            datarow = self.free_rows.pop() if self.free_rows else self.create_datarow()
+            self.bind_datarow(datarow, self.sheet.num_rows - 1)
+            self.datatable.rows.append(datarow)
+            self.shown_rows = self.view.rows()
+            self.update_info()
+            self.page.update(self.datatable, self.info)
+        self.show_message(f"✓ Fila {self.sheet.num_rows} agregada", Colors.GREEN_700)
     
     def add_column(self, e):
         """Agrega una nueva columna"""
-        self.num_cols += 1
-        col_letter = self.get_column_letter(self.num_cols - 1)
-        self.rebuild_table()
+        self.sheet.add_columns()
+        col = self.sheet.num_cols - 1
+        col_letter = column_letter(col)
+        
+        # Agregar el encabezado y una celda nueva por fila
+        self.datatable.columns.append(self.create_datacolumn(col))
+        for row_idx, datarow in zip(self.shown_rows, self.datatable.rows):
+            cell = self.create_datacell()
+            self.bind_datacell(cell, row_idx, col)
+            datarow.cells.append(cell)
+        self.pager.drop()
+        self.update_info()
+        self.page.update(self.datatable, self.info)
         self.show_message(f"✓ Columna {col_letter} agregada", Colors.GREEN_700)
     
     def clear_all(self, e):
         """Limpia todos los datos"""
-        self.data.clear()
-        self.rebuild_table()
+        self.doc.clear()
+        if self.view.active:
+            self.refresh_rows()
+        else:
+            for text in self.cell_texts.values():
+                text.value = ""
+            self.pager.drop()
+            self.datatable.update()
         self.show_message("✓ Todos los datos han sido limpiados", Colors.ORANGE_700)
     
+    def switch_sheet(self, index):
+        """Pasa a otra hoja del libro (las demás no se recargan)"""
+        self.change_sheet(self.doc.switch_sheet, index)
+    
+    def add_sheet(self):
+        """Agrega una hoja vacía al libro y pasa a ella"""
+        self.change_sheet(self.doc.add_sheet)
+    
+    def change_sheet(self, change, *args):
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        try:
+            change(*args)
+        except Exception as ex:
+            self.show_message(f"✗ Error al cambiar de hoja: {str(ex)}", Colors.RED_700)
+            return
+        # El documento ya reinició orden y filtros de la vista
+        self.pager.index = 0
+        self.rebuild_table()
+    
     def save_to_csv(self, e):
-        """Guarda los datos en un archivo CSV"""
+        """Guarda los datos en un archivo CSV (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
         filename = self.file_name.value or "datos.csv"
         if not filename.endswith('.csv'):
             filename += '.csv'
         
+        self.file_task = CsvExport(filename)
+        self.set_loading(True)
+        self.page.run_thread(self.save_worker, filename)
+    
+    def save_worker(self, filename):
+        """Escribe una instantánea por bloques en un temporal que reemplaza al archivo"""
         try:
-            # Preparar datos para CSV
-            csv_data = []
-            for row in range(self.num_rows):
-                row_data = []
-                for col in range(self.num_cols):
-                    cell_id = f"{row}_{col}"
-                    cell_value = self.data.get(cell_id, "")
-                    row_data.append(cell_value)
-                csv_data.append(row_data)
-            
-            # Escribir CSV
-            with open(filename, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                # Escribir encabezados
-                headers = [self.get_column_letter(col) for col in range(self.num_cols)]
-                writer.writerow(headers)
-                # Escribir datos
-                writer.writerows(csv_data)
-            
-            self.show_message(f"✓ Archivo guardado: {filename}", Colors.GREEN_700)
+            if self.doc.save_csv(self.file_task, on_chunk=self.on_file_progress):
+                self.show_message(f"✓ Archivo guardado: {filename}", Colors.GREEN_700)
+            else:
+                self.show_message("Guardado cancelado: el archivo no se modificó", Colors.ORANGE_700)
         except Exception as ex:
             self.show_message(f"✗ Error al guardar: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
     
     def load_from_csv(self, e):
-        """Carga datos desde un archivo CSV"""
+        """Carga datos desde un archivo CSV (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
         filename = self.file_name.value or "datos.csv"
         if not filename.endswith('.csv'):
             filename += '.csv'
         
+        if not os.path.exists(filename):
+            self.show_message(f"✗ Archivo no encontrado: {filename}", Colors.RED_700)
+            return
+        
+        self.file_task = CsvImport(filename)
+        self.pager.index = 0
+        self.set_loading(True)
+        self.page.run_thread(self.load_worker, filename)
+    
+    def load_worker(self, filename):
+        """Lee el CSV por bloques sobre la hoja y muestra la primera pantalla en
+        cuanto llega"""
+        importer = self.file_task
         try:
-            if not os.path.exists(filename):
-                self.show_message(f"✗ Archivo no encontrado: {filename}", Colors.RED_700)
-                return
-            
-            # Leer CSV
-            with open(filename, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            
-            # Limpiar datos actuales
-            self.data.clear()
-            
-            # Cargar datos (omitir encabezados)
-            if len(rows) > 1:
-                data_rows = rows[1:]
-                self.num_rows = len(data_rows)
-                self.num_cols = len(data_rows[0]) if data_rows else 0
-                
-                for row_idx, row_data in enumerate(data_rows):
-                    for col_idx, cell_value in enumerate(row_data):
-                        cell_id = f"{row_idx}_{col_idx}"
-                        self.data[cell_id] = cell_value
+            completed, recovered = self.doc.load_csv(importer, on_chunk=self.on_load_chunk)
             
             self.rebuild_table()
-            self.show_message(f"✓ Archivo cargado: {filename}", Colors.GREEN_700)
+            if not completed:
+                self.show_message(
+                    f"Carga cancelada: {importer.rows_loaded} filas leídas", Colors.ORANGE_700
+                )
+            elif recovered:
+                self.show_message(
+                    f"✓ Archivo cargado: {filename} ({recovered} ediciones recuperadas)",
+                    Colors.GREEN_700,
+                )
+            else:
+                self.show_message(f"✓ Archivo cargado: {filename}", Colors.GREEN_700)
         except Exception as ex:
             self.show_message(f"✗ Error al cargar: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
+    
+    def on_load_chunk(self, importer):
+        """Tras cada bloque: muestra la primera pantalla en cuanto llega y avanza el progreso"""
+        if importer.rows_loaded <= importer.chunk_size:
+            self.rebuild_table()
+        else:
+            self.update_info()
+            self.info.update()
+        self.on_file_progress(importer)
+    
+    def on_file_progress(self, task):
+        self.progress_bar.value = task.progress
+        self.progress_bar.update()
+    
+    def set_loading(self, loading):
+        """Muestra u oculta la barra de progreso y el botón de cancelar"""
+        self.progress_bar.value = 0
+        self.progress_bar.visible = loading
+        self.cancel_button.visible = loading
+        self.page.update(self.progress_bar, self.cancel_button)
+    
+    def cancel_file_task(self, e):
+        if self.file_task is not None:
+            self.file_task.cancel()
+    
+    def workbook_path(self):
+        """Ruta del libro nativo (.csmt) con el mismo nombre que el CSV"""
+        filename = self.file_name.value or "datos.csv"
+        if filename.endswith('.csv'):
+            filename = filename[:-4]
+        return filename + '.csmt'
+    
+    def save_to_workbook(self, e):
+        """Guarda el libro en formato nativo (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        filename = self.workbook_path()
+        
+        self.file_task = WorkbookTask(filename)
+        self.set_loading(True)
+        self.page.run_thread(self.save_workbook_worker, filename)
+    
+    def save_workbook_worker(self, filename):
+        """Guarda el libro sin bloquear la edición"""
+        try:
+            if self.doc.save_workbook(self.file_task, on_chunk=self.on_file_progress):
+                self.show_message(f"✓ Libro guardado: {filename}", Colors.GREEN_700)
+            else:
+                self.show_message("Guardado cancelado: el archivo no se modificó", Colors.ORANGE_700)
+        except Exception as ex:
+            self.show_message(f"✗ Error al guardar: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
+    
+    def load_from_workbook(self, e):
+        """Abre un libro en formato nativo (en segundo plano)"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        filename = self.workbook_path()
+        if not os.path.exists(filename) and not os.path.exists(journal_path(filename)):
+            self.show_message(f"✗ Archivo no encontrado: {filename}", Colors.RED_700)
+            return
+        
+        self.file_task = WorkbookTask(filename)
+        self.pager.index = 0
+        self.set_loading(True)
+        self.page.run_thread(self.load_workbook_worker, filename)
+    
+    def load_workbook_worker(self, filename):
+        """Abre el libro (solo se leen los bloques que se muestran)"""
+        try:
+            recovered = self.doc.open_workbook(self.file_task)
+            if recovered is None:
+                self.show_message("Apertura cancelada", Colors.ORANGE_700)
+                return
+            self.rebuild_table()
+            if recovered:
+                self.show_message(
+                    f"✓ Libro abierto: {filename} ({recovered} ediciones recuperadas)",
+                    Colors.GREEN_700,
+                )
+            else:
+                self.show_message(f"✓ Libro abierto: {filename}", Colors.GREEN_700)
+        except Exception as ex:
+            self.show_message(f"✗ Error al abrir: {str(ex)}", Colors.RED_700)
+        finally:
+            self.file_task = None
+            self.set_loading(False)
+    
+    def undo(self, e):
+        """Deshace el último cambio"""
+        self.apply_history(self.doc.undo)
+    
+    def redo(self, e):
+        """Rehace el último cambio deshecho"""
+        self.apply_history(self.doc.redo)
+    
+    def apply_history(self, move):
+        """Deshace o rehace y refresca la tabla"""
+        if self.file_task is not None:
+            self.show_message("Hay una operación de archivo en curso", Colors.ORANGE_700)
+            return
+        result = move()
+        if result is None:
+            return
+        changed = result[1]
+        # Si cambió toda la hoja el documento ya reinició la vista
+        moved = True
+        if changed is not None:
+            with self.doc.lock:
+                moved = self.view.cells_changed(changed)
+        self.show_history(changed, moved)
+    
+    def show_history(self, changed, moved):
+        """Refresca la tabla tras deshacer o rehacer"""
+        if changed is None or len(self.datatable.columns) - 1 != self.sheet.num_cols:
+            self.rebuild_table()
+        elif moved or len(self.datatable.rows) != len(self.view.rows()):
+            self.refresh_rows()
+        else:
+            self.patch_texts(changed)
+    
+    async def on_window_event(self, e):
+        """Cierra el documento antes de cerrar la ventana"""
+        if e.type == ft.WindowEventType.CLOSE:
+            self.doc.close()
+            await self.page.window.destroy()
+    
+    def on_keyboard(self, e):
+        """Ctrl+Z deshace; Ctrl+Y o Ctrl+Mayús+Z rehace; Ctrl+Mayús+P muestra
+        el panel de rendimiento"""
+        if not (e.ctrl or e.meta):
+            return
+        key = e.key.upper()
+        if key == "P" and e.shift:
+            self.perf_overlay.toggle()
+        elif key == "Z" and not e.shift:
+            self.undo(e)
+        elif key in ("Y", "Z"):
+            self.redo(e)
+    
+    def checkpoint_failed(self, ex):
+        self.show_message(f"✗ Error al guardar el punto de control: {str(ex)}", Colors.RED_700)
     
     def show_message(self, message, color):
         """Muestra un mensaje temporal"""
@@ -233,10 +671,9 @@ class ExcelDataTable:
             bgcolor=color,
             duration=2000,
         )
-        self.page.overlay.append(snack)
-        snack.open = True
-        self.page.update()
+        self.page.show_dialog(snack)
     
+    @perf.traced("rebuild_table")
     def rebuild_table(self):
         """Reconstruye toda la tabla"""
         # Limpiar solo el contenido principal, no los overlays
@@ -273,6 +710,31 @@ class ExcelDataTable:
                     color=Colors.WHITE,
                 ),
             ),
+            ft.OutlinedButton(
+                "Deshacer",
+                icon=ft.Icons.UNDO,
+                on_click=self.undo,
+            ),
+            ft.OutlinedButton(
+                "Rehacer",
+                icon=ft.Icons.REDO,
+                on_click=self.redo,
+            ),
+        ], spacing=10)
+        
+        # Orden y filtros
+        view_actions = ft.Row([
+            self.filter_field,
+            ft.OutlinedButton(
+                "Filtrar",
+                icon=ft.Icons.FILTER_ALT,
+                on_click=self.apply_filters,
+            ),
+            ft.OutlinedButton(
+                "Quitar orden y filtros",
+                icon=ft.Icons.FILTER_ALT_OFF,
+                on_click=self.clear_view,
+            ),
         ], spacing=10)
         
         # Botones de archivo
@@ -290,19 +752,38 @@ class ExcelDataTable:
                 on_click=self.load_from_csv,
                 style=ft.ButtonStyle(bgcolor=Colors.BLUE_700),
             ),
+            ft.OutlinedButton(
+                "Guardar libro",
+                icon=ft.Icons.SAVE_AS,
+                on_click=self.save_to_workbook,
+            ),
+            ft.OutlinedButton(
+                "Abrir libro",
+                icon=ft.Icons.FOLDER_OPEN,
+                on_click=self.load_from_workbook,
+            ),
+            self.progress_bar,
+            self.cancel_button,
         ], spacing=10)
         
-        # Información
-        info = ft.Text(
-            f"📝 Haz clic en cualquier celda para editarla | Filas: {self.num_rows} | Columnas: {self.num_cols}",
-            size=12,
-            italic=True,
-            color=Colors.GREY_700,
-        )
-        
         # Crear tabla
         datatable = self.create_datatable()
         
+        # Información
+        self.info = ft.Text(size=12, italic=True, color=Colors.GREY_700)
+        self.update_info()
+        
+        # Páginas
+        self.pager_bar = ft.Row([
+            ft.IconButton(icon=ft.Icons.FIRST_PAGE, tooltip="Primera página", on_click=self.first_page),
+            ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, tooltip="Página anterior", on_click=self.previous_page),
+            self.page_label,
+            ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, tooltip="Página siguiente", on_click=self.next_page),
+            ft.IconButton(icon=ft.Icons.LAST_PAGE, tooltip="Última página", on_click=self.last_page),
+            self.page_field,
+        ], spacing=5, visible=bool(self.pager.page_size))
+        page_actions = ft.Row([self.page_size_field, self.pager_bar], spacing=10)
+        
         # Contenedor con scroll
         table_container = ft.Container(
             content=ft.Column([datatable], scroll=ft.ScrollMode.ALWAYS),
@@ -319,12 +800,16 @@ class ExcelDataTable:
                 ft.Divider(height=1, color=Colors.GREY_300),
                 actions,
                 file_actions,
-                info,
+                view_actions,
+                self.info,
+                page_actions,
                 table_container,
+                self.tabs.build(),
             ], expand=True, spacing=15)
         )
         
         self.page.update()
+        self.pager.prefetch()
 
 
 def main(page: ft.Page):
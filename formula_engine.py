@@ -0,0 +1,1097 @@
+import math
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from addressing import MAX_COLS, MAX_ROWS, REF_RE, column_index, column_letter
+from aggregates import (
+    CellRange,
+    conditional_count,
+    conditional_stats,
+    range_count,
+    range_stats,
+    range_sum,
+)
+import perf
+from sheet_model import format_number, parse_number
+
+
+class FormulaError(Exception):
+    """Error de evaluación; el código (#DIV/0!, #VALUE!, ...) es lo que se muestra"""
+    
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+    
+    def __str__(self):
+        return self.code
+
+
+CYCLE_ERROR = "#CIRC!"
+REF_ERROR = "#REF!"
+
+TOKEN_RE = re.compile(r"""
+    \s*(?:
+      (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<string>"(?:[^"]|"")*")
+    | (?P<range>\$?[A-Za-z]{1,3}\$?\d+:\$?[A-Za-z]{1,3}\$?\d+|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3})(?![\w(.])
+    | (?P<ref>\$?[A-Za-z]{1,3}\$?\d+)(?![\w(.])
+    | (?P<name>[A-Za-z_][\w.]*)
+    | (?P<op><>|<=|>=|[-+*/^&=<>(),;%])
+    )""", re.VERBOSE)
+
+COLUMN_RE = re.compile(r"(\$?)([A-Za-z]{1,3})")
+
+# Especificaciones de fila de una columna completa (A:A): de la primera a la última
+WHOLE_COLUMN_ROWS = ((0, True), (MAX_ROWS - 1, True))
+
+
+def relative_ref(text, row, col):
+    """Convierte una referencia A1 en especificaciones (valor, absoluta) de fila
+    y columna, relativas a la celda (row, col) salvo las marcadas con $"""
+    col_abs, letters, row_abs, digits = REF_RE.fullmatch(text).groups()
+    ref_row, ref_col = int(digits) - 1, column_index(letters)
+    row_spec = (ref_row, True) if row_abs else (ref_row - row, False)
+    col_spec = (ref_col, True) if col_abs else (ref_col - col, False)
+    return row_spec, col_spec
+
+
+def relative_column(text, col):
+    """Especificación (valor, absoluta) de la columna de "A" o "$A", relativa a `col`"""
+    col_abs, letters = COLUMN_RE.fullmatch(text).groups()
+    ref_col = column_index(letters)
+    return (ref_col, True) if col_abs else (ref_col - col, False)
+
+
+# Referencias fuera de los textos entre comillas (los textos se dejan igual):
+# columnas completas (A:B) o celdas (A1)
+KEY_RE = re.compile(
+    r'"(?:[^"]|"")*"'
+    r'|(?<![\w.$])(\$?)([A-Za-z]{1,3}):(\$?)([A-Za-z]{1,3})(?![\w(.])'
+    r'|(?<![\w.$])(\$?)([A-Za-z]{1,3})(\$?)(\d+)(?![\w(.])'
+)
+
+
+def template_key(text, row, col):
+    """Texto normalizado de la fórmula con referencias relativas (estilo R1C1).
+    
+    `=A1*B1` en C1 y `=A2*B2` en C2 dan la misma clave: R[0]C[-2]*R[0]C[-1].
+    """
+    def relative_col(col_abs, letters):
+        ref_col = column_index(letters)
+        return f"C{ref_col + 1}" if col_abs else f"C[{ref_col - col}]"
+    
+    def relative(match):
+        start_abs, start, end_abs, end = match.groups()[:4]
+        if start is not None:
+            return relative_col(start_abs, start) + ":" + relative_col(end_abs, end)
+        col_abs, letters, row_abs, digits = match.groups()[4:]
+        if letters is None:
+            return match.group(0)
+        ref_row = int(digits) - 1
+        row_part = f"R{digits}" if row_abs else f"R[{ref_row - row}]"
+        return row_part + relative_col(col_abs, letters)
+    
+    return KEY_RE.sub(relative, text)
+
+
+def shift_formula(text, rows, cols):
+    """La fórmula copiada `rows` filas y `cols` columnas más allá (rellenar,
+    autorrellenar): se corren las referencias relativas y las que quedan
+    fuera de la hoja pasan a #REF!"""
+    def shift_col(col_abs, letters):
+        if col_abs:
+            return col_abs + letters
+        col = column_index(letters) + cols
+        return column_letter(col) if col >= 0 else None
+    
+    def shift(match):
+        start_abs, start, end_abs, end = match.groups()[:4]
+        if start is not None:
+            first, last = shift_col(start_abs, start), shift_col(end_abs, end)
+            if first is None or last is None:
+                return REF_ERROR
+            return f"{first}:{last}"
+        col_abs, letters, row_abs, digits = match.groups()[4:]
+        if letters is None:
+            return match.group(0)
+        letters = shift_col(col_abs, letters)
+        row = int(digits) + (0 if row_abs else rows)
+        if letters is None or row < 1:
+            return REF_ERROR
+        return f"{letters}{row_abs}{row}"
+    
+    return KEY_RE.sub(shift, text)
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise FormulaError("#ERROR!")
+        pos = match.end()
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+class Parser:
+    """Analizador descendente: convierte los tokens de una fórmula en un árbol
+    (tuplas) cuyas referencias son relativas a la celda (row, col)"""
+    
+    COMPARISON = ("=", "<>", "<", ">", "<=", ">=")
+    
+    def __init__(self, tokens, row, col):
+        self.tokens = tokens
+        self.row = row
+        self.col = col
+        self.pos = 0
+    
+    def parse(self):
+        node = self.comparison()
+        if self.pos != len(self.tokens):
+            raise FormulaError("#ERROR!")
+        return node
+    
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+    
+    def take(self, value=None):
+        kind, text = self.peek()
+        if kind is None or (value is not None and text != value):
+            raise FormulaError("#ERROR!")
+        self.pos += 1
+        return kind, text
+    
+    def binary(self, operators, operand):
+        node = operand()
+        while self.peek()[0] == "op" and self.peek()[1] in operators:
+            op = self.take()[1]
+            node = ("bin", op, node, operand())
+        return node
+    
+    def comparison(self):
+        return self.binary(self.COMPARISON, self.concat)
+    
+    def concat(self):
+        return self.binary(("&",), self.additive)
+    
+    def additive(self):
+        return self.binary(("+", "-"), self.multiplicative)
+    
+    def multiplicative(self):
+        return self.binary(("*", "/"), self.power)
+    
+    def power(self):
+        return self.binary(("^",), self.unary)
+    
+    def unary(self):
+        kind, text = self.peek()
+        if kind == "op" and text in ("-", "+"):
+            self.take()
+            node = self.unary()
+            return ("neg", node) if text == "-" else node
+        return self.postfix()
+    
+    def postfix(self):
+        node = self.primary()
+        while self.peek() == ("op", "%"):
+            self.take()
+            node = ("bin", "/", node, ("num", 100.0))
+        return node
+    
+    def primary(self):
+        kind, text = self.take()
+        if kind == "number":
+            return ("num", float(text))
+        if kind == "string":
+            return ("str", text[1:-1].replace('""', '"'))
+        if kind == "ref":
+            return ("ref",) + relative_ref(text, self.row, self.col)
+        if kind == "range":
+            start, end = text.split(":")
+            if not start[-1].isdigit():
+                first_row, last_row = WHOLE_COLUMN_ROWS
+                return ("range", first_row, relative_column(start, self.col),
+                        last_row, relative_column(end, self.col))
+            return ("range",) + relative_ref(start, self.row, self.col) + relative_ref(end, self.row, self.col)
+        if kind == "name":
+            name = text.upper()
+            if self.peek() == ("op", "("):
+                return self.call(name)
+            if name in BOOLEANS:
+                return ("bool", BOOLEANS[name])
+            raise FormulaError("#NAME?")
+        if (kind, text) == ("op", "("):
+            node = self.comparison()
+            self.take(")")
+            return node
+        raise FormulaError("#ERROR!")
+    
+    def call(self, name):
+        self.take("(")
+        args = []
+        if self.peek() != ("op", ")"):
+            args.append(self.comparison())
+            while self.peek()[0] == "op" and self.peek()[1] in (",", ";"):
+                self.take()
+                args.append(self.comparison())
+        self.take(")")
+        name = FUNCTION_ALIASES.get(name, name)
+        if name not in FUNCTIONS:
+            raise FormulaError("#NAME?")
+        return ("call", name, args)
+
+
+BOOLEANS = {"TRUE": True, "FALSE": False, "VERDADERO": True, "FALSO": False}
+
+
+
+
+# Conversión de valores
+
+def to_number(value):
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, float):
+        return value
+    if value == "":
+        return 0.0
+    number = parse_number(value)
+    if number is None:
+        raise FormulaError("#VALUE!")
+    return number
+
+
+def to_text(value):
+    if isinstance(value, bool):
+        return "VERDADERO" if value else "FALSO"
+    if isinstance(value, float):
+        return format_number(value)
+    return value
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        if value.upper() in BOOLEANS:
+            return BOOLEANS[value.upper()]
+        return to_number(value) != 0
+    return bool(value)
+
+
+def format_value(value):
+    """Texto a mostrar para un valor calculado"""
+    if isinstance(value, FormulaError):
+        return value.code
+    return to_text(value)
+
+
+def sort_key(value):
+    """Clave de orden como en Excel: números antes que textos, sin mayúsculas"""
+    if isinstance(value, str):
+        return (1, value.lower())
+    return (0, float(value))
+
+
+def compare(op, left, right):
+    # Una celda vacía vale 0 frente a un número
+    if left == "" and not isinstance(right, str):
+        left = 0.0
+    if right == "" and not isinstance(left, str):
+        right = 0.0
+    left, right = sort_key(left), sort_key(right)
+    if op == "=":
+        return left == right
+    if op == "<>":
+        return left != right
+    if op == "<":
+        return left < right
+    if op == ">":
+        return left > right
+    if op == "<=":
+        return left <= right
+    return left >= right
+
+
+def arithmetic(op, left, right):
+    left, right = to_number(left), to_number(right)
+    if op == "+":
+        return left + right
+    if op == "-":
+        return left - right
+    if op == "*":
+        return left * right
+    if op == "/":
+        if right == 0:
+            raise FormulaError("#DIV/0!")
+        return left / right
+    try:
+        return float(left ** right)
+    except (OverflowError, ZeroDivisionError, TypeError):
+        raise FormulaError("#NUM!")
+
+
+# Funciones: los rangos llegan como CellRange y se agregan por columnas
+
+def fn_sum(args):
+    total = 0.0
+    for arg in args:
+        total += range_sum(arg) if isinstance(arg, CellRange) else to_number(arg)
+    return total
+
+
+def fn_count(args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, CellRange):
+            count += range_count(arg)
+        elif isinstance(arg, float) or parse_number(arg) is not None:
+            count += 1
+    return float(count)
+
+
+def number_stats(args):
+    """(suma, cantidad, mínimo, máximo) de todos los argumentos"""
+    total, count, low, high = 0.0, 0, None, None
+    for arg in args:
+        if isinstance(arg, CellRange):
+            arg_total, arg_count, arg_low, arg_high = range_stats(arg)
+        else:
+            number = to_number(arg)
+            arg_total, arg_count, arg_low, arg_high = number, 1, number, number
+        total += arg_total
+        count += arg_count
+        if arg_count:
+            low = arg_low if low is None else min(low, arg_low)
+            high = arg_high if high is None else max(high, arg_high)
+    return total, count, low, high
+
+
+def fn_average(args):
+    total, count, _, _ = number_stats(args)
+    if not count:
+        raise FormulaError("#DIV/0!")
+    return total / count
+
+
+def fn_min(args):
+    low = number_stats(args)[2]
+    return 0.0 if low is None else low
+
+
+def fn_max(args):
+    high = number_stats(args)[3]
+    return 0.0 if high is None else high
+
+
+def criteria_args(args, min_args, max_args):
+    if not min_args <= len(args) <= max_args or not isinstance(args[0], CellRange):
+        raise FormulaError("#VALUE!")
+    if len(args) == 3 and not isinstance(args[2], CellRange):
+        raise FormulaError("#VALUE!")
+    if isinstance(args[1], CellRange):
+        raise FormulaError("#VALUE!")
+    return args[0], args[1], args[2] if len(args) == 3 else None
+
+
+def fn_sumif(args):
+    cells, criteria, sum_cells = criteria_args(args, 2, 3)
+    return conditional_stats(cells, criteria, sum_cells)[0]
+
+
+def fn_averageif(args):
+    cells, criteria, sum_cells = criteria_args(args, 2, 3)
+    total, count = conditional_stats(cells, criteria, sum_cells)
+    if not count:
+        raise FormulaError("#DIV/0!")
+    return total / count
+
+
+def fn_countif(args):
+    cells, criteria, _ = criteria_args(args, 2, 2)
+    return float(conditional_count(cells, criteria))
+
+
+def fn_abs(args):
+    return abs(to_number(args[0]))
+
+
+def fn_round(args):
+    """Redondeo como en una planilla: la mitad se aleja del cero (2,5 -> 3,
+    -2,5 -> -3). Se redondea el decimal que se muestra, así 2,675 con dos
+    dígitos da 2,68 aunque el double esté apenas por debajo"""
+    number = to_number(args[0])
+    digits = int(to_number(args[1])) if len(args) > 1 else 0
+    if not math.isfinite(number):
+        return number
+    try:
+        return float(Decimal(repr(number)).quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        # Más dígitos de los que tiene el número: queda igual
+        return number
+
+
+def logical_values(args):
+    for arg in args:
+        if isinstance(arg, CellRange):
+            yield from (value for value in arg.values() if value != "")
+        else:
+            yield arg
+
+
+def fn_and(args):
+    return all(to_bool(value) for value in logical_values(args))
+
+
+def fn_or(args):
+    return any(to_bool(value) for value in logical_values(args))
+
+
+def fn_not(args):
+    return not to_bool(args[0])
+
+
+FUNCTIONS = {
+    "SUM": fn_sum,
+    "AVERAGE": fn_average,
+    "COUNT": fn_count,
+    "MIN": fn_min,
+    "MAX": fn_max,
+    "SUMIF": fn_sumif,
+    "COUNTIF": fn_countif,
+    "AVERAGEIF": fn_averageif,
+    "ABS": fn_abs,
+    "ROUND": fn_round,
+    "AND": fn_and,
+    "OR": fn_or,
+    "NOT": fn_not,
+    # IF se evalúa aparte para no calcular la rama que no se usa
+    "IF": None,
+}
+
+FUNCTION_ALIASES = {
+    "SUMA": "SUM",
+    "PROMEDIO": "AVERAGE",
+    "CONTAR": "COUNT",
+    "SUMAR.SI": "SUMIF",
+    "CONTAR.SI": "COUNTIF",
+    "PROMEDIO.SI": "AVERAGEIF",
+    "REDONDEAR": "ROUND",
+    "SI": "IF",
+    "Y": "AND",
+    "O": "OR",
+    "NO": "NOT",
+}
+
+
+# Compilación: árbol -> funciones f(engine, row, col)
+
+def resolve(spec, anchor):
+    value, absolute = spec
+    return value if absolute else anchor + value
+
+
+def resolve_range(specs, row, col):
+    r0, c0 = resolve(specs[0], row), resolve(specs[1], col)
+    r1, c1 = resolve(specs[2], row), resolve(specs[3], col)
+    return min(r0, r1), min(c0, c1), max(r0, r1), max(c0, c1)
+
+
+def checked_range(specs, row, col):
+    """`resolve_range` para evaluar: un rango que sale de la hoja (p. ej. una
+    fórmula relativa copiada hacia arriba) es #REF!"""
+    r0, c0, r1, c1 = resolve_range(specs, row, col)
+    if r0 < 0 or c0 < 0 or r1 >= MAX_ROWS or c1 >= MAX_COLS:
+        raise FormulaError(REF_ERROR)
+    return r0, c0, r1, c1
+
+
+def compile_node(node, refs, ranges):
+    """Convierte un nodo en una función f(engine, row, col) y anota sus referencias"""
+    kind = node[0]
+    if kind == "num" or kind == "str" or kind == "bool":
+        constant = node[1]
+        return lambda engine, row, col: constant
+    
+    if kind == "ref":
+        row_spec, col_spec = node[1], node[2]
+        refs.append((row_spec, col_spec))
+        (dr, row_abs), (dc, col_abs) = row_spec, col_spec
+        if row_abs and col_abs:
+            return lambda engine, row, col: engine.ref_value(dr, dc)
+        if row_abs:
+            return lambda engine, row, col: engine.ref_value(dr, col + dc)
+        if col_abs:
+            return lambda engine, row, col: engine.ref_value(row + dr, dc)
+        return lambda engine, row, col: engine.ref_value(row + dr, col + dc)
+    
+    if kind == "range":
+        specs = node[1:]
+        ranges.append(specs)
+        if (specs[0], specs[2]) == WHOLE_COLUMN_ROWS:
+            # Columnas completas: depende de todas sus filas, se evalúa hasta
+            # la última fila de la hoja
+            def whole_columns(engine, row, col):
+                r0, c0, r1, c1 = checked_range(specs, row, col)
+                return CellRange(engine, r0, c0, max(r0, min(r1, engine.sheet.num_rows - 1)), c1)
+            return whole_columns
+        return lambda engine, row, col: CellRange(engine, *checked_range(specs, row, col))
+    
+    if kind == "neg":
+        operand = compile_node(node[1], refs, ranges)
+        return lambda engine, row, col: -to_number(operand(engine, row, col))
+    
+    if kind == "bin":
+        op = node[1]
+        left = compile_node(node[2], refs, ranges)
+        right = compile_node(node[3], refs, ranges)
+        if op == "&":
+            return lambda engine, row, col: (
+                to_text(left(engine, row, col)) + to_text(right(engine, row, col))
+            )
+        if op in Parser.COMPARISON:
+            return lambda engine, row, col: compare(
+                op, left(engine, row, col), right(engine, row, col)
+            )
+        if op == "+":
+            return lambda engine, row, col: (
+                to_number(left(engine, row, col)) + to_number(right(engine, row, col))
+            )
+        if op == "-":
+            return lambda engine, row, col: (
+                to_number(left(engine, row, col)) - to_number(right(engine, row, col))
+            )
+        if op == "*":
+            return lambda engine, row, col: (
+                to_number(left(engine, row, col)) * to_number(right(engine, row, col))
+            )
+        return lambda engine, row, col: arithmetic(
+            op, left(engine, row, col), right(engine, row, col)
+        )
+    
+    if kind == "call":
+        name = node[1]
+        args = [compile_node(arg, refs, ranges) for arg in node[2]]
+        if name == "IF":
+            if not 2 <= len(args) <= 3:
+                return raise_error("#VALUE!")
+            condition, if_true = args[0], args[1]
+            if_false = args[2] if len(args) == 3 else (lambda engine, row, col: False)
+            return lambda engine, row, col: (
+                if_true(engine, row, col)
+                if to_bool(condition(engine, row, col))
+                else if_false(engine, row, col)
+            )
+        function = FUNCTIONS[name]
+        return lambda engine, row, col: function([arg(engine, row, col) for arg in args])
+    
+    return raise_error("#ERROR!")
+
+
+def raise_error(code):
+    def fail(engine, row, col):
+        raise FormulaError(code)
+    return fail
+
+
+class CompiledFormula:
+    """Plantilla compilada, compartida por todas las celdas con la misma clave"""
+    
+    __slots__ = ("key", "function", "refs", "ranges")
+    
+    def __init__(self, key, function, refs, ranges):
+        self.key = key
+        self.function = function
+        self.refs = refs
+        self.ranges = ranges
+    
+    def references(self, row, col):
+        """Celdas y rangos que usa la fórmula anclada en (row, col)"""
+        cells = {(resolve(row_spec, row), resolve(col_spec, col)) for row_spec, col_spec in self.refs}
+        ranges = [resolve_range(specs, row, col) for specs in self.ranges]
+        return cells, ranges
+
+
+def compile_template(text, key, row, col):
+    """Analiza y compila el texto de una fórmula (sin '=') anclada en (row, col)"""
+    refs, ranges = [], []
+    try:
+        node = Parser(tokenize(text), row, col).parse()
+    except FormulaError as error:
+        return CompiledFormula(key, raise_error(error.code), refs, ranges)
+    return CompiledFormula(key, compile_node(node, refs, ranges), refs, ranges)
+
+
+class FormulaCache:
+    """Caché LRU de fórmulas compiladas, por texto normalizado con referencias
+    relativas: las fórmulas copiadas o rellenadas comparten una sola plantilla"""
+    
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.templates = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, text, row, col):
+        """Devuelve la plantilla compilada para la fórmula anclada en (row, col)"""
+        body = text[1:] if text.startswith("=") else text
+        key = template_key(body, row, col)
+        template = self.templates.get(key)
+        if template is not None:
+            self.hits += 1
+            self.templates.move_to_end(key)
+            return template
+        
+        self.misses += 1
+        template = compile_template(body, key, row, col)
+        self.templates[key] = template
+        if len(self.templates) > self.max_size:
+            self.templates.popitem(last=False)
+            self.evictions += 1
+        return template
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.templates),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+    
+    def clear(self):
+        self.templates.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+class SpanIndex:
+    """Intervalos de filas (r0, r1) de una columna con la fórmula que los usa.
+    
+    Lista ordenada por inicio partida en tramos que guardan su fin máximo: la
+    consulta por fila corta en el primer tramo que empieza después y salta
+    los que terminan antes, sin recorrer todas las fórmulas de la columna.
+    """
+    
+    LOAD = 64
+    
+    def __init__(self):
+        self.chunks = []
+        self.starts = []
+        self.ends = []
+    
+    def __len__(self):
+        return sum(map(len, self.chunks))
+    
+    def add(self, r0, r1, cell):
+        entry = (r0, r1, cell)
+        if not self.chunks:
+            self.chunks.append([entry])
+            self.starts.append(r0)
+            self.ends.append(r1)
+            return
+        
+        i = max(0, bisect_right(self.starts, r0) - 1)
+        chunk = self.chunks[i]
+        insort(chunk, entry)
+        self.starts[i] = chunk[0][0]
+        self.ends[i] = max(self.ends[i], r1)
+        
+        if len(chunk) > 2 * self.LOAD:
+            half = chunk[self.LOAD:]
+            del chunk[self.LOAD:]
+            self.chunks.insert(i + 1, half)
+            self.starts.insert(i + 1, half[0][0])
+            self.ends.insert(i + 1, max(entry[1] for entry in half))
+            self.ends[i] = max(entry[1] for entry in chunk)
+    
+    def remove(self, r0, r1, cell):
+        entry = (r0, r1, cell)
+        # Con inicios repetidos la entrada puede estar en un tramo anterior
+        i = bisect_right(self.starts, r0) - 1
+        while i >= 0:
+            chunk = self.chunks[i]
+            j = bisect_left(chunk, entry)
+            if j < len(chunk) and chunk[j] == entry:
+                del chunk[j]
+                if chunk:
+                    self.starts[i] = chunk[0][0]
+                    self.ends[i] = max(entry[1] for entry in chunk)
+                else:
+                    del self.chunks[i], self.starts[i], self.ends[i]
+                return
+            i -= 1
+    
+    def stab(self, row):
+        """Fórmulas con algún intervalo que contiene la fila"""
+        result = []
+        ends = self.ends
+        for i, start in enumerate(self.starts):
+            if start > row:
+                break
+            if ends[i] < row:
+                continue
+            for r0, r1, cell in self.chunks[i]:
+                if r0 > row:
+                    break
+                if r1 >= row:
+                    result.append(cell)
+        return result
+    
+    def overlapping(self, r0, r1):
+        """Entradas (r0, r1, fórmula) cuyo intervalo corta las filas [r0, r1]"""
+        ends = self.ends
+        for i, start in enumerate(self.starts):
+            if start > r1:
+                break
+            if ends[i] < r0:
+                continue
+            for entry in self.chunks[i]:
+                if entry[0] > r1:
+                    break
+                if entry[1] >= r0:
+                    yield entry
+
+
+class FormulaEngine:
+    """Fórmulas con grafo de dependencias y recálculo incremental.
+    
+    La hoja guarda el texto que escribe el usuario (p. ej. "=SUM(A1:A5)");
+    el motor guarda la plantilla compilada de cada fórmula y su último valor.
+    """
+    
+    def __init__(self, sheet, cache=None):
+        self.sheet = sheet
+        self.cache = cache if cache is not None else FormulaCache()
+        self.formulas = {}
+        self.values = {}
+        
+        # Aristas del grafo: celda -> fórmulas que la usan directamente, y
+        # por columna, índice de los rangos de filas (r0, r1) de cada fórmula
+        self.dependents = {}
+        self.range_dependents = {}
+        self.precedents = {}
+        
+        # Filas con fórmula de cada columna, ordenadas (para los agregados)
+        self.formula_rows = {}
+        
+        # Recálculo completo en varios procesos (ver parallel_recalc), o None
+        self.parallel = None
+    
+    def is_formula(self, text):
+        return isinstance(text, str) and len(text) > 1 and text[0] == "="
+    
+    def display(self, row, col):
+        """Texto a mostrar en la celda: el valor calculado si es una fórmula"""
+        if (row, col) in self.formulas:
+            return format_value(self.values.get((row, col), ""))
+        return self.sheet.get(row, col)
+    
+    def value(self, row, col):
+        """Valor de una celda para usar dentro de una fórmula"""
+        cell = (row, col)
+        if cell in self.formulas:
+            value = self.values.get(cell, "")
+            if isinstance(value, FormulaError):
+                raise value
+            return value
+        # La columna sabe leer sus números ("1.234,56", fechas)
+        number = self.sheet.number(row, col)
+        return number if number is not None else self.sheet.get(row, col)
+    
+    def ref_value(self, row, col):
+        """Valor de una referencia suelta: una celda vacía vale 0 y una fuera de
+        la hoja (A0, o una relativa copiada más arriba de la fila 1) es #REF!"""
+        if row < 0 or col < 0 or row >= MAX_ROWS or col >= MAX_COLS:
+            raise FormulaError(REF_ERROR)
+        value = self.value(row, col)
+        return 0.0 if value == "" else value
+    
+    def set_cell(self, row, col, text):
+        """Guarda el texto de una celda y recalcula sus dependientes.
+        
+        Devuelve el conjunto de celdas cuyo valor mostrado puede cambiar.
+        """
+        self.sheet.set(row, col, text)
+        cell = (row, col)
+        self.unregister(cell)
+        if self.is_formula(text):
+            self.register(cell, text)
+        return self.recalculate([cell])
+    
+    def set_cells(self, cells):
+        """Guarda varias celdas (fila, col, texto) con un solo recálculo al final"""
+        changed = []
+        for row, col, text in cells:
+            self.sheet.set(row, col, text)
+            cell = (row, col)
+            self.unregister(cell)
+            if self.is_formula(text):
+                self.register(cell, text)
+            changed.append(cell)
+        return self.recalculate(changed)
+    
+    def set_range(self, row, col, rows):
+        """Escribe un bloque rectangular (filas de textos del mismo largo) desde
+        (row, col) columna a columna y recalcula una sola vez al final.
+        
+        Devuelve el conjunto de celdas cuyo valor mostrado puede cambiar.
+        """
+        if not rows or not rows[0]:
+            return set()
+        last_row, last_col = row + len(rows) - 1, col + len(rows[0]) - 1
+        for c in range(col, last_col + 1):
+            for r in list(self.formula_rows_in(c, row, last_row)):
+                self.unregister((r, c))
+        self.sheet.write_block(row, col, rows)
+        
+        for r, texts in enumerate(rows, row):
+            for c, text in enumerate(texts, col):
+                if text[:1] == "=" and self.is_formula(text):
+                    self.register((r, c), text)
+        changed = [(r, c) for r in range(row, last_row + 1) for c in range(col, last_col + 1)]
+        return self.recalculate(changed, self.area_dependents(row, col, last_row, last_col))
+    
+    def register(self, cell, text):
+        template = self.cache.get(text, *cell)
+        self.formulas[cell] = template
+        insort(self.formula_rows.setdefault(cell[1], []), cell[0])
+        
+        cells, ranges = template.references(*cell)
+        self.precedents[cell] = (cells, ranges)
+        for ref in cells:
+            self.dependents.setdefault(ref, set()).add(cell)
+        for r0, c0, r1, c1 in ranges:
+            for col in range(c0, c1 + 1):
+                index = self.range_dependents.get(col)
+                if index is None:
+                    index = self.range_dependents[col] = SpanIndex()
+                index.add(r0, r1, cell)
+    
+    def unregister(self, cell):
+        if cell not in self.formulas:
+            return
+        del self.formulas[cell]
+        self.values.pop(cell, None)
+        rows = self.formula_rows[cell[1]]
+        del rows[bisect_left(rows, cell[0])]
+        
+        cells, ranges = self.precedents.pop(cell)
+        for ref in cells:
+            users = self.dependents.get(ref)
+            if users is not None:
+                users.discard(cell)
+                if not users:
+                    del self.dependents[ref]
+        for r0, c0, r1, c1 in ranges:
+            for col in range(c0, c1 + 1):
+                index = self.range_dependents.get(col)
+                if index is not None:
+                    index.remove(r0, r1, cell)
+    
+    def formula_rows_in(self, col, r0, r1):
+        """Filas con fórmula de la columna dentro de [r0, r1]"""
+        rows = self.formula_rows.get(col)
+        if not rows:
+            return ()
+        return rows[bisect_left(rows, r0):bisect_right(rows, r1)]
+    
+    def direct_dependents(self, cell):
+        """Fórmulas que usan la celda, por referencia directa o dentro de un rango"""
+        row, col = cell
+        result = set(self.dependents.get(cell, ()))
+        index = self.range_dependents.get(col)
+        if index is not None:
+            result.update(index.stab(row))
+        return result
+    
+    def area_dependents(self, r0, c0, r1, c1):
+        """Fórmulas que usan alguna celda del rectángulo, con una consulta de
+        rangos por columna"""
+        result = set()
+        if len(self.dependents) < (r1 - r0 + 1) * (c1 - c0 + 1):
+            for (row, col), users in self.dependents.items():
+                if r0 <= row <= r1 and c0 <= col <= c1:
+                    result.update(users)
+        else:
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    users = self.dependents.get((row, col))
+                    if users:
+                        result.update(users)
+        for col in range(c0, c1 + 1):
+            index = self.range_dependents.get(col)
+            if index is not None:
+                result.update(cell for _, _, cell in index.overlapping(r0, r1))
+        return result
+    
+    def cells_dependents(self, cells):
+        """Fórmulas que usan alguna de las celdas, con una consulta de rangos por
+        columna (para muchas celdas, p. ej. un bloque pegado)"""
+        result = set()
+        dependents = self.dependents
+        if len(dependents) < len(cells):
+            cells = set(cells)
+            for cell, users in dependents.items():
+                if cell in cells:
+                    result.update(users)
+        else:
+            for cell in cells:
+                users = dependents.get(cell)
+                if users:
+                    result.update(users)
+        
+        rows_by_col = {}
+        for row, col in cells:
+            if col in self.range_dependents:
+                rows_by_col.setdefault(col, []).append(row)
+        for col, rows in rows_by_col.items():
+            rows.sort()
+            for r0, r1, cell in self.range_dependents[col].overlapping(rows[0], rows[-1]):
+                i = bisect_left(rows, r0)
+                if i < len(rows) and rows[i] <= r1:
+                    result.add(cell)
+        return result
+    
+    @perf.traced("recalc")
+    def recalculate(self, changed, users=None):
+        """Recalcula en orden topológico solo las fórmulas afectadas por `changed`.
+        
+        `users` son las fórmulas que usan las celdas cambiadas, si ya se
+        conocen (p. ej. las de un bloque, ver `area_dependents`).
+        """
+        # Subgrafo afectado: dependientes transitivos de las celdas cambiadas.
+        # Los usuarios de las celdas sin fórmula se buscan todos juntos
+        edges = {}
+        indegree = {}
+        seen = set(changed)
+        formulas = self.formulas
+        queue = deque(cell for cell in changed if cell in formulas)
+        if users is None:
+            users = self.cells_dependents([cell for cell in changed if cell not in formulas])
+        for user in users:
+            if user not in seen:
+                seen.add(user)
+                queue.append(user)
+        while queue:
+            cell = queue.popleft()
+            users = self.direct_dependents(cell)
+            if cell in self.formulas:
+                edges[cell] = users
+                indegree.setdefault(cell, 0)
+                for user in users:
+                    indegree[user] = indegree.get(user, 0) + 1
+            for user in users:
+                if user not in seen:
+                    seen.add(user)
+                    queue.append(user)
+        
+        self.evaluate_in_order(edges, indegree)
+        return seen
+    
+    def evaluate_in_order(self, edges, indegree):
+        """Algoritmo de Kahn; lo que queda sin evaluar forma parte de un ciclo"""
+        ready = deque(cell for cell, count in indegree.items() if count == 0)
+        while ready:
+            cell = ready.popleft()
+            self.values[cell] = self.evaluate_cell(cell)
+            for user in edges.get(cell, ()):
+                indegree[user] -= 1
+                if indegree[user] == 0:
+                    ready.append(user)
+        
+        for cell, count in indegree.items():
+            if count > 0:
+                self.values[cell] = FormulaError(CYCLE_ERROR)
+    
+    def evaluate_templates(self, cells):
+        """Calcula fórmulas ya compiladas (fila, col, plantilla) sin armar el
+        grafo: cada una debe venir después de las fórmulas que usa (ver
+        parallel_recalc)"""
+        for row, col, template in cells:
+            self.formulas[(row, col)] = template
+            self.formula_rows.setdefault(col, []).append(row)
+        for rows in self.formula_rows.values():
+            rows.sort()
+        for row, col, _ in cells:
+            self.values[(row, col)] = self.evaluate_cell((row, col))
+    
+    @perf.traced("recalc.all")
+    def recalculate_all(self, cells=None):
+        """Reconstruye el grafo desde la hoja y recalcula todas las fórmulas.
+        
+        `cells` permite pasar ya las celdas candidatas (fila, col, texto) para
+        no recorrer toda la hoja (p. ej. las fórmulas del índice de un libro).
+        """
+        self.formulas.clear()
+        self.values.clear()
+        self.dependents.clear()
+        self.range_dependents.clear()
+        self.precedents.clear()
+        self.formula_rows.clear()
+        
+        for row, col, text in self.sheet.iter_cells() if cells is None else cells:
+            if self.is_formula(text):
+                self.register((row, col), text)
+        
+        edges = {}
+        indegree = dict.fromkeys(self.formulas, 0)
+        for cell in self.formulas:
+            users = self.direct_dependents(cell)
+            edges[cell] = users
+            for user in users:
+                indegree[user] += 1
+        if self.parallel is not None and self.parallel.evaluate(self, edges):
+            return
+        self.evaluate_in_order(edges, indegree)
+    
+    def clear(self):
+        self.sheet.clear()
+        self.recalculate_all()
+    
+    def state(self):
+        """(hoja, fórmulas, valores y grafo): lo que se aparta al pasar a otra hoja del libro"""
+        return (
+            self.sheet, self.formulas, self.values, self.dependents,
+            self.range_dependents, self.precedents, self.formula_rows,
+        )
+    
+    def restore(self, state):
+        """Vuelve a una hoja apartada con `state`, sin recalcular"""
+        (
+            self.sheet, self.formulas, self.values, self.dependents,
+            self.range_dependents, self.precedents, self.formula_rows,
+        ) = state
+    
+    def load(self, sheet, cells=None):
+        """Pasa a `sheet` con un grafo propio y calcula sus fórmulas (ver
+        `recalculate_all`); el grafo anterior queda intacto para `restore`"""
+        self.restore((sheet, {}, {}, {}, {}, {}, {}))
+        self.recalculate_all(cells)
+    
+    def evaluate_cell(self, cell):
+        try:
+            value = self.formulas[cell].function(self, *cell)
+        except FormulaError as error:
+            return error
+        except RecursionError:
+            return FormulaError("#ERROR!")
+        if isinstance(value, CellRange):
+            # Un rango suelto no es un valor de celda
+            return FormulaError("#VALUE!")
+        return value
+    
+    def range_values(self, r0, c0, r1, c1):
+        values = []
+        for row in range(r0, r1 + 1):
+            for col in range(c0, c1 + 1):
+                values.append(self.value(row, col))
+        return values
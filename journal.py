@@ -0,0 +1,185 @@
+import os
+import struct
+import threading
+import zlib
+from itertools import islice
+
+
+# Registro: operación, fila, columna, largo del texto | texto UTF-8 | crc32
+RECORD = struct.Struct("<BIII")
+CRC = struct.Struct("<I")
+
+SET = 1
+CLEAR = 2
+
+# Registros por escritura al agregar muchas ediciones juntas (pegar, rellenar)
+WRITE_BATCH = 65536
+
+
+def journal_path(workbook_path):
+    """Ruta del diario de ediciones de un libro (junto al archivo)"""
+    return workbook_path + ".journal"
+
+
+def read_journal(path):
+    """Lee los registros válidos como (operación, fila, col, texto).
+    
+    Se detiene en el primer registro incompleto o dañado (una escritura
+    interrumpida). Devuelve (registros, bytes válidos).
+    """
+    if not os.path.exists(path):
+        return [], 0
+    with open(path, "rb") as f:
+        data = f.read()
+    
+    records = []
+    pos = 0
+    while pos + RECORD.size <= len(data):
+        op, row, col, length = RECORD.unpack_from(data, pos)
+        end = pos + RECORD.size + length
+        if op not in (SET, CLEAR) or end + CRC.size > len(data):
+            break
+        (crc,) = CRC.unpack_from(data, end)
+        if zlib.crc32(data[pos:end]) != crc:
+            break
+        records.append((op, row, col, data[pos + RECORD.size:end].decode("utf-8")))
+        pos = end + CRC.size
+    return records, pos
+
+
+def encode_record(op, row, col, text):
+    data = text.encode("utf-8")
+    record = RECORD.pack(op, row, col, len(data)) + data
+    return record + CRC.pack(zlib.crc32(record))
+
+
+def replay(records, sheet, formulas=()):
+    """Aplica los registros del diario a la hoja.
+    
+    `formulas` son las celdas con fórmula del punto de control (fila, col,
+    texto); devuelve la lista actualizada para `FormulaEngine.recalculate_all`.
+    """
+    cells = {(row, col): text for row, col, text in formulas}
+    for op, row, col, text in records:
+        if op == CLEAR:
+            sheet.clear()
+            cells.clear()
+        else:
+            sheet.set(row, col, text)
+            cells[(row, col)] = text
+    return [(row, col, text) for (row, col), text in cells.items()]
+
+
+class EditJournal:
+    """Diario de ediciones de solo agregado (write-ahead log) de un libro.
+    
+    Cada edición se escribe al momento; el fsync se hace por lotes, cada
+    `sync_every` registros o a los `sync_delay` segundos de la primera
+    pendiente. Cuando supera `checkpoint_size` bytes conviene volcarlo al
+    libro (punto de control) y recortarlo con `discard_until`.
+    """
+    
+    def __init__(self, path, sync_every=256, sync_delay=1.0, checkpoint_size=4 * 1024 * 1024):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_delay = sync_delay
+        self.checkpoint_size = checkpoint_size
+        
+        # Descartar la cola de una escritura interrumpida antes de agregar
+        _, valid = read_journal(path)
+        self.file = open(path, "ab")
+        if self.file.tell() > valid:
+            self.file.truncate(valid)
+        
+        self.pending = 0
+        self.timer = None
+        self.lock = threading.Lock()
+    
+    def append(self, row, col, text):
+        self.write(SET, row, col, text)
+    
+    def append_cells(self, cells):
+        """Agrega varias ediciones (fila, col, texto) con una escritura por
+        cada `WRITE_BATCH` registros"""
+        cells = iter(cells)
+        while True:
+            records = [encode_record(SET, row, col, text) for row, col, text in islice(cells, WRITE_BATCH)]
+            if not records:
+                return
+            self.write_records(b"".join(records), len(records))
+    
+    def append_clear(self):
+        self.write(CLEAR, 0, 0, "")
+    
+    def write(self, op, row, col, text):
+        self.write_records(encode_record(op, row, col, text), 1)
+    
+    def write_records(self, data, count):
+        with self.lock:
+            self.file.write(data)
+            self.pending += count
+            if self.pending >= self.sync_every:
+                self.sync_locked()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.sync_delay, self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+    
+    def sync(self):
+        """Lleva a disco las ediciones pendientes"""
+        with self.lock:
+            self.sync_locked()
+    
+    def sync_locked(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending and not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+    
+    def size(self):
+        with self.lock:
+            return self.file.tell()
+    
+    def needs_checkpoint(self):
+        return self.size() >= self.checkpoint_size
+    
+    def reset(self, data=b""):
+        """Vacía el diario (o lo deja solo con los registros `data`)"""
+        with self.lock:
+            self.reset_locked(data)
+    
+    def reset_locked(self, data):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        # truncate no mueve la posición: sin el seek, size() seguiría contando lo borrado
+        self.file.truncate(0)
+        self.file.seek(0)
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+    
+    def tail(self, mark):
+        """Registros escritos después de la posición `mark` (ver `size`)"""
+        with self.lock:
+            return self.tail_locked(mark)
+    
+    def tail_locked(self, mark):
+        self.file.flush()
+        with open(self.path, "rb") as f:
+            f.seek(mark)
+            return f.read()
+    
+    def discard_until(self, mark):
+        """Descarta los registros anteriores a `mark`, que ya están guardados"""
+        with self.lock:
+            self.reset_locked(self.tail_locked(mark))
+    
+    def close(self):
+        with self.lock:
+            self.sync_locked()
+            self.file.close()
@@ -0,0 +1,250 @@
+import heapq
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import perf
+from formula_engine import CYCLE_ERROR, FormulaEngine, FormulaError, compile_template
+from workbook_format import BlockWriter, WorkbookFile, mapped_sheet
+
+
+# Con menos fórmulas el recálculo completo va en serie: arrancar y alimentar
+# los procesos cuesta más de lo que se gana
+MIN_FORMULAS = 20_000
+
+# Procesos del grupo si no se indican (uno por núcleo, hasta este tope)
+MAX_WORKERS = 8
+
+# Si una sola componente tiene esta fracción de las fórmulas no vale la pena
+# repartir el resto: se calcula todo en serie
+SERIAL_SHARE = 0.8
+
+
+def default_workers():
+    return max(1, min(os.cpu_count() or 1, MAX_WORKERS))
+
+
+def components(edges):
+    """Componentes conexas del grafo de fórmulas (celda -> fórmulas que la
+    usan): ninguna fórmula depende de otra de una componente distinta"""
+    parent = {cell: cell for cell in edges}
+    
+    def find(cell):
+        root = cell
+        while parent[root] != root:
+            root = parent[root]
+        while parent[cell] != root:
+            parent[cell], cell = root, parent[cell]
+        return root
+    
+    for cell, users in edges.items():
+        for user in users:
+            a, b = find(cell), find(user)
+            if a != b:
+                parent[a] = b
+    
+    groups = {}
+    for cell in edges:
+        groups.setdefault(find(cell), []).append(cell)
+    return list(groups.values())
+
+
+def topological_order(edges):
+    """Fórmulas en un orden en que cada una va después de las que usa
+    (algoritmo de Kahn); las que quedan afuera forman parte de un ciclo"""
+    indegree = dict.fromkeys(edges, 0)
+    for users in edges.values():
+        for user in users:
+            indegree[user] += 1
+    order = [cell for cell, count in indegree.items() if count == 0]
+    for cell in order:
+        for user in edges.get(cell, ()):
+            indegree[user] -= 1
+            if indegree[user] == 0:
+                order.append(user)
+    return order
+
+
+def batches(groups, order, count):
+    """Reparte las componentes en `count` lotes de tamaño parecido (la más
+    grande al lote más liviano); cada lote sigue el orden `order`"""
+    heap = [(0, index) for index in range(count)]
+    batch_of = {}
+    for group in sorted(groups, key=len, reverse=True):
+        size, index = heapq.heappop(heap)
+        batch_of.update(dict.fromkeys(group, index))
+        heapq.heappush(heap, (size + len(group), index))
+    result = [[] for _ in range(count)]
+    for cell in order:
+        result[batch_of[cell]].append(cell)
+    return [batch for batch in result if batch]
+
+
+def used_columns(engine):
+    """Columnas que leen las fórmulas: las únicas que necesitan los procesos"""
+    return {col for _, col in engine.dependents} | set(engine.range_dependents)
+
+
+def share_columns(sheet, cols):
+    """Copia a memoria compartida las columnas `cols` como bloques .csmt (ver
+    workbook_format); devuelve (memoria, índice para `mapped_sheet`)"""
+    buffer = io.BytesIO()
+    writer = BlockWriter(buffer)
+    for col in sorted(cols):
+        column = sheet.column(col)
+        if column is not None:
+            writer.write_column(col, column, None)
+    data = buffer.getbuffer()
+    memory = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    memory.buf[:len(data)] = data
+    del data
+    index = {
+        "name": memory.name,
+        "num_rows": sheet.num_rows,
+        "num_cols": sheet.num_cols,
+        "columns": writer.columns,
+        "types": writer.types,
+    }
+    return memory, index
+
+
+class SharedBlocks(WorkbookFile):
+    """Bloques de `share_columns` vistos desde un proceso del grupo: como un
+    .csmt mapeado, las columnas decodifican solo los bloques que se leen"""
+    
+    def __init__(self, name):
+        self.path = name
+        self.file = None
+        self.refs = 0
+        self.refs_lock = threading.Lock()
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.map = self.memory.buf
+    
+    def close(self):
+        if self.map is not None:
+            self.map = None
+            self.memory.close()
+
+
+def batch_task(engine, batch):
+    """Lo que viaja a un proceso: cada plantilla una vez, como (texto, celda
+    de ejemplo), y las celdas del lote en orden con la clave de su plantilla"""
+    templates = {}
+    cells = []
+    for row, col in batch:
+        key = engine.formulas[(row, col)].key
+        if key not in templates:
+            templates[key] = (engine.sheet.get(row, col)[1:], row, col)
+        cells.append((row, col, key))
+    return templates, cells
+
+
+def warm_up():
+    """Tarea vacía: el proceso arranca e importa este módulo antes del primer lote"""
+
+
+def evaluate_batch(index, templates, cells):
+    """En un proceso del grupo: compila cada plantilla una vez y calcula las
+    fórmulas del lote en orden sobre las columnas compartidas; devuelve
+    {celda: valor}"""
+    source = SharedBlocks(index["name"])
+    sheet = mapped_sheet(source, index)
+    if source.refs == 0:
+        source.close()
+    compiled = {key: compile_template(text, key, row, col) for key, (text, row, col) in templates.items()}
+    engine = FormulaEngine(sheet)
+    engine.evaluate_templates([(row, col, compiled[key]) for row, col, key in cells])
+    return engine.values
+
+
+class ParallelRecalc:
+    """Recálculo completo de muchas fórmulas repartido en un grupo de procesos.
+    
+    El grafo se parte en componentes conexas, que se calculan sin esperarse
+    unas a otras, y se reparten en `workers` lotes parecidos. Las columnas
+    que leen las fórmulas pasan una sola vez a memoria compartida y cada
+    proceso las mapea sin copiarlas; solo viajan los textos de las fórmulas
+    y los valores calculados. Con menos de `min_formulas` fórmulas, un solo
+    proceso, una componente que lo concentra casi todo o un grupo que falla,
+    se calcula en serie.
+    
+    Los procesos arrancan con el primer recálculo que los usa, o antes con
+    `warm`, y siguen vivos hasta `close`.
+    """
+    
+    def __init__(self, workers=None, min_formulas=MIN_FORMULAS):
+        self.workers = default_workers() if workers is None else workers
+        self.min_formulas = min_formulas
+        self.pool = None
+        # `warm` y `close` llegan desde otros hilos que el recálculo
+        self.pool_lock = threading.Lock()
+    
+    def worthwhile(self, count):
+        return self.workers >= 2 and count >= max(self.min_formulas, 2)
+    
+    def start(self):
+        with self.pool_lock:
+            if self.pool is None:
+                # "spawn" en todos los sistemas: el proceso de la interfaz tiene hilos
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+    
+    def warm(self, count):
+        """Arranca el grupo sin esperarlo si un recálculo de hasta `count`
+        fórmulas lo va a usar: así los procesos no se crean con el candado de
+        la hoja tomado"""
+        if not self.worthwhile(count) or self.pool is not None:
+            return
+        try:
+            pool = self.start()
+            for _ in range(self.workers):
+                pool.submit(warm_up)
+        except (BrokenProcessPool, OSError, RuntimeError):
+            self.close()
+    
+    def evaluate(self, engine, edges):
+        """Calcula en el grupo las fórmulas de `engine` (grafo `edges`) y guarda
+        sus valores; devuelve False si hay que calcularlas en serie"""
+        total = len(engine.formulas)
+        if not self.worthwhile(total):
+            return False
+        groups = components(edges)
+        if max(map(len, groups)) >= total * SERIAL_SHARE:
+            return False
+        
+        order = topological_order(edges)
+        with perf.span("recalc.share"):
+            memory, index = share_columns(engine.sheet, used_columns(engine))
+        try:
+            pool = self.start()
+            futures = [
+                pool.submit(evaluate_batch, index, *batch_task(engine, batch))
+                for batch in batches(groups, order, self.workers)
+            ]
+            perf.count("recalc.batches", len(futures))
+            for future in futures:
+                engine.values.update(future.result())
+        except (BrokenProcessPool, CancelledError, OSError, RuntimeError):
+            # Sin grupo (un proceso murió, o se cerró con `close`): se rehace la próxima vez
+            self.close()
+            return False
+        finally:
+            memory.close()
+            memory.unlink()
+        
+        if len(order) < total:
+            for cell in engine.formulas:
+                if cell not in engine.values:
+                    engine.values[cell] = FormulaError(CYCLE_ERROR)
+        return True
+    
+    def close(self):
+        """Detiene los procesos del grupo"""
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,190 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import msgpack
+    from flet.controls.base_control import BaseControl
+    from flet.messaging.protocol import configure_encode_object_for_msgpack
+except ImportError:
+    msgpack = None
+
+
+# Eventos que se conservan para la traza (los más viejos se descartan)
+MAX_EVENTS = 100_000
+
+
+class NullSpan:
+    """Tramo que no mide nada: lo que devuelve `span` con la medición apagada"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.recorder.add_span(self.name, self.start, time.perf_counter())
+        return False
+
+
+class PerfRecorder:
+    """Tiempos y contadores de los caminos críticos (construir la rejilla,
+    refrescar, page.update, leer y escribir CSV).
+    
+    Apagado por defecto: `span` devuelve un tramo vacío y `count` vuelve al
+    instante, así medir no cuesta nada mientras nadie mira. Encendido, suma
+    por nombre (veces, total, máximo) y guarda los últimos `MAX_EVENTS`
+    tramos para exportarlos como traza de Chrome (chrome://tracing, Perfetto).
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.clear()
+    
+    def clear(self):
+        with self.lock:
+            self.origin = time.perf_counter()
+            self.totals = {}
+            self.counters = {}
+            self.events = deque(maxlen=MAX_EVENTS)
+    
+    def span(self, name):
+        """Mide el bloque `with` con ese nombre"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+    
+    def add_span(self, name, start, end):
+        duration = end - start
+        with self.lock:
+            total = self.totals.get(name)
+            if total is None:
+                self.totals[name] = [1, duration, duration]
+            else:
+                total[0] += 1
+                total[1] += duration
+                total[2] = max(total[2], duration)
+            self.events.append((name, start, duration, threading.get_ident()))
+    
+    def count(self, name, amount=1):
+        """Suma `amount` al contador (controles creados, celdas, bytes...)"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def summary(self):
+        """(tramos como (nombre, veces, total s, máximo s) del más costoso al
+        menos, contadores como (nombre, valor))"""
+        with self.lock:
+            spans = sorted(
+                ((name, *total) for name, total in self.totals.items()),
+                key=lambda item: item[2], reverse=True,
+            )
+            counters = sorted(self.counters.items())
+        return spans, counters
+    
+    def export_trace(self, path):
+        """Escribe la traza en formato Chrome Trace Event (JSON)"""
+        with self.lock:
+            events = [
+                {
+                    "name": name, "ph": "X", "pid": os.getpid(), "tid": thread,
+                    "ts": (start - self.origin) * 1e6, "dur": duration * 1e6,
+                }
+                for name, start, duration, thread in self.events
+            ]
+            now = (time.perf_counter() - self.origin) * 1e6
+            events.extend(
+                {"name": name, "ph": "C", "pid": os.getpid(), "ts": now, "args": {name: value}}
+                for name, value in self.counters.items()
+            )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+recorder = PerfRecorder()
+span = recorder.span
+count = recorder.count
+
+
+def traced(name):
+    """Decorador: mide cada llamada a la función con el nombre `name`"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return fn(*args, **kwargs)
+            with Span(recorder, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def watch_updates(page):
+    """Mide los envíos de la sesión de `page`: el diff de cada update
+    ("page.update") y el tamaño de lo enviado al cliente.
+    
+    Reemplaza métodos de la sesión y su conexión; `unwatch_updates` los
+    devuelve, así con la medición apagada no queda ningún costo.
+    """
+    session = page.session
+    if session is None or "patch_control" in vars(session):
+        return
+    patch_control = session.patch_control
+    
+    def timed_patch_control(*args, **kwargs):
+        recorder.count("update.patches")
+        with recorder.span("page.update"):
+            return patch_control(*args, **kwargs)
+    session.patch_control = timed_patch_control
+    
+    connection = session.connection
+    if connection is None:
+        return
+    send_message = connection.send_message
+    
+    def counted_send_message(message):
+        result = send_message(message)
+        # Se codifica de nuevo después del envío real, que queda igual
+        recorder.count("update.messages")
+        recorder.count("update.bytes", payload_size(message))
+        return result
+    connection.send_message = counted_send_message
+
+
+def unwatch_updates(page):
+    session = page.session
+    if session is None:
+        return
+    vars(session).pop("patch_control", None)
+    if session.connection is not None:
+        vars(session.connection).pop("send_message", None)
+
+
+def payload_size(message):
+    """Bytes del mensaje codificado como lo envía Flet (msgpack)"""
+    if msgpack is None:
+        return 0
+    return len(msgpack.packb(
+        [message.action, message.body],
+        default=configure_encode_object_for_msgpack(BaseControl),
+    ))
@@ -0,0 +1,123 @@
+import time
+
+import flet as ft
+from flet import Colors
+
+import perf
+
+
+TRACE_PATH = "traza_rendimiento.json"
+
+# Segundos entre refrescos del panel mientras está visible
+REFRESH_INTERVAL = 1.0
+
+
+class PerfOverlay:
+    """Panel flotante con los tiempos y contadores de `perf`.
+    
+    Al mostrarlo se enciende la medición (y se miden los envíos de la página);
+    al ocultarlo se apaga, así sin el panel abierto no hay ningún costo.
+    """
+    
+    def __init__(self, page: ft.Page, trace_path=TRACE_PATH):
+        self.page = page
+        self.trace_path = trace_path
+        self.visible = False
+        
+        self.spans_table = ft.Column(spacing=2)
+        self.counters_table = ft.Column(spacing=2)
+        self.status = ft.Text(size=11, italic=True, color=Colors.GREY_700)
+        self.panel = ft.Container(
+            content=ft.Column([
+                ft.Row([
+                    ft.Text("Rendimiento", weight=ft.FontWeight.BOLD),
+                    ft.IconButton(icon=ft.Icons.CLOSE, icon_size=16, on_click=self.hide),
+                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                self.spans_table,
+                ft.Divider(height=1),
+                self.counters_table,
+                ft.Row([
+                    ft.TextButton("Exportar traza", icon=ft.Icons.DOWNLOAD, on_click=self.export),
+                    ft.TextButton("Reiniciar", icon=ft.Icons.REFRESH, on_click=self.reset),
+                ], spacing=5),
+                self.status,
+            ], spacing=5, tight=True, scroll=ft.ScrollMode.AUTO),
+            width=380,
+            padding=10,
+            top=10,
+            right=10,
+            bgcolor=Colors.WHITE,
+            border=ft.Border.all(1, Colors.GREY_400),
+            border_radius=5,
+            shadow=ft.BoxShadow(blur_radius=8, color=Colors.BLACK_26),
+        )
+    
+    def toggle(self, e=None):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+    
+    def show(self, e=None):
+        if self.visible:
+            return
+        self.visible = True
+        perf.recorder.enabled = True
+        perf.watch_updates(self.page)
+        self.refresh()
+        self.page.overlay.append(self.panel)
+        self.page.update()
+        self.page.run_thread(self.refresh_loop)
+    
+    def hide(self, e=None):
+        if not self.visible:
+            return
+        self.visible = False
+        perf.recorder.enabled = False
+        perf.unwatch_updates(self.page)
+        if self.panel in self.page.overlay:
+            self.page.overlay.remove(self.panel)
+        self.page.update()
+    
+    def refresh_loop(self):
+        while True:
+            time.sleep(REFRESH_INTERVAL)
+            if not self.visible:
+                return
+            self.refresh()
+            self.panel.update()
+    
+    def refresh(self):
+        """Vuelca el resumen del registro en las tablas del panel"""
+        spans, counters = perf.recorder.summary()
+        self.spans_table.controls = [self.line("Tramo", "veces", "total ms", "máx ms", bold=True)] + [
+            self.line(name, times, f"{total * 1000:.1f}", f"{longest * 1000:.1f}")
+            for name, times, total, longest in spans
+        ]
+        self.counters_table.controls = [
+            self.line(name, "", "", f"{value:,}".replace(",", "."))
+            for name, value in counters
+        ]
+    
+    def line(self, name, times, total, longest, bold=False):
+        weight = ft.FontWeight.BOLD if bold else None
+        return ft.Row([
+            ft.Text(name, size=11, weight=weight, expand=True),
+            ft.Text(str(times), size=11, weight=weight, width=45, text_align=ft.TextAlign.RIGHT),
+            ft.Text(total, size=11, weight=weight, width=65, text_align=ft.TextAlign.RIGHT),
+            ft.Text(longest, size=11, weight=weight, width=65, text_align=ft.TextAlign.RIGHT),
+        ], spacing=5)
+    
+    def export(self, e=None):
+        try:
+            perf.recorder.export_trace(self.trace_path)
+            self.status.value = f"Traza guardada en {self.trace_path}"
+        except OSError as ex:
+            self.status.value = f"No se pudo guardar la traza: {ex}"
+        self.status.update()
+    
+    def reset(self, e=None):
+        perf.recorder.clear()
+        self.refresh()
+        self.status.value = ""
+        self.panel.update()
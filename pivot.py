@@ -0,0 +1,279 @@
+import re
+from array import array
+
+from addressing import column_index, column_letter
+from range_edit import number_format
+from sheet_model import NAN, format_number
+from sheet_view import cell_key
+
+
+# Funciones de resumen: nombre escrito -> función
+FUNCTIONS = {
+    "suma": "sum", "sum": "sum",
+    "cantidad": "count", "contar": "count", "count": "count",
+    "promedio": "avg", "avg": "avg",
+}
+TITLES = {"sum": "Suma", "count": "Cantidad", "avg": "Promedio"}
+
+# Con más filas cambiadas que esta fracción de la hoja se vuelve a agrupar todo
+REBUILD_RATIO = 0.25
+
+COLUMN_RE = re.compile(r"\s*([A-Za-z]{1,3})\s*")
+MEASURE_RE = re.compile(r"\s*(?:([A-Za-zá-ú]+)\s+)?([A-Za-z]{1,3})\s*")
+
+
+def accumulate(totals, base, value, count=1):
+    """Suma `value` al acumulador de `totals` que empieza en `base` (suma,
+    compensación y cantidad). Suma compensada de Neumaier: los centavos de
+    miles de filas no dejan restos como 505839.3700000003."""
+    total = totals[base]
+    result = total + value
+    if abs(total) >= abs(value):
+        totals[base + 1] += (total - result) + value
+    else:
+        totals[base + 1] += (value - result) + total
+    totals[base] = result
+    totals[base + 2] += count
+
+
+def key_texts(engine, col, r0, r1):
+    """Textos mostrados de una columna en [r0, r1], con las fórmulas ya
+    calculadas (los errores con su código)"""
+    column = engine.sheet.column(col)
+    texts = column.slice(r0, r1 + 1) if column is not None else [""] * (r1 - r0 + 1)
+    for row in engine.formula_rows_in(col, r0, r1):
+        texts[row - r0] = engine.display(row, col)
+    return texts
+
+
+def measure_numbers(engine, col, r0, r1):
+    """Números de una columna en [r0, r1] como array('d'), NaN si la celda está
+    vacía, es texto o tiene un error. En una columna con tipo es una copia del
+    array empaquetado, sin leer los textos."""
+    size = r1 - r0 + 1
+    numbers = engine.sheet.numbers(col)
+    if numbers is None:
+        buffer = array("d", [NAN]) * size
+    else:
+        buffer = numbers[r0:r1 + 1]
+        if len(buffer) < size:
+            buffer.extend(array("d", [NAN]) * (size - len(buffer)))
+    for row in engine.formula_rows_in(col, r0, r1):
+        value = engine.values.get((row, col), "")
+        buffer[row - r0] = value if isinstance(value, float) else NAN
+    return buffer
+
+
+def parse_keys(text):
+    """Lee las columnas de agrupación escritas como "A, B" """
+    keys = []
+    for part in text.split(","):
+        match = COLUMN_RE.fullmatch(part)
+        if match is None:
+            raise ValueError(f"Columna no válida: {part.strip()}")
+        keys.append(column_index(match.group(1).upper()))
+    return keys
+
+
+def parse_measures(text):
+    """Lee los resúmenes escritos como "suma C, promedio D, cantidad C" (sin
+    función, suma)"""
+    measures = []
+    for part in text.split(","):
+        match = MEASURE_RE.fullmatch(part)
+        function = FUNCTIONS.get((match.group(1) or "suma").lower()) if match else None
+        if function is None:
+            raise ValueError(f"Resumen no válido: {part.strip()}")
+        measures.append((column_index(match.group(2).upper()), function))
+    return measures
+
+
+class PivotTable:
+    """Tabla dinámica: agrupa las filas de la pestaña `source` por las columnas
+    `keys` y resume las de `measures`, [(col, "sum" | "count" | "avg")].
+    
+    Se agrupa en una sola pasada con un diccionario clave -> acumuladores
+    (filas, y suma y cantidad de números de cada columna resumida), leyendo
+    las columnas con tipo directamente de su array. Cada fila recuerda su
+    clave y sus números: una edición resta lo que aportaba y suma lo nuevo
+    solo en sus grupos, y `write` lleva a la hoja de la tabla solo los grupos
+    que cambiaron.
+    """
+    
+    def __init__(self, source, keys, measures):
+        if not keys or not measures:
+            raise ValueError("La tabla dinámica necesita columnas de agrupación y de resumen")
+        self.source = source
+        self.keys = list(keys)
+        self.measures = list(measures)
+        # Cada columna resumida se suma y se cuenta una sola vez
+        self.value_cols = list(dict.fromkeys(col for col, _ in self.measures))
+        self.slots = [self.value_cols.index(col) for col, _ in self.measures]
+        self.columns = set(self.keys) | set(self.value_cols)
+        self.formats = [format_number] * len(self.value_cols)
+        
+        # Por fila de la hoja de origen: clave (None si no tiene) y números
+        self.row_keys = []
+        self.row_numbers = [array("d") for _ in self.value_cols]
+        # clave -> [filas, suma 1, compensación 1, cantidad 1, suma 2, ...]
+        self.groups = {}
+        self.order = {}
+        
+        # Lo que falta llevar a la hoja de la tabla: grupos con otro resumen,
+        # o toda la tabla si aparecieron o desaparecieron grupos
+        self.dirty = set()
+        self.layout_changed = True
+        self.positions = {}
+        self.written = 0
+    
+    @property
+    def pending(self):
+        return self.layout_changed or bool(self.dirty)
+    
+    def build(self, engine):
+        """Agrupa toda la hoja de `engine` (la de `source`) en una pasada"""
+        sheet = engine.sheet
+        last = sheet.num_rows - 1
+        self.formats = [number_format(sheet, col) for col in self.value_cols]
+        texts = [key_texts(engine, col, 0, last) for col in self.keys]
+        numbers = [measure_numbers(engine, col, 0, last) for col in self.value_cols]
+        
+        row_keys = list(zip(*texts))
+        groups = {}
+        order = {}
+        slots = [(3 * i + 1, buffer) for i, buffer in enumerate(numbers)]
+        empty = [0] + [0.0, 0.0, 0] * len(numbers)
+        for row, key in enumerate(row_keys):
+            if not any(key):
+                row_keys[row] = None
+                continue
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = list(empty)
+                order[key] = self.order_key(engine, row)
+            totals[0] += 1
+            for base, buffer in slots:
+                value = buffer[row]
+                if value == value:
+                    accumulate(totals, base, value)
+        
+        self.row_keys = row_keys
+        self.row_numbers = numbers
+        self.groups = groups
+        self.order = order
+        self.dirty.clear()
+        self.layout_changed = True
+    
+    def update(self, engine, cells):
+        """Pasa a los grupos las celdas cambiadas de la hoja de origen (editadas
+        y sus dependientes): cada fila tocada sale de su grupo y vuelve a entrar"""
+        rows = {row for row, col in cells if col in self.columns}
+        if not rows:
+            return
+        if len(rows) > len(self.row_keys) * REBUILD_RATIO:
+            self.build(engine)
+            return
+        for row in sorted(rows):
+            self.remove_row(row)
+            self.add_row(engine, row)
+    
+    def remove_row(self, row):
+        if row >= len(self.row_keys) or self.row_keys[row] is None:
+            return
+        key = self.row_keys[row]
+        totals = self.groups[key]
+        totals[0] -= 1
+        if totals[0] == 0:
+            del self.groups[key]
+            del self.order[key]
+            self.dirty.discard(key)
+            self.layout_changed = True
+            return
+        for i, numbers in enumerate(self.row_numbers):
+            value = numbers[row]
+            if value == value:
+                base = 3 * i + 1
+                accumulate(totals, base, -value, -1)
+                if totals[base + 2] == 0:
+                    totals[base] = totals[base + 1] = 0.0
+        self.dirty.add(key)
+    
+    def add_row(self, engine, row):
+        size = len(self.row_keys)
+        if row >= size:
+            self.row_keys.extend([None] * (row + 1 - size))
+            for numbers in self.row_numbers:
+                numbers.extend(array("d", [NAN]) * (row + 1 - size))
+        
+        key = tuple(key_texts(engine, col, row, row)[0] for col in self.keys)
+        values = [measure_numbers(engine, col, row, row)[0] for col in self.value_cols]
+        for numbers, value in zip(self.row_numbers, values):
+            numbers[row] = value
+        if not any(key):
+            self.row_keys[row] = None
+            return
+        self.row_keys[row] = key
+        
+        totals = self.groups.get(key)
+        if totals is None:
+            totals = self.groups[key] = [0] + [0.0, 0.0, 0] * len(values)
+            self.order[key] = self.order_key(engine, row)
+            self.layout_changed = True
+        totals[0] += 1
+        for i, value in enumerate(values):
+            if value == value:
+                accumulate(totals, 3 * i + 1, value)
+        self.dirty.add(key)
+    
+    def order_key(self, engine, row):
+        """Orden de los grupos como al ordenar la hoja: números y fechas, textos,
+        errores y al final los vacíos"""
+        return tuple(cell_key(engine, row, col) for col in self.keys)
+    
+    def header(self):
+        titles = [column_letter(col) for col in self.keys]
+        titles.extend(f"{TITLES[function]} de {column_letter(col)}" for col, function in self.measures)
+        return titles
+    
+    def summary(self, key):
+        """Textos de los resúmenes de un grupo (sumas con el formato de su columna)"""
+        totals = self.groups[key]
+        texts = []
+        for (_, function), slot in zip(self.measures, self.slots):
+            base = 3 * slot + 1
+            # Redondeo: 0.1 + 0.2 se escribe 0.3
+            total, count = round(totals[base] + totals[base + 1], 10), totals[base + 2]
+            if function == "sum":
+                texts.append(self.formats[slot](total))
+            elif function == "count":
+                texts.append(str(count))
+            else:
+                texts.append(format_number(round(total / count, 10)) if count else "#DIV/0!")
+        return texts
+    
+    def write(self, engine):
+        """Lleva a la hoja de `engine` (la de la tabla) lo que cambió desde la
+        última vez: toda la tabla si aparecieron o desaparecieron grupos, si
+        no solo los resúmenes de los grupos modificados. Devuelve las celdas
+        a refrescar."""
+        if self.layout_changed:
+            keys = sorted(self.groups, key=self.order.__getitem__)
+            self.positions = {key: row for row, key in enumerate(keys, 1)}
+            rows = [self.header()]
+            rows.extend(list(key) + self.summary(key) for key in keys)
+            # Las filas que sobran de la vez anterior quedan vacías
+            width = len(rows[0])
+            rows.extend([""] * width for _ in range(self.written - len(rows)))
+            self.written = len(keys) + 1
+            changed = engine.set_range(0, 0, rows)
+        else:
+            first = len(self.keys)
+            cells = [
+                (self.positions[key], col, text)
+                for key in self.dirty
+                for col, text in enumerate(self.summary(key), first)
+            ]
+            changed = engine.set_cells(cells)
+        self.dirty.clear()
+        self.layout_changed = False
+        return changed
@@ -0,0 +1,115 @@
+import csv
+import io
+import re
+
+from formula_engine import shift_formula
+from sheet_model import format_number
+
+
+# Texto que termina en número: "Semana 1", "F-0007"
+NUMBERED_RE = re.compile(r"(.*?)(\d+)")
+
+# Líneas que se miran para adivinar el separador de un bloque copiado
+SAMPLE_LINES = 20
+
+
+def guess_delimiter(lines):
+    """Tabulador si aparece (lo que copia otra hoja de cálculo); si no, ";" o ","
+    cuando todas las líneas tienen la misma cantidad de campos (sin contar los
+    separadores entre comillas). Sin separador, una columna."""
+    if any("\t" in line for line in lines):
+        return "\t"
+    for delimiter in (";", ","):
+        counts = {len(fields) for fields in csv.reader(lines, delimiter=delimiter)}
+        if len(counts) == 1 and 1 not in counts:
+            return delimiter
+    return "\t"
+
+
+def parse_clipboard(text):
+    """Filas de celdas de un bloque copiado como TSV o CSV"""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if text.endswith("\n"):
+        text = text[:-1]
+    if not text:
+        return []
+    delimiter = guess_delimiter(text.split("\n", SAMPLE_LINES)[:SAMPLE_LINES])
+    return list(csv.reader(io.StringIO(text), delimiter=delimiter))
+
+
+def number_format(sheet, col):
+    """Cómo se escriben los números de la columna (con su tipo, si lo tiene)"""
+    column_type = getattr(sheet.column(col), "column_type", None)
+    return format_number if column_type is None else column_type.format
+
+
+def extend_line(sheet, cells, count, down, series=True):
+    """`count` textos que siguen a las celdas `cells` (de una columna hacia
+    abajo o de una fila a la derecha).
+    
+    Con `series`, dos o más números siguen la progresión aritmética y los
+    textos numerados ("Semana 1") cuentan de a uno o con el paso de los
+    ejemplos; el resto se repite en ciclo, con las fórmulas corridas.
+    """
+    seeds = [sheet.get(*cell) for cell in cells]
+    size = len(seeds)
+    if series:
+        numbers = [sheet.number(*cell) for cell in cells]
+        if size > 1 and None not in numbers:
+            step = (numbers[-1] - numbers[0]) / (size - 1)
+            render = number_format(sheet, cells[-1][1])
+            # Redondeo: 0.1 + 0.2 se escribe 0.3
+            return [render(round(numbers[-1] + step * k, 10)) for k in range(1, count + 1)]
+        
+        matches = [NUMBERED_RE.fullmatch(text) for text in seeds]
+        if all(matches) and len({match.group(1) for match in matches}) == 1:
+            first, last = int(matches[0].group(2)), int(matches[-1].group(2))
+            step = 1 if size == 1 else (last - first) // (size - 1)
+            if size == 1 or first + step * (size - 1) == last:
+                prefix, width = matches[-1].group(1), len(matches[-1].group(2))
+                return [f"{prefix}{max(0, last + step * k):0{width}d}" for k in range(1, count + 1)]
+    
+    values = []
+    for k in range(count):
+        seed = k % size
+        text = seeds[seed]
+        if text.startswith("="):
+            # Distancia de la celda nueva a la de su ejemplo
+            distance = size + k - seed
+            text = shift_formula(text, distance, 0) if down else shift_formula(text, 0, distance)
+        values.append(text)
+    return values
+
+
+def extend_area(sheet, source, target, series=True):
+    """Bloque (fila, col, filas de textos) que extiende las celdas de `source`
+    hasta cubrir `target`, hacia abajo o hacia la derecha (ver `extend_line`)"""
+    if (target.r0, target.c0, target.c1) == (source.r0, source.c0, source.c1) and target.r1 >= source.r1:
+        count = target.r1 - source.r1
+        lines = [
+            extend_line(sheet, [(row, col) for row in range(source.r0, source.r1 + 1)], count, True, series)
+            for col in range(source.c0, source.c1 + 1)
+        ]
+        return source.r1 + 1, source.c0, [list(values) for values in zip(*lines)]
+    if (target.c0, target.r0, target.r1) == (source.c0, source.r0, source.r1) and target.c1 >= source.c1:
+        count = target.c1 - source.c1
+        rows = [
+            extend_line(sheet, [(row, col) for col in range(source.c0, source.c1 + 1)], count, False, series)
+            for row in range(source.r0, source.r1 + 1)
+        ]
+        return source.r0, source.c1 + 1, rows
+    raise ValueError("El área a rellenar debe seguir a las celdas de origen hacia abajo o a la derecha")
+
+
+def series_source(sheet, area):
+    """Celdas de origen de una serie sobre `area`: las primeras con valor de su
+    primera columna (hacia abajo) o, si el área es una fila, de su primera fila"""
+    if area.r1 > area.r0:
+        row = area.r0
+        while row < area.r1 and sheet.get(row + 1, area.c0) != "":
+            row += 1
+        return area._replace(r1=row)
+    col = area.c0
+    while col < area.c1 and sheet.get(area.r0, col + 1) != "":
+        col += 1
+    return area._replace(c1=col)
@@ -0,0 +1,150 @@
+import heapq
+import re
+from bisect import bisect_left, bisect_right, insort
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokens(text):
+    """Palabras de un texto en minúsculas ("Caja chica 2024" -> caja, chica, 2024)"""
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class SearchIndex:
+    """Índice invertido palabra -> celdas sobre el texto de las celdas (lo que
+    se escribió, no el resultado de las fórmulas).
+    
+    Se construye por columnas a pedido (`index_column`) y se mantiene al día
+    con `update` en cada edición. Una búsqueda encuentra el texto a partir del
+    comienzo de una palabra: "caj" encuentra "Caja chica" pero "aja" no.
+    """
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.reset()
+    
+    def reset(self):
+        """El contenido de la hoja se reemplazó: el índice se vuelve a construir"""
+        self.postings = {}
+        self.words = []
+        self.columns = set()
+    
+    def missing_columns(self):
+        """Columnas con datos que aún no están en el índice"""
+        return [
+            col for col, column in enumerate(self.engine.sheet.columns)
+            if column is not None and col not in self.columns
+        ]
+    
+    def index_column(self, col):
+        column = self.engine.sheet.column(col)
+        new_words = []
+        if column is not None:
+            for row, text in column.items():
+                for word in tokens(text):
+                    cells = self.postings.get(word)
+                    if cells is None:
+                        cells = self.postings[word] = set()
+                        new_words.append(word)
+                    cells.add((row, col))
+        self.columns.add(col)
+        if len(new_words) > 64:
+            self.words = sorted(self.words + new_words)
+        else:
+            for word in new_words:
+                insort(self.words, word)
+    
+    def ensure(self):
+        """Indexa todas las columnas que faltan"""
+        for col in self.missing_columns():
+            self.index_column(col)
+    
+    def update(self, row, col, old, new):
+        """Cambia el texto indexado de una celda (si su columna ya está indexada)"""
+        if col not in self.columns:
+            return
+        cell = (row, col)
+        old_words, new_words = tokens(old), tokens(new)
+        for word in old_words - new_words:
+            cells = self.postings[word]
+            cells.discard(cell)
+            if not cells:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+        for word in new_words - old_words:
+            cells = self.postings.get(word)
+            if cells is None:
+                cells = self.postings[word] = set()
+                insort(self.words, word)
+            cells.add(cell)
+    
+    def prefixed(self, prefix):
+        """Palabras del índice que empiezan con `prefix`"""
+        start = bisect_left(self.words, prefix)
+        end = bisect_right(self.words, prefix + "\U0010ffff", start)
+        return self.words[start:end]
+    
+    def candidates(self, query):
+        """Celdas que tienen todas las palabras de la búsqueda, o None si la
+        búsqueda no tiene palabras (hay que recorrer la hoja)"""
+        query = query.lower()
+        matches = list(TOKEN_RE.finditer(query))
+        if not matches:
+            return None
+        
+        groups = []
+        for match in matches:
+            if match.end() == len(query):
+                # La última palabra puede estar incompleta: se busca como prefijo
+                cells = set()
+                for word in self.prefixed(match.group()):
+                    cells |= self.postings[word]
+                groups.append(cells)
+            else:
+                groups.append(self.postings.get(match.group(), set()))
+        groups.sort(key=len)
+        result = set(groups[0])
+        for cells in groups[1:]:
+            result &= cells
+        return result
+    
+    def find(self, query, after=None):
+        """Celdas cuyo texto contiene `query` (sin distinguir mayúsculas), por
+        filas y de izquierda a derecha, empezando después de la celda `after`
+        y volviendo al principio.
+        
+        Es un generador: la primera coincidencia sale sin ordenar las demás.
+        """
+        needle = query.lower()
+        if not needle:
+            return
+        sheet = self.engine.sheet
+        cells = self.candidates(query)
+        if cells is None:
+            cells = [(row, col) for row, col, text in sheet.iter_cells() if needle in text.lower()]
+        
+        later, earlier = [], []
+        for cell in cells:
+            (later if after is None or cell > after else earlier).append(cell)
+        for part in (later, earlier):
+            heapq.heapify(part)
+            while part:
+                row, col = heapq.heappop(part)
+                if needle in sheet.get(row, col).lower():
+                    yield row, col
+    
+    def find_next(self, query, after=None):
+        """Siguiente coincidencia después de la celda `after`, o None"""
+        return next(self.find(query, after), None)
+    
+    def replacements(self, query, replacement):
+        """Cambios (fila, col, antes, después) de reemplazar `query` en todas
+        las celdas, sin aplicarlos"""
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+        sheet = self.engine.sheet
+        changes = []
+        for row, col in self.find(query):
+            old = sheet.get(row, col)
+            changes.append((row, col, old, pattern.sub(lambda match: replacement, old)))
+        return changes
@@ -0,0 +1,555 @@
+import os
+import threading
+
+from addressing import Area, column_letter
+from autosave import UNTITLED, Autosave, discard_recovery, load_recovery
+from column_types import pack_typed_columns
+from formula_engine import FormulaEngine
+from journal import replay
+from parallel_recalc import ParallelRecalc
+from pivot import PivotTable
+from range_edit import extend_area, parse_clipboard, series_source
+from search_index import SearchIndex
+from sheet_model import Sheet
+from undo_history import UndoHistory, sheet_state
+from workbook import Workbook, WorkbookSheet, sheet_name
+from workbook_format import (
+    adopt_saved,
+    is_same_file,
+    mapped_source,
+    open_workbook,
+    snapshot_sheet,
+    workbook_tabs,
+)
+
+
+# Tamaño de una hoja nueva
+NUM_ROWS = 20
+NUM_COLS = 10
+
+
+def start_thread(fn, *args):
+    threading.Thread(target=fn, args=args, daemon=True).start()
+
+
+class SheetDocument:
+    """Documento sin interfaz: hoja, fórmulas, historial, índice de búsqueda y
+    diario de recuperación. Las tres aplicaciones Flet solo muestran lo que
+    devuelven estos métodos, y los benchmarks los miden sin abrir ventanas.
+    
+    Los métodos toman `lock` (la hoja se edita desde la interfaz y desde los
+    hilos de carga y guardado). El diario empieza con `recover_untitled` o al
+    abrir un archivo; los puntos de control se lanzan con `run_thread` y sus
+    errores van a `on_error`. `on_reset` se llama, con el candado tomado,
+    cada vez que cambia toda la hoja.
+    
+    Los recálculos completos de hojas con muchas fórmulas se reparten en
+    `workers` procesos (por defecto uno por núcleo; 1 los hace en serie),
+    que se detienen con `close`.
+    
+    El documento es un libro con varias hojas (`workbook`): `sheet`, el
+    motor, el historial y el diario son siempre los de la hoja activa. Las
+    hojas que no entran en memoria bajan a disco con `run_thread`.
+    """
+    
+    def __init__(self, run_thread=start_thread, on_error=None, on_reset=None, workers=None):
+        self.sheet = Sheet(num_rows=NUM_ROWS, num_cols=NUM_COLS)
+        self.engine = FormulaEngine(self.sheet)
+        self.engine.parallel = ParallelRecalc(workers)
+        self.lock = threading.Lock()
+        self.autosave = Autosave(self.lock)
+        self.history = UndoHistory()
+        self.search = SearchIndex(self.engine)
+        self.run_thread = run_thread
+        self.on_error = on_error
+        self.on_reset = on_reset
+        
+        self.workbook = Workbook()
+        self.workbook.add(WorkbookSheet(self.workbook.unique_name(), self.engine.state(), self.history, self.autosave))
+        self.workbook.touch(self.workbook.current)
+    
+    def close(self):
+        """Al cerrar la ventana: detiene los procesos del recálculo en paralelo"""
+        self.engine.parallel.close()
+    
+    def headers(self, num_cols):
+        return [column_letter(col) for col in range(num_cols)]
+    
+    def replaced(self):
+        """Cambió toda la hoja (con el candado tomado): los índices se descartan"""
+        self.search.reset()
+        if self.on_reset is not None:
+            self.on_reset()
+    
+    def sheet_names(self):
+        with self.lock:
+            return self.workbook.names()
+    
+    def active_sheet(self):
+        with self.lock:
+            return self.workbook.active
+    
+    def add_sheet(self, name=None):
+        """Agrega una hoja vacía al final del libro y pasa a ella; devuelve su índice"""
+        with self.lock:
+            entry = WorkbookSheet(self.workbook.unique_name(name), None, UndoHistory(), Autosave(self.lock))
+            index = self.workbook.add(entry)
+            self.stash()
+            self.engine.load(Sheet(num_rows=NUM_ROWS, num_cols=NUM_COLS))
+            spills = self.activate(index)
+        self.park(spills)
+        return index
+    
+    def switch_sheet(self, index):
+        """Pasa a la hoja `index` del libro. Una hoja residente vuelve tal cual
+        (sin recalcular); una guardada en disco se mapea y se calculan solo sus
+        fórmulas. Las demás hojas no se tocan."""
+        with self.lock:
+            if index == self.workbook.active:
+                return
+            self.stash()
+            entry = self.workbook.sheets[index]
+            if entry.resident:
+                self.engine.restore(entry.state)
+            else:
+                sheet, formulas = self.workbook.load(entry)
+                self.engine.load(sheet, formulas)
+            spills = self.activate(index)
+        self.park(spills)
+    
+    def add_pivot(self, keys, measures, name=None):
+        """Agrega una hoja con la tabla dinámica de la hoja activa (ver
+        `pivot.PivotTable`) y pasa a ella; devuelve su índice. La tabla sigue
+        las ediciones de la hoja de origen."""
+        with self.lock:
+            source = self.workbook.current
+            pivot = PivotTable(source, keys, measures)
+            pivot.build(self.engine)
+            name = self.workbook.unique_name(name or f"Resumen {source.name}")
+            entry = WorkbookSheet(name, None, UndoHistory(), Autosave(self.lock))
+            entry.pivot = pivot
+            index = self.workbook.add(entry)
+            self.stash()
+            self.engine.load(Sheet(num_rows=NUM_ROWS, num_cols=NUM_COLS))
+            spills = self.activate(index)
+        self.park(spills)
+        return index
+    
+    def update_pivots(self, changed=None):
+        """Pasa las celdas cambiadas a las tablas dinámicas de la hoja activa
+        (con el candado tomado); sin `changed`, cambió toda la hoja"""
+        current = self.workbook.current
+        for entry in self.workbook.sheets:
+            pivot = entry.pivot
+            if pivot is not None and pivot.source is current:
+                if changed is None:
+                    pivot.build(self.engine)
+                else:
+                    pivot.update(self.engine, changed)
+    
+    def rename_sheet(self, index, name):
+        with self.lock:
+            self.workbook.rename(index, name)
+    
+    def stash(self):
+        """Aparta en su pestaña el estado de la hoja activa (con el candado tomado)"""
+        entry = self.workbook.current
+        entry.state = self.engine.state()
+        entry.history = self.history
+        entry.autosave = self.autosave
+    
+    def activate(self, index):
+        """La hoja del motor pasa a ser la de la pestaña `index` (con el candado
+        tomado); devuelve las pestañas que hay que bajar a disco con `park`"""
+        self.workbook.active = index
+        entry = self.workbook.current
+        if entry.pivot is not None and entry.pivot.pending:
+            # La tabla se pone al día al mostrarla; lo que se deshacía ya no vale
+            entry.pivot.write(self.engine)
+            entry.history.clear()
+        entry.state = self.engine.state()
+        self.sheet = self.engine.sheet
+        self.history = entry.history
+        self.autosave = entry.autosave
+        self.replaced()
+        # La menos usada puede ir a disco: nunca es esta, que acaba de usarse
+        return self.workbook.touch(entry)
+    
+    def park(self, spills):
+        """Baja a disco en segundo plano las pestañas de `activate` (sin el candado)"""
+        for spill in spills:
+            self.run_thread(self.park_sheet, spill)
+    
+    def park_sheet(self, spill):
+        try:
+            self.workbook.park(spill, self.lock)
+        except Exception as ex:
+            # La hoja sigue en memoria: no se pierde nada
+            if self.on_error is None:
+                raise
+            self.on_error(ex)
+    
+    def set_cell(self, row, col, text, merge=False):
+        """Guarda el texto de una celda; devuelve las celdas a refrescar (ella y
+        sus dependientes). Con `merge` las ediciones seguidas de la celda (cada
+        tecla) son una sola entrada del historial."""
+        with self.lock:
+            old = self.sheet.get(row, col)
+            changed = self.engine.set_cell(row, col, text)
+            self.search.update(row, col, old, text)
+            self.log_edit(row, col, text)
+            self.history.record("Editar celda", [(row, col, old, text)], merge=merge)
+            self.update_pivots(changed)
+        return changed
+    
+    def apply_changes(self, label, changes):
+        """Aplica cambios (fila, col, antes, después) con un solo recálculo y una
+        sola entrada del historial (con el candado tomado)"""
+        changed = self.engine.set_cells([(row, col, new) for row, col, _, new in changes])
+        self.record_changes(label, changes)
+        self.update_pivots(changed)
+        return changed
+    
+    def record_changes(self, label, changes):
+        """Índice de búsqueda, diario e historial de cambios ya escritos en la
+        hoja (con el candado tomado); el diario los recibe en una sola escritura"""
+        for row, col, old, new in changes:
+            self.search.update(row, col, old, new)
+        if self.autosave.log_cells((row, col, new) for row, col, _, new in changes):
+            self.run_thread(self.checkpoint, self.autosave)
+        self.history.record(label, changes)
+    
+    def write_range(self, row, col, rows, label="Pegar"):
+        """Escribe un bloque de textos desde (row, col) como un solo cambio: una
+        escritura por columna, un recálculo y una entrada del historial. Las
+        filas cortas se completan con celdas vacías. Devuelve las celdas a refrescar."""
+        with self.lock:
+            return self.write_block(row, col, rows, label)
+    
+    def write_block(self, row, col, rows, label):
+        """`write_range` con el candado tomado"""
+        width = max(map(len, rows), default=0)
+        if width == 0:
+            return set()
+        rows = [texts if len(texts) == width else list(texts) + [""] * (width - len(texts)) for texts in rows]
+        stop = row + len(rows)
+        changes = []
+        for offset in range(width):
+            c = col + offset
+            column = self.sheet.column(c)
+            old = column.slice(row, stop) if column is not None else [""] * len(rows)
+            changes.extend(
+                (r, c, before, texts[offset]) for r, before, texts in zip(range(row, stop), old, rows)
+            )
+        changed = self.engine.set_range(row, col, rows)
+        self.record_changes(label, changes)
+        self.update_pivots(changed)
+        return changed
+    
+    def paste(self, row, col, text):
+        """Pega desde (row, col) un bloque copiado como TSV o CSV; devuelve (área
+        pegada o None si no había nada, celdas a refrescar)"""
+        rows = parse_clipboard(text)
+        if not rows:
+            return None, set()
+        width = max(map(len, rows))
+        changed = self.write_range(row, col, rows, "Pegar")
+        return Area(row, col, row + len(rows) - 1, col + width - 1), changed
+    
+    def fill_down(self, area):
+        """Copia la primera fila del área en las demás (las fórmulas corren sus
+        referencias relativas); devuelve las celdas a refrescar"""
+        return self.autofill(area._replace(r1=area.r0), area, "Rellenar hacia abajo", series=False)
+    
+    def fill_right(self, area):
+        """Copia la primera columna del área en las demás"""
+        return self.autofill(area._replace(c1=area.c0), area, "Rellenar hacia la derecha", series=False)
+    
+    def fill_series(self, area):
+        """Continúa en el área la serie de sus primeras celdas con valor (ver
+        `range_edit.series_source`)"""
+        with self.lock:
+            area = self.fill_target(area)
+            return self.autofill_locked(series_source(self.sheet, area), area, "Serie", True)
+    
+    def autofill(self, source, target, label="Autorrellenar", series=True):
+        """Extiende las celdas de `source` hasta cubrir `target`, hacia abajo o a
+        la derecha (ValueError si no lo continúa); devuelve las celdas a refrescar"""
+        with self.lock:
+            return self.autofill_locked(source, self.fill_target(target), label, series)
+    
+    def fill_target(self, area):
+        """Una columna completa (A:A) se rellena solo hasta el final de la hoja"""
+        return area.clip(self.sheet.num_rows) if area.whole_columns else area
+    
+    def autofill_locked(self, source, target, label, series):
+        row, col, rows = extend_area(self.sheet, source, target, series)
+        return self.write_block(row, col, rows, label)
+    
+    def clear(self):
+        with self.lock:
+            state = sheet_state(self.sheet)
+            self.engine.clear()
+            self.replaced()
+            self.update_pivots()
+            self.autosave.log_clear()
+            self.history.record_sheet("Limpiar todo", state)
+    
+    def undo(self):
+        """Deshace el último cambio; devuelve (entrada, celdas afectadas o None
+        si cambió toda la hoja), o None si no había nada"""
+        return self.move(self.history.undo)
+    
+    def redo(self):
+        return self.move(self.history.redo)
+    
+    def move(self, move):
+        with self.lock:
+            result = move(self.engine)
+            if result is None:
+                return None
+            entry, changed = result
+            self.update_pivots(changed)
+            if changed is None:
+                self.replaced()
+                if self.autosave.log_sheet(self.sheet):
+                    self.run_thread(self.checkpoint, self.autosave)
+            else:
+                texts = []
+                for row, col, old, new in entry.changes:
+                    text = self.sheet.get(row, col)
+                    self.search.update(row, col, new if text == old else old, text)
+                    texts.append((row, col, text))
+                if self.autosave.log_cells(texts):
+                    self.run_thread(self.checkpoint, self.autosave)
+        return result
+    
+    def index_search(self, cancelled=None):
+        """Indexa para buscar las columnas que falten, una por vez para no frenar
+        la edición. Devuelve False si `cancelled()` lo interrumpe."""
+        with self.lock:
+            missing = self.search.missing_columns()
+        for col in missing:
+            if cancelled is not None and cancelled():
+                return False
+            with self.lock:
+                if col not in self.search.columns:
+                    self.search.index_column(col)
+        return True
+    
+    def replace_all(self, query, replacement):
+        """Reemplaza `query` en todas las celdas como un solo cambio; devuelve
+        (celdas reemplazadas, celdas a refrescar)"""
+        self.index_search()
+        with self.lock:
+            changes = self.search.replacements(query, replacement)
+            changed = self.apply_changes("Reemplazar", changes)
+        return len(changes), changed
+    
+    def recover_untitled(self):
+        """Recupera lo que una hoja nueva dejó sin guardar (cierre inesperado) y
+        empieza a registrar sus ediciones; devuelve las ediciones recuperadas"""
+        sheet, formulas, records = load_recovery(UNTITLED)
+        with self.lock:
+            if sheet is not None or records:
+                if sheet is None:
+                    sheet = Sheet(num_rows=NUM_ROWS, num_cols=NUM_COLS)
+                formulas = replay(records, sheet, formulas)
+                self.sheet = self.engine.sheet = sheet
+                self.engine.recalculate_all(formulas)
+                self.replaced()
+            self.autosave.attach(UNTITLED)
+        return len(records)
+    
+    def load_csv(self, importer, on_chunk=None):
+        """Lee el CSV de `importer` por bloques (omitiendo encabezados) y reaplica
+        lo que haya quedado sin guardar de ese archivo.
+        
+        Devuelve (completo, ediciones recuperadas); si se canceló la hoja
+        parcial sigue como documento nuevo.
+        """
+        filename = importer.path
+        # Un punto de control más nuevo que el CSV ya contiene su contenido
+        base, formulas, records = load_recovery(filename)
+        # Los procesos del recálculo arrancan antes de tomar el candado (cada
+        # fórmula ocupa al menos 4 bytes del archivo, "=A1,")
+        self.engine.parallel.warm(len(formulas) if base is not None else importer.total_bytes // 4)
+        
+        with self.lock:
+            # La carga masiva no pasa por el diario
+            previous = self.autosave.document
+            self.autosave.detach()
+            size = (self.sheet.num_rows, self.sheet.num_cols)
+            # Deshacer la carga devuelve el contenido anterior sin copiarlo
+            self.history.record_sheet("Cargar CSV", sheet_state(self.sheet))
+            # Vaciar también el grafo de fórmulas: la primera pantalla y las
+            # ediciones durante la carga no deben ver resultados de la hoja anterior
+            self.engine.clear()
+            if base is not None:
+                self.sheet = self.engine.sheet = base
+            else:
+                self.sheet.num_rows = self.sheet.num_cols = 0
+            self.replaced()
+        completed = True
+        if base is None:
+            completed = importer.run(self.sheet, on_chunk=on_chunk, lock=self.lock)
+        
+        with self.lock:
+            # Archivo sin datos: se conserva el tamaño de la hoja
+            if self.sheet.num_rows == 0:
+                self.sheet.num_rows, self.sheet.num_cols = size
+            cells = replay(records, self.sheet, formulas)
+            # Columnas numéricas, de moneda o fecha: arrays empaquetados
+            pack_typed_columns(self.sheet)
+            # Las fórmulas del CSV no están indexadas: hay que recorrer la hoja
+            self.engine.recalculate_all(cells if base is not None else None)
+            self.replaced()
+            self.update_pivots()
+            if completed:
+                self.workbook.rename(self.workbook.active, sheet_name(filename))
+                self.autosave.open(filename, previous)
+            else:
+                # Hoja parcial: sigue como documento nuevo, con su propio punto de control
+                self.autosave.attach(UNTITLED, keep=False)
+                self.autosave.checkpoint_pending = True
+                if previous not in (None, UNTITLED):
+                    discard_recovery(previous)
+        if not completed:
+            self.run_thread(self.checkpoint)
+        return completed, len(records)
+    
+    def save_csv(self, exporter, on_chunk=None):
+        """Escribe una instantánea de la hoja activa (un CSV tiene una sola) al
+        CSV de `exporter` sin bloquear la edición; devuelve False si se canceló"""
+        with self.autosave.write_lock:
+            # Instantánea consistente: lo que se edite durante el guardado no se mezcla
+            with self.lock:
+                snapshot = self.sheet.copy()
+                mark = self.autosave.mark()
+            
+            if not exporter.run(snapshot, self.headers(snapshot.num_cols), on_chunk=on_chunk):
+                return False
+            with self.lock:
+                self.autosave.saved(exporter.path, mark)
+            return True
+    
+    def save_workbook(self, task, on_chunk=None):
+        """Guarda el libro con todas sus pestañas en el archivo nativo de `task`;
+        si las hojas se abrieron de ese archivo solo se agregan los bloques
+        modificados. Devuelve False si se canceló."""
+        autosave = self.autosave
+        with autosave.write_lock:
+            # Instantánea consistente: copiar solo duplica los bloques modificados
+            with self.lock:
+                snapshot, origin = snapshot_sheet(self.sheet)
+                formulas = list(self.engine.formulas)
+                mark = autosave.mark()
+                tabs, copies, parked = self.tab_snapshots(snapshot, origin, formulas)
+            
+            # Las pestañas en disco se mapean sin el candado: sus archivos no cambian
+            sources = [mapped_source(sheet) for _, sheet, _ in tabs if sheet is not None]
+            shared = next((source for source in sources if is_same_file(source, task.path)), None)
+            for position, entry, path, tab in parked:
+                sheet, cells = open_workbook(path, tab, shared if is_same_file(shared, path) else None)
+                tabs[position] = (tabs[position][0], sheet, [(row, col) for row, col, _ in cells])
+            
+            if not task.save(snapshot, formulas, on_chunk=on_chunk, tabs=tabs if len(tabs) > 1 else []):
+                return False
+            with self.lock:
+                for live, copy, copy_origin in copies:
+                    adopt_saved(live, copy, copy_origin)
+                for position, entry, path, tab in parked:
+                    # Sin tocar desde la copia: ahora se lee del libro guardado
+                    if entry.state is None and (entry.path, entry.tab) == (path, tab):
+                        entry.path, entry.tab = task.path, position
+                # Un solo diario por archivo: el de la pestaña que queda activa en él
+                for entry in self.workbook.sheets:
+                    if entry.autosave is not autosave and entry.autosave.document == task.path:
+                        entry.autosave.detach()
+                autosave.saved(task.path, mark)
+            return True
+    
+    def tab_snapshots(self, snapshot, origin, formulas):
+        """Pestañas del libro para `save_workbook` (con el candado tomado).
+        
+        Devuelve las pestañas [(nombre, copia de la hoja, celdas con fórmula)],
+        con la activa en `snapshot`; las copias para `adopt_saved`, [(hoja,
+        copia, origen)]; y las pestañas en disco, [(posición, pestaña, archivo,
+        pestaña en el archivo)], cuya hoja queda en None hasta mapearla.
+        """
+        tabs, copies, parked = [], [(self.sheet, snapshot, origin)], []
+        for position, entry in enumerate(self.workbook.sheets):
+            if entry is self.workbook.current:
+                tabs.append((entry.name, snapshot, formulas))
+            elif entry.resident:
+                sheet, cells = entry.state[:2]
+                copy, copy_origin = snapshot_sheet(sheet)
+                tabs.append((entry.name, copy, list(cells)))
+                copies.append((sheet, copy, copy_origin))
+            else:
+                tabs.append((entry.name, None, None))
+                parked.append((position, entry, entry.path, entry.tab))
+        return tabs, copies, parked
+    
+    def open_workbook(self, task):
+        """Mapea el libro de `task` sin decodificarlo (solo se leen los bloques
+        que se muestran) en la hoja activa y reaplica las ediciones del diario
+        posteriores al último guardado; sus otras pestañas se agregan y esperan
+        en el archivo. Devuelve las ediciones recuperadas, o None si se canceló."""
+        filename = task.path
+        # La hoja nueva no es visible hasta el cambio final: no hace falta el candado
+        sheet, formulas, records = load_recovery(filename)
+        if sheet is None:
+            sheet = Sheet(num_rows=NUM_ROWS, num_cols=NUM_COLS)
+        formulas = replay(records, sheet, formulas)
+        tabs = workbook_tabs(filename) if os.path.exists(filename) else None
+        self.engine.parallel.warm(len(formulas))
+        if task.cancelled:
+            return None
+        
+        with self.lock:
+            self.history.record_sheet("Abrir libro", sheet_state(self.sheet))
+            self.sheet = self.engine.sheet = sheet
+            self.engine.recalculate_all(formulas)
+            self.replaced()
+            self.update_pivots()
+            if tabs is None:
+                self.workbook.rename(self.workbook.active, sheet_name(filename))
+            else:
+                self.add_file_tabs(filename, *tabs)
+            # Lo recuperado queda en el diario hasta el próximo punto de control
+            self.autosave.open(filename, self.autosave.document)
+        return len(records)
+    
+    def add_file_tabs(self, filename, names, active):
+        """La hoja activa pasa a ser la pestaña `active` del libro `filename` y
+        las demás se agregan a su alrededor, en orden, esperando en el archivo
+        (con el candado tomado)"""
+        start = self.workbook.active
+        self.workbook.rename(start, names[active])
+        for position, name in enumerate(names):
+            if position != active:
+                entry = WorkbookSheet(self.workbook.unique_name(name), None, UndoHistory(), Autosave(self.lock))
+                entry.path, entry.tab = filename, position
+                self.workbook.insert(start + position, entry)
+    
+    def log_edit(self, row, col, text):
+        """Anota una edición en el diario (con el candado tomado)"""
+        if self.autosave.log(row, col, text):
+            self.run_thread(self.checkpoint, self.autosave)
+    
+    def checkpoint(self, autosave=None):
+        """Vuelca la hoja al punto de control sin bloquear la edición y recorta el
+        diario. `autosave` es el diario de la hoja que lo pidió: si mientras tanto
+        se pasó a otra hoja, el punto de control se vuelve a pedir con su próxima
+        edición."""
+        with self.lock:
+            if autosave is not None and autosave is not self.autosave:
+                autosave.checkpoint_pending = False
+                return
+        try:
+            self.autosave.checkpoint(self.engine)
+        except Exception as ex:
+            if self.on_error is None:
+                raise
+            self.on_error(ex)
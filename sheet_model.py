@@ -0,0 +1,413 @@
+import math
+from array import array
+
+
+NAN = float("nan")
+
+
+def format_number(value):
+    """Convierte un número a texto (3.0 -> "3", 0.5 -> "0.5")"""
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def parse_number(text):
+    """Convierte texto a número; devuelve None si no es numérico"""
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def update_numeric_view(view, row, value, parse=parse_number):
+    """Mantiene al día la vista numérica en caché de una columna de texto"""
+    if view is None:
+        return
+    if row >= len(view):
+        if value == "":
+            return
+        view.extend(array("d", [NAN]) * (row + 1 - len(view)))
+    number = parse(value)
+    view[row] = NAN if number is None else number
+
+
+class SparseColumn:
+    """Columna dispersa: solo guarda las filas que tienen valor"""
+    
+    kind = "sparse"
+    column_type = None
+    
+    def __init__(self):
+        self.values = {}
+        self.numeric_view = None
+        # Contador de cambios: dice si una copia de la columna sigue vigente
+        self.version = 0
+    
+    def get(self, row):
+        return self.values.get(row, "")
+    
+    def number(self, row):
+        return parse_number(self.values.get(row))
+    
+    def set(self, row, value):
+        if value == "":
+            self.values.pop(row, None)
+        else:
+            self.values[row] = value
+        self.version += 1
+        update_numeric_view(self.numeric_view, row, value)
+    
+    def numbers(self):
+        """Vista numérica array('d') de la columna (NaN si no es número), en caché"""
+        if self.numeric_view is None:
+            size = max(self.values) + 1 if self.values else 0
+            self.numeric_view = array("d", [NAN]) * size
+            for row, value in self.values.items():
+                number = parse_number(value)
+                if number is not None:
+                    self.numeric_view[row] = number
+        return self.numeric_view
+    
+    def copy(self):
+        column = SparseColumn()
+        column.values = dict(self.values)
+        column.version = self.version
+        return column
+    
+    def count(self):
+        return len(self.values)
+    
+    def items(self):
+        """Celdas con valor como (fila, valor), ordenadas por fila"""
+        return sorted(self.values.items())
+    
+    def slice(self, start, stop):
+        values = [""] * (stop - start)
+        if len(self.values) < stop - start:
+            for row, value in self.values.items():
+                if start <= row < stop:
+                    values[row - start] = value
+        else:
+            get = self.values.get
+            for row in range(start, stop):
+                values[row - start] = get(row, "")
+        return values
+
+
+class DenseColumn:
+    """Columna densa: lista indexada por fila"""
+    
+    kind = "dense"
+    column_type = None
+    
+    def __init__(self, values=None):
+        self.values = values if values is not None else []
+        self.numeric_view = None
+        self.version = 0
+    
+    def get(self, row):
+        if 0 <= row < len(self.values):
+            return self.values[row]
+        return ""
+    
+    def number(self, row):
+        return parse_number(self.get(row))
+    
+    def set(self, row, value):
+        values = self.values
+        if row >= len(values):
+            if value == "":
+                return
+            values.extend([""] * (row + 1 - len(values)))
+        values[row] = value
+        self.version += 1
+        update_numeric_view(self.numeric_view, row, value)
+    
+    def numbers(self):
+        """Vista numérica array('d') de la columna (NaN si no es número), en caché"""
+        if self.numeric_view is None:
+            self.numeric_view = array(
+                "d", [NAN if number is None else number for number in map(parse_number, self.values)]
+            )
+        return self.numeric_view
+    
+    def extend(self, start, values):
+        """Escribe `values` a partir de la fila `start` (carga masiva)"""
+        if len(self.values) < start:
+            self.values.extend([""] * (start - len(self.values)))
+        self.values[start:start + len(values)] = values
+        self.version += 1
+        self.numeric_view = None
+    
+    def copy(self):
+        column = DenseColumn(list(self.values))
+        column.version = self.version
+        return column
+    
+    def count(self):
+        return len(self.values) - self.values.count("")
+    
+    def items(self):
+        return [(row, value) for row, value in enumerate(self.values) if value != ""]
+    
+    def slice(self, start, stop):
+        values = self.values[start:stop]
+        if len(values) < stop - start:
+            values.extend([""] * (stop - start - len(values)))
+        return values
+
+
+class NumericColumn:
+    """Columna numérica: array('d') empaquetado, NaN marca las celdas vacías.
+    
+    Los valores que no son números (o cuyo texto no se reproduce exactamente,
+    como "1.50") se guardan también en `text` para no perder nada.
+    `column_type` (ver column_types) lee y escribe los números con otro
+    formato, p. ej. "1.234,56" o una fecha.
+    """
+    
+    kind = "numeric"
+    
+    def __init__(self, values=None, column_type=None):
+        self.values = values if values is not None else array("d")
+        self.text = {}
+        self.column_type = column_type
+        self.version = 0
+    
+    def parse(self, text):
+        if self.column_type is not None:
+            return self.column_type.parse(text)
+        return parse_number(text)
+    
+    def format(self, number):
+        if self.column_type is not None:
+            return self.column_type.format(number)
+        return format_number(number)
+    
+    def get(self, row):
+        if self.text and row in self.text:
+            return self.text[row]
+        if 0 <= row < len(self.values):
+            value = self.values[row]
+            if value == value:
+                return self.format(value)
+        return ""
+    
+    def number(self, row):
+        if 0 <= row < len(self.values):
+            value = self.values[row]
+            if value == value:
+                return value
+        return None
+    
+    def set(self, row, value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            number, text = float(value), ""
+        else:
+            number = self.parse(value) if value != "" else None
+            text = "" if number is not None and self.format(number) == value else value
+        
+        values = self.values
+        if row >= len(values):
+            if value == "":
+                return
+            values.extend(array("d", [NAN]) * (row + 1 - len(values)))
+        
+        values[row] = NAN if number is None else number
+        self.version += 1
+        if text == "":
+            self.text.pop(row, None)
+        else:
+            self.text[row] = text
+    
+    def numbers(self):
+        return self.values
+    
+    def copy(self):
+        column = NumericColumn(array("d", self.values), self.column_type)
+        column.text = dict(self.text)
+        column.version = self.version
+        return column
+    
+    def count(self):
+        values = self.values
+        only_text = sum(1 for row in self.text if values[row] != values[row])
+        return sum(1 for value in values if value == value) + only_text
+    
+    def items(self):
+        return [(row, self.get(row)) for row in range(len(self.values)) if self.get(row) != ""]
+    
+    def slice(self, start, stop):
+        return [self.get(row) for row in range(start, stop)]
+
+
+class Sheet:
+    """Hoja con almacenamiento por columnas direccionado por (fila, col) enteros"""
+    
+    # Una columna dispersa pasa a densa cuando supera esta fracción de filas
+    DENSE_RATIO = 0.5
+    DENSE_MIN_ROWS = 64
+    
+    def __init__(self, num_rows=0, num_cols=0):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.columns = []
+    
+    def column(self, col, create=False):
+        """Devuelve la columna `col` (None si está vacía y no se pide crearla)"""
+        columns = self.columns
+        if 0 <= col < len(columns) and columns[col] is not None:
+            return columns[col]
+        if not create or col < 0:
+            return None
+        if col >= len(columns):
+            columns.extend([None] * (col + 1 - len(columns)))
+        columns[col] = SparseColumn()
+        return columns[col]
+    
+    def get(self, row, col):
+        columns = self.columns
+        if 0 <= col < len(columns):
+            column = columns[col]
+            if column is not None:
+                return column.get(row)
+        return ""
+    
+    def number(self, row, col):
+        """Valor numérico de la celda o None"""
+        column = self.column(col)
+        return column.number(row) if column is not None else None
+    
+    def numbers(self, col):
+        """Vista numérica array('d') de una columna (NaN = vacía o texto) o None"""
+        column = self.column(col)
+        return column.numbers() if column is not None else None
+    
+    def set(self, row, col, value):
+        column = self.column(col, create=value != "")
+        if column is None:
+            return
+        column.set(row, value)
+        
+        if value != "":
+            if row >= self.num_rows:
+                self.num_rows = row + 1
+            if col >= self.num_cols:
+                self.num_cols = col + 1
+            if column.kind == "sparse" and column.count() > self.DENSE_MIN_ROWS:
+                if column.count() > self.num_rows * self.DENSE_RATIO:
+                    self.make_dense(col)
+    
+    def make_dense(self, col):
+        """Convierte una columna dispersa (o vacía) en densa"""
+        column = self.column(col, create=True)
+        dense = DenseColumn()
+        for row, value in column.values.items():
+            dense.set(row, value)
+        self.columns[col] = dense
+        return dense
+    
+    def make_numeric(self, col, column_type=None):
+        """Convierte la columna a un array numérico empaquetado (con el formato
+        de `column_type`, si se indica)"""
+        column = self.column(col)
+        if column is not None and column.kind == "dense":
+            # Sin tipo, la vista numérica ya es el array; solo se guarda aparte
+            # el texto que no se reproduce al formatear el número
+            numeric = NumericColumn(column_type=column_type)
+            if column_type is not None:
+                numeric.values, numeric.text = column_type.pack(column.values)
+            else:
+                numeric.values = array("d", column.numbers())
+                numbers = numeric.values
+                for row, value in enumerate(column.values):
+                    if value != "":
+                        number = numbers[row]
+                        if number != number or format_number(number) != value:
+                            numeric.text[row] = value
+        else:
+            numeric = NumericColumn(column_type=column_type)
+            if column is not None:
+                for row, value in column.items():
+                    numeric.set(row, value)
+        if col >= len(self.columns):
+            self.columns.extend([None] * (col + 1 - len(self.columns)))
+        self.columns[col] = numeric
+        return numeric
+    
+    def append_rows(self, rows):
+        """Agrega un bloque de filas (listas de texto, pueden tener distinto largo)
+        al final de la hoja, escribiendo columna a columna"""
+        if not rows:
+            return
+        start = self.num_rows
+        width = max(map(len, rows))
+        for col in range(width):
+            values = [row[col] if col < len(row) else "" for row in rows]
+            column = self.column(col)
+            if column is None or column.kind == "sparse":
+                if column is None and not any(values):
+                    continue
+                column = self.make_dense(col)
+            if column.kind == "dense":
+                column.extend(start, values)
+            else:
+                for offset, value in enumerate(values):
+                    column.set(start + offset, value)
+        
+        self.num_rows = start + len(rows)
+        self.num_cols = max(self.num_cols, width)
+    
+    def write_block(self, row, col, rows):
+        """Escribe un bloque rectangular (filas de textos del mismo largo) desde
+        (row, col), una columna a la vez; como `set`, la hoja crece hasta el
+        bloque si escribe algún valor"""
+        if not rows or not rows[0]:
+            return
+        filled = False
+        for offset in range(len(rows[0])):
+            values = [texts[offset] for texts in rows]
+            has_values = any(values)
+            filled = filled or has_values
+            column = self.column(col + offset)
+            if column is None and not has_values:
+                continue
+            if column is None:
+                column = self.column(col + offset, create=True)
+            if column.kind == "sparse" and len(values) > self.DENSE_MIN_ROWS:
+                column = self.make_dense(col + offset)
+            if column.kind == "dense":
+                column.extend(row, values)
+            else:
+                for r, value in enumerate(values, row):
+                    column.set(r, value)
+        
+        if filled:
+            self.num_rows = max(self.num_rows, row + len(rows))
+            self.num_cols = max(self.num_cols, col + len(rows[0]))
+    
+    def add_rows(self, count=1):
+        self.num_rows += count
+    
+    def add_columns(self, count=1):
+        self.num_cols += count
+    
+    def clear(self):
+        """Borra todos los valores manteniendo el tamaño"""
+        self.columns = []
+    
+    def copy(self):
+        """Copia independiente de la hoja (instantánea para guardar en segundo plano)"""
+        sheet = Sheet(self.num_rows, self.num_cols)
+        sheet.columns = [column.copy() if column is not None else None for column in self.columns]
+        return sheet
+    
+    def iter_cells(self):
+        """Recorre las celdas con valor como (fila, col, valor)"""
+        for col, column in enumerate(self.columns):
+            if column is None:
+                continue
+            for row, value in column.items():
+                yield row, col, value
@@ -0,0 +1,48 @@
+import flet as ft
+from flet import Colors, Border
+
+
+class SheetTabs:
+    """Pestañas de las hojas del libro, debajo de la tabla como en Excel.
+    
+    Elegir una pestaña llama a `on_select(índice)` y el botón de hoja nueva a
+    `on_add()`; la aplicación cambia de hoja y vuelve a construir la tabla,
+    que rehace las pestañas con `build`.
+    """
+    
+    def __init__(self, doc, on_select, on_add):
+        self.doc = doc
+        self.on_select = on_select
+        self.on_add = on_add
+        self.row = ft.Row(spacing=2, scroll=ft.ScrollMode.AUTO)
+    
+    def build(self):
+        active = self.doc.active_sheet()
+        self.row.controls = [
+            self.tab(index, name, index == active)
+            for index, name in enumerate(self.doc.sheet_names())
+        ]
+        self.row.controls.append(ft.IconButton(
+            icon=ft.Icons.ADD,
+            icon_size=16,
+            tooltip="Nueva hoja",
+            on_click=self.add,
+        ))
+        return self.row
+    
+    def tab(self, index, name, active):
+        return ft.Container(
+            content=ft.Text(name, size=12, weight=ft.FontWeight.BOLD if active else None),
+            padding=ft.Padding.symmetric(horizontal=12, vertical=6),
+            bgcolor=Colors.WHITE if active else Colors.GREY_200,
+            border=Border.all(1, Colors.GREY_400),
+            data=index,
+            on_click=self.select,
+        )
+    
+    def select(self, e):
+        if e.control.data != self.doc.active_sheet():
+            self.on_select(e.control.data)
+    
+    def add(self, e):
+        self.on_add()
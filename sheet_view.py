@@ -0,0 +1,208 @@
+import re
+from bisect import bisect_left, insort
+
+from addressing import column_index
+from aggregates import CellRange, criteria_mask, parse_criteria
+from formula_engine import FormulaError
+
+
+# Orden como en Excel: números, textos, errores y al final las celdas vacías
+BLANK = (3, "")
+FIRST_BLANK = ((3,),)
+
+
+def cell_key(engine, row, col):
+    """Clave de orden del valor mostrado de una celda"""
+    if (row, col) in engine.formulas:
+        value = engine.values.get((row, col), "")
+        if isinstance(value, FormulaError):
+            return (2, value.code)
+        if isinstance(value, str):
+            return (1, value.lower()) if value != "" else BLANK
+        return (0, float(value))
+    number = engine.sheet.number(row, col)
+    if number is not None:
+        return (0, number)
+    text = engine.sheet.get(row, col)
+    return (1, text.lower()) if text != "" else BLANK
+
+
+class SortIndex:
+    """Filas de una columna ordenadas por valor, como lista de (clave, fila).
+    
+    Al editar una celda solo se quita y se vuelve a insertar su entrada
+    (búsqueda binaria), sin reordenar toda la columna.
+    """
+    
+    def __init__(self, engine, col, num_rows):
+        self.engine = engine
+        self.col = col
+        self.keys = [cell_key(engine, row, col) for row in range(num_rows)]
+        self.entries = sorted(zip(self.keys, range(num_rows)))
+    
+    def grow(self, num_rows):
+        """Agrega filas nuevas (vacías: van al final)"""
+        for row in range(len(self.keys), num_rows):
+            self.keys.append(BLANK)
+            self.entries.append((BLANK, row))
+    
+    def update(self, row):
+        self.grow(row + 1)
+        old = self.keys[row]
+        key = cell_key(self.engine, row, self.col)
+        if key == old:
+            return
+        del self.entries[bisect_left(self.entries, (old, row))]
+        insort(self.entries, (key, row))
+        self.keys[row] = key
+    
+    def rows(self, descending=False):
+        """Filas en orden; las vacías quedan al final también en orden descendente"""
+        if not descending:
+            return [row for _, row in self.entries]
+        blanks = bisect_left(self.entries, FIRST_BLANK)
+        rows = [row for _, row in reversed(self.entries[:blanks])]
+        rows.extend(row for _, row in self.entries[blanks:])
+        return rows
+
+
+class ColumnFilter:
+    """Criterio de filtro de una columna (">100", "caja*", "<>0", como en
+    SUMIF) con la máscara de filas que lo cumplen"""
+    
+    def __init__(self, engine, col, criteria, num_rows):
+        self.engine = engine
+        self.col = col
+        self.criteria = criteria
+        self.parsed = parse_criteria(criteria)
+        self.mask = bytearray(self.matches(0, num_rows - 1)) if num_rows else bytearray()
+    
+    def matches(self, r0, r1):
+        try:
+            mask = criteria_mask(self.parsed, CellRange(self.engine, r0, self.col, r1, self.col), 0)
+        except FormulaError:
+            # Un error en el rango: se evalúa celda a celda y el error no cumple
+            if r0 == r1:
+                return [False]
+            return [match for row in range(r0, r1 + 1) for match in self.matches(row, row)]
+        return [bool(match) for match in mask]
+    
+    def update(self, row):
+        if row >= len(self.mask):
+            self.mask.extend(self.matches(len(self.mask), row))
+        else:
+            self.mask[row] = self.matches(row, row)[0]
+
+
+class SheetView:
+    """Vista ordenada y filtrada de la hoja: una permutación de filas, sin
+    copiar las celdas.
+    
+    Los índices de orden de cada columna quedan en caché y se actualizan con
+    `cells_changed`; `reset` los descarta cuando cambia toda la hoja.
+    """
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.sort_col = None
+        self.descending = False
+        self.filters = {}
+        self.indexes = {}
+        self.cached_rows = None
+        self.cached_size = 0
+    
+    @property
+    def active(self):
+        return self.sort_col is not None or bool(self.filters)
+    
+    def sort_by(self, col, descending=False):
+        """Ordena por la columna `col` (None: orden de la hoja)"""
+        self.sort_col = col
+        self.descending = descending
+        self.cached_rows = None
+    
+    def set_filter(self, col, criteria):
+        """Filtra la columna con el criterio; un criterio vacío quita el filtro"""
+        if criteria:
+            self.filters[col] = ColumnFilter(self.engine, col, criteria, self.engine.sheet.num_rows)
+        else:
+            self.filters.pop(col, None)
+        self.cached_rows = None
+    
+    def clear(self):
+        """Quita orden y filtros (los índices quedan en caché)"""
+        self.sort_col = None
+        self.filters.clear()
+        self.cached_rows = None
+    
+    def reset(self):
+        """El contenido de la hoja se reemplazó: se recalculan índices y filtros"""
+        self.indexes.clear()
+        num_rows = self.engine.sheet.num_rows
+        for col, column_filter in list(self.filters.items()):
+            self.filters[col] = ColumnFilter(self.engine, col, column_filter.criteria, num_rows)
+        self.cached_rows = None
+    
+    def cells_changed(self, cells):
+        """Actualiza índices y filtros con las celdas editadas (y sus dependientes).
+        
+        Devuelve True si la permutación de filas puede haber cambiado.
+        """
+        moved = False
+        for row, col in cells:
+            index = self.indexes.get(col)
+            if index is not None:
+                index.update(row)
+            column_filter = self.filters.get(col)
+            if column_filter is not None:
+                column_filter.update(row)
+            moved = moved or col == self.sort_col or col in self.filters
+        if moved:
+            self.cached_rows = None
+        return moved
+    
+    def index(self, col):
+        index = self.indexes.get(col)
+        num_rows = self.engine.sheet.num_rows
+        if index is None:
+            index = self.indexes[col] = SortIndex(self.engine, col, num_rows)
+        else:
+            index.grow(num_rows)
+        return index
+    
+    def rows(self):
+        """Filas de la hoja en el orden de la vista"""
+        num_rows = self.engine.sheet.num_rows
+        if self.cached_rows is not None and self.cached_size == num_rows:
+            return self.cached_rows
+        
+        if self.sort_col is None:
+            order = range(num_rows)
+        else:
+            order = [row for row in self.index(self.sort_col).rows(self.descending) if row < num_rows]
+        if self.filters:
+            masks = []
+            for column_filter in self.filters.values():
+                if len(column_filter.mask) < num_rows:
+                    column_filter.update(num_rows - 1)
+                masks.append(column_filter.mask)
+            order = [row for row in order if all(mask[row] for mask in masks)]
+        self.cached_rows = list(order)
+        self.cached_size = num_rows
+        return self.cached_rows
+
+
+FILTER_RE = re.compile(r"\s*([A-Za-z]+)\s*(\S.*?)\s*")
+
+
+def parse_filters(text):
+    """Lee filtros escritos como "B>100; C=caja*" y devuelve {columna: criterio}"""
+    filters = {}
+    for part in text.split(";"):
+        if not part.strip():
+            continue
+        match = FILTER_RE.fullmatch(part)
+        if match is None:
+            raise ValueError(f"Filtro no válido: {part.strip()}")
+        filters[column_index(match.group(1))] = match.group(2)
+    return filters
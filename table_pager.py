@@ -0,0 +1,115 @@
+import threading
+
+import perf
+from sheet_document import start_thread
+
+
+class TablePager:
+    """Páginas de las filas de una vista (`SheetView`), sin interfaz.
+    
+    `index` es la página actual (desde 0) y `page_size` las filas por página
+    (0: todas, sin paginar). Las páginas vecinas de la actual se leen en
+    segundo plano con `prefetch` (`prefetched`: página -> (filas, textos por
+    fila)); `drop` las descarta cuando cambian la hoja o la vista, y una
+    lectura que termina después ya no se guarda (`generation`).
+    
+    `read_row(fila)` devuelve los textos de una fila; la vista y la hoja se
+    leen con `lock` tomado.
+    """
+    
+    def __init__(self, view, read_row, lock, page_size, run_thread=start_thread):
+        self.view = view
+        self.read_row = read_row
+        self.lock = lock
+        self.page_size = page_size
+        self.run_thread = run_thread
+        self.index = 0
+        self.prefetched = {}
+        self.generation = 0
+        self.prefetch_lock = threading.Lock()
+    
+    def count(self, total):
+        """Páginas para `total` filas (al menos una)"""
+        if not self.page_size:
+            return 1
+        return max(1, -(-total // self.page_size))
+    
+    def last(self):
+        with self.lock:
+            return self.count(len(self.view.rows())) - 1
+    
+    @property
+    def start(self):
+        """Posición en la vista de la primera fila de la página actual"""
+        return self.index * self.page_size
+    
+    def rows(self, index=None):
+        """Filas de la hoja en la página `index` de la vista (la actual si no se
+        indica; todas si no se pagina)"""
+        order = self.view.rows()
+        if not self.page_size:
+            return order
+        if index is None:
+            # La vista pudo achicarse (filtros, otra hoja): se queda en la última página
+            self.index = min(self.index, self.count(len(order)) - 1)
+            index = self.index
+        start = index * self.page_size
+        return order[start:start + self.page_size]
+    
+    def fetch(self, index):
+        """(filas, textos por fila) de la página `index`, leídos con el candado"""
+        with self.lock:
+            order = self.rows(index)
+            texts = [self.read_row(row) for row in order]
+        return order, texts
+    
+    def go_to(self, index):
+        """Pasa a la página `index` (se ajusta a las que hay) y devuelve sus
+        (filas, textos); si se precargó no se lee la hoja"""
+        index = max(0, min(index, self.last()))
+        with self.prefetch_lock:
+            fetched = self.prefetched.get(index)
+        if fetched is None:
+            perf.count("pages.fetched")
+            fetched = self.fetch(index)
+        else:
+            perf.count("pages.prefetched")
+        self.index = index
+        return fetched
+    
+    def resize(self, page_size):
+        """Cambia las filas por página; la primera fila mostrada sigue en la página"""
+        first = self.start
+        self.page_size = page_size
+        self.index = first // page_size if page_size else 0
+        self.drop()
+    
+    def prefetch(self):
+        """Lee en segundo plano las páginas vecinas de la actual"""
+        if self.page_size:
+            with self.prefetch_lock:
+                generation = self.generation
+            self.run_thread(self.prefetch_worker, generation, self.index)
+    
+    def prefetch_worker(self, generation, index):
+        last = self.last()
+        for neighbour in (index + 1, index - 1):
+            if not 0 <= neighbour <= last:
+                continue
+            with self.prefetch_lock:
+                if generation != self.generation:
+                    return
+                if neighbour in self.prefetched:
+                    continue
+            fetched = self.fetch(neighbour)
+            with self.prefetch_lock:
+                # Si algo cambió mientras se leía, los textos ya no valen
+                if generation != self.generation:
+                    return
+                self.prefetched[neighbour] = fetched
+    
+    def drop(self):
+        """Descarta las páginas precargadas: la hoja o la vista cambiaron"""
+        with self.prefetch_lock:
+            self.generation += 1
+            self.prefetched = {}
@@ -0,0 +1,31 @@
+import pytest
+
+from addressing import MAX_ROWS, Area, cell_name, column_index, column_letter, parse_area
+
+
+def test_letters_and_indexes_round_trip():
+    for col in (0, 25, 26, 701, 702, 16383):
+        assert column_index(column_letter(col)) == col
+    assert column_letter(27) == "AB"
+    assert column_index("xfd") == 16383
+    assert cell_name(899, 5) == "F900"
+
+
+def test_parse_area_forms():
+    assert parse_area("A1") == Area(0, 0, 0, 0)
+    assert parse_area("$B$2") == Area(1, 1, 1, 1)
+    assert parse_area("F900:C3") == Area(2, 2, 899, 5)
+    assert parse_area("$B:a") == Area(0, 0, MAX_ROWS - 1, 1)
+    assert str(parse_area("c3:f900")) == "C3:F900"
+    assert str(parse_area("B:B")) == "B:B"
+    for text in ("A", "A0", "1A", "A1:B", "ABCD1"):
+        with pytest.raises(ValueError):
+            parse_area(text)
+
+
+def test_whole_column_cells_are_lazy():
+    area = parse_area("A:B")
+    assert area.size == 2 * MAX_ROWS
+    cells = area.cells()
+    assert [next(cells) for _ in range(3)] == [(0, 0), (0, 1), (1, 0)]
+    assert list(area.clip(2).cells()) == [(0, 0), (0, 1), (1, 0), (1, 1)]
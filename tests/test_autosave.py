@@ -0,0 +1,71 @@
+import threading
+
+from autosave import Autosave, checkpoint_path, load_recovery
+from formula_engine import FormulaEngine
+from journal import EditJournal, SET, read_journal, replay
+from sheet_model import Sheet
+
+
+def test_discard_until_keeps_edits_after_the_mark(tmp_path):
+    journal = EditJournal(str(tmp_path / "libro.journal"))
+    journal.append(0, 0, "1")
+    journal.append(1, 0, "2")
+    mark = journal.size()
+    journal.append(2, 0, "3")
+    
+    journal.discard_until(mark)
+    journal.append(3, 0, "4")
+    size = journal.size()
+    journal.close()
+    
+    records, valid = read_journal(journal.path)
+    assert records == [(SET, 2, 0, "3"), (SET, 3, 0, "4")]
+    assert valid == size
+
+
+def test_csv_document_recovers_from_checkpoint_and_journal(tmp_path):
+    document = str(tmp_path / "datos.csv")
+    with open(document, "w") as f:
+        f.write("A,B\n1,2\n")
+    
+    lock = threading.Lock()
+    engine = FormulaEngine(Sheet(num_rows=20, num_cols=10))
+    autosave = Autosave(lock, checkpoint_size=1)
+    autosave.attach(document)
+    with lock:
+        engine.set_cell(0, 0, "7")
+        assert autosave.log(0, 0, "7")
+        # Ya hay uno pendiente: no se lanza otro
+        assert not autosave.log(0, 0, "7")
+    autosave.checkpoint(engine)
+    assert not autosave.checkpoint_pending
+    
+    with lock:
+        engine.set_cell(0, 1, "=A1*2")
+        autosave.log(0, 1, "=A1*2")
+    autosave.detach()
+    
+    sheet, formulas, records = load_recovery(document)
+    assert sheet.get(0, 0) == "7"
+    assert records == [(SET, 0, 1, "=A1*2")]
+    restored = FormulaEngine(sheet)
+    restored.recalculate_all(replay(records, sheet, formulas))
+    assert restored.display(0, 1) == "14"
+
+
+def test_save_as_moves_unsaved_edits_to_the_new_document(tmp_path):
+    old, new = str(tmp_path / "sin_titulo"), str(tmp_path / "datos.csv")
+    autosave = Autosave(threading.Lock())
+    autosave.attach(old)
+    autosave.log(0, 0, "antes")
+    mark = autosave.mark()
+    autosave.log(1, 0, "después")
+    
+    autosave.saved(new, mark)
+    assert autosave.document == new
+    assert not (tmp_path / "sin_titulo.journal").exists()
+    assert not (tmp_path / checkpoint_path("sin_titulo")).exists()
+    autosave.detach()
+    
+    _, _, records = load_recovery(new)
+    assert records == [(SET, 1, 0, "después")]
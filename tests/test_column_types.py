@@ -0,0 +1,60 @@
+from column_types import DateType, NumberType, infer_type, pack_typed_columns
+from formula_engine import FormulaEngine
+from sheet_model import Sheet
+from workbook_format import open_workbook, save_workbook
+
+
+def test_infers_locale_decimals_currency_and_dates():
+    amounts = infer_type(["1.234,56", "-12,00", "980,10"])
+    assert (amounts.name, amounts.decimal, amounts.thousands, amounts.decimals) == ("decimal", ",", ".", 2)
+    assert infer_type(["1,234.56", "12.00"]).decimal == "."
+    assert infer_type(["$1,200.00", "$3.50"]).name == "currency"
+    assert infer_type(["1.234", "2.500"]).name == "integer"
+    
+    dates = infer_type(["31/01/2024", "01/02/2024"])
+    assert (dates.name, dates.order) == ("date", "dmy")
+    assert infer_type(["2024-01-31", "2024-02-01"]).order == "ymd"
+    assert infer_type(["pago 1", "pago 2", "3"]) is None
+
+
+def test_number_type_round_trips_and_reads_plain_numbers():
+    column_type = NumberType(",", ".", 2)
+    assert column_type.parse("1.234,56") == 1234.56
+    assert column_type.format(-1234.5) == "-1.234,50"
+    # "12.5" no respeta los miles, pero sigue siendo un número
+    assert column_type.read("12.5") is None
+    assert column_type.parse("12.5") == 12.5
+    
+    date = DateType("dmy", "/")
+    assert date.format(date.parse("29/02/2024")) == "29/02/2024"
+    assert date.parse("31/02/2024") is None
+
+
+def test_packed_columns_keep_text_and_feed_formulas():
+    sheet = Sheet()
+    sheet.append_rows([["1.234,56", "01/01/2024"], ["n/a", "02/01/2024"]])
+    sheet.append_rows([["10,00", ""]] * 10)
+    pack_typed_columns(sheet)
+    assert sheet.columns[0].kind == "numeric"
+    assert sheet.columns[0].text == {1: "n/a"}
+    assert [sheet.get(row, 0) for row in range(3)] == ["1.234,56", "n/a", "10,00"]
+    assert sheet.get(1, 1) == "02/01/2024"
+    
+    engine = FormulaEngine(sheet)
+    engine.set_cell(0, 2, "=SUM(A1:A3)")
+    engine.set_cell(1, 2, "=B2-B1")
+    assert engine.display(0, 2) == "1244.56"
+    assert engine.display(1, 2) == "1"
+
+
+def test_column_types_survive_a_workbook_round_trip(tmp_path):
+    sheet = Sheet()
+    sheet.append_rows([["1.234,56"], ["7,00"]])
+    pack_typed_columns(sheet)
+    path = str(tmp_path / "libro.csmt")
+    save_workbook(sheet, path)
+    
+    reopened, _ = open_workbook(path)
+    assert reopened.get(0, 0) == "1.234,56"
+    assert reopened.number(0, 0) == 1234.56
+    assert list(reopened.numbers(0)[:2]) == [1234.56, 7.0]
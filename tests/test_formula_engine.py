@@ -0,0 +1,166 @@
+import random
+
+from formula_engine import CYCLE_ERROR, FormulaEngine, SpanIndex
+from sheet_model import Sheet
+
+
+def make_engine(cells=()):
+    engine = FormulaEngine(Sheet(num_rows=20, num_cols=10))
+    for (row, col), text in cells:
+        engine.set_cell(row, col, text)
+    return engine
+
+
+def test_chain_recalculates_in_dependency_order():
+    # C1 = B1 * 2, B1 = A1 + 1: editar A1 debe actualizar B1 antes que C1
+    engine = make_engine([((0, 2), "=B1*2"), ((0, 1), "=A1+1"), ((0, 0), "1")])
+    assert engine.display(0, 2) == "4"
+    
+    changed = engine.set_cell(0, 0, "10")
+    assert {(0, 0), (0, 1), (0, 2)} <= changed
+    assert engine.display(0, 1) == "11"
+    assert engine.display(0, 2) == "22"
+
+
+def test_diamond_evaluates_shared_dependent_once_with_final_inputs():
+    engine = make_engine([
+        ((0, 0), "2"),
+        ((1, 0), "=A1*3"),
+        ((2, 0), "=A1+4"),
+        ((3, 0), "=A2+A3"),
+    ])
+    assert engine.display(3, 0) == "12"
+    engine.set_cell(0, 0, "5")
+    assert engine.display(3, 0) == "24"
+
+
+def test_unrelated_edit_does_not_touch_formulas():
+    engine = make_engine([((0, 0), "1"), ((0, 1), "=A1*2")])
+    changed = engine.set_cell(5, 5, "7")
+    assert changed == {(5, 5)}
+
+
+def test_cycle_is_reported_and_recovers_when_broken():
+    engine = make_engine([((0, 0), "=B1+1"), ((0, 1), "=A1+1"), ((0, 2), "=A1")])
+    assert engine.display(0, 0) == CYCLE_ERROR
+    assert engine.display(0, 1) == CYCLE_ERROR
+    assert engine.display(0, 2) == CYCLE_ERROR
+    
+    engine.set_cell(0, 1, "5")
+    assert engine.display(0, 0) == "6"
+    assert engine.display(0, 2) == "6"
+
+
+def test_self_reference_is_a_cycle():
+    engine = make_engine([((0, 0), "=A1+1")])
+    assert engine.display(0, 0) == CYCLE_ERROR
+
+
+def test_range_dependents_follow_edits_inside_the_range_only():
+    engine = make_engine([((row, 0), str(row + 1)) for row in range(5)])
+    engine.set_cell(0, 1, "=SUM(A1:A5)")
+    assert engine.display(0, 1) == "15"
+    
+    assert (0, 1) in engine.set_cell(2, 0, "10")
+    assert engine.display(0, 1) == "22"
+    
+    assert (0, 1) not in engine.set_cell(5, 0, "100")
+    assert engine.display(0, 1) == "22"
+
+
+def test_range_dependents_are_removed_with_the_formula():
+    engine = make_engine([((0, 0), "1"), ((0, 1), "=SUM(A1:A3)")])
+    engine.set_cell(0, 1, "3")
+    assert engine.direct_dependents((1, 0)) == set()
+
+
+def test_range_over_formulas_uses_computed_values():
+    engine = make_engine([
+        ((0, 0), "2"),
+        ((1, 0), "=A1*10"),
+        ((0, 1), "=SUM(A1:A2)"),
+    ])
+    assert engine.display(0, 1) == "22"
+    engine.set_cell(0, 0, "3")
+    assert engine.display(0, 1) == "33"
+
+
+def test_running_totals_only_recalculate_formulas_covering_the_edit():
+    engine = make_engine([((row, 0), "1") for row in range(200)])
+    for row in range(200):
+        engine.set_cell(row, 1, f"=SUM($A$1:A{row + 1})")
+    assert engine.display(199, 1) == "200"
+    
+    changed = engine.set_cell(197, 0, "2")
+    assert changed == {(197, 0), (197, 1), (198, 1), (199, 1)}
+    assert engine.display(199, 1) == "201"
+    assert engine.display(196, 1) == "197"
+
+
+def test_span_index_matches_linear_scan():
+    rng = random.Random(4)
+    index = SpanIndex()
+    spans = []
+    for n in range(1000):
+        r0 = rng.randrange(500)
+        span = (r0, r0 + rng.randrange(100), (n, 0))
+        spans.append(span)
+        index.add(*span)
+    for span in spans[::3]:
+        index.remove(*span)
+    remaining = [span for i, span in enumerate(spans) if i % 3]
+    
+    assert len(index) == len(remaining)
+    for row in range(0, 620, 7):
+        expected = sorted(cell for r0, r1, cell in remaining if r0 <= row <= r1)
+        assert sorted(index.stab(row)) == expected
+
+
+def test_whole_column_ranges_follow_the_sheet_size():
+    engine = make_engine([((row, 0), str(row + 1)) for row in range(3)])
+    engine.set_cell(0, 2, "=SUM(A:A)")
+    engine.set_cell(0, 3, "=SUM(B:B)")
+    assert engine.display(0, 2) == "6"
+    
+    # La misma plantilla en D1 es la columna B (relativa a la celda)
+    engine.set_cell(4, 1, "5")
+    assert engine.display(0, 3) == "5"
+    
+    engine.sheet.add_rows()
+    changed = engine.set_cell(20, 0, "10")
+    assert (0, 2) in changed
+    assert engine.display(0, 2) == "16"
+
+
+def test_references_outside_the_sheet_are_ref_errors():
+    engine = make_engine([((row, 0), str(row + 1)) for row in range(5)])
+    engine.sheet.make_numeric(0)
+    for row in range(5):
+        engine.set_cell(row, 4, str(row + 1))
+    engine.sheet.make_dense(4)
+    
+    engine.set_cell(0, 1, "=A0")
+    engine.set_cell(1, 1, "=A0+1")
+    engine.set_cell(2, 1, "=SUM(A0:A2)")
+    engine.set_cell(3, 1, "=E0")
+    assert [engine.display(row, 1) for row in range(4)] == ["#REF!"] * 4
+    
+    # Misma plantilla (R[-1]C[-1]) anclada en la fila 1: sale por arriba
+    engine.set_cell(3, 2, "=B3*2")
+    engine.set_cell(0, 2, "=B0*2")
+    assert engine.display(3, 2) == "#REF!"
+    engine.set_cell(3, 2, "=A3*2")
+    engine.set_cell(0, 2, "=A0*2")
+    assert engine.display(3, 2) == "6"
+    assert engine.display(0, 2) == "#REF!"
+    assert engine.sheet.get(-1, 0) == engine.sheet.get(-1, 4) == ""
+    assert engine.sheet.number(-1, 0) is None
+
+
+def test_round_goes_half_away_from_zero():
+    engine = make_engine([((0, 0), "2.5"), ((1, 0), "-2.5"), ((2, 0), "2.675")])
+    engine.set_cell(0, 1, "=ROUND(A1,0)")
+    engine.set_cell(1, 1, "=ROUND(A2)")
+    engine.set_cell(2, 1, "=REDONDEAR(A3,2)")
+    engine.set_cell(3, 1, "=ROUND(1250,-2)+ROUND(0.1,40)")
+    assert [engine.display(row, 1) for row in range(4)] == ["3", "-3", "2.68", "1300.1"]
@@ -0,0 +1,108 @@
+from column_types import NumberType
+from formula_engine import FormulaEngine
+from parallel_recalc import ParallelRecalc, batches, components, topological_order
+from sheet_document import SheetDocument
+from sheet_model import Sheet
+
+
+def make_sheet(num_rows=300):
+    sheet = Sheet(num_rows=num_rows, num_cols=8)
+    for row in range(num_rows):
+        sheet.set(row, 0, str(row))
+        sheet.set(row, 1, f"$1.{row % 1000:03d},50")
+        sheet.set(row, 2, f"cuenta {row % 7}")
+        # Filas independientes, una cadena corta y agregados sobre fórmulas
+        sheet.set(row, 3, f"=A{row + 1}*2+B{row + 1}")
+        sheet.set(row, 4, f"=IF(C{row + 1}=\"cuenta 3\",D{row + 1},A{row + 1}/(A{row + 1}-5))")
+        if row % 10:
+            sheet.set(row, 5, f"=F{row}+E{row + 1}")
+        else:
+            sheet.set(row, 5, f"=SUM(D{row + 1}:D{row + 10})")
+    sheet.make_numeric(1, NumberType(",", ".", 2, "$"))
+    sheet.set(0, 6, "=G2+1")
+    sheet.set(1, 6, "=G1+1")
+    return sheet
+
+
+def test_parallel_recalc_matches_serial():
+    serial = FormulaEngine(make_sheet())
+    serial.recalculate_all()
+    
+    engine = FormulaEngine(make_sheet())
+    engine.parallel = ParallelRecalc(workers=2, min_formulas=1)
+    try:
+        engine.recalculate_all()
+        assert engine.parallel.pool is not None
+    finally:
+        engine.parallel.close()
+    
+    assert engine.values.keys() == serial.values.keys()
+    for cell, value in serial.values.items():
+        assert engine.display(*cell) == serial.display(*cell), cell
+    assert engine.display(0, 6) == "#CIRC!"
+    assert engine.display(5, 4) == "#DIV/0!"
+    
+    # El grafo queda armado en el proceso principal: las ediciones siguen siendo incrementales
+    engine.set_cell(3, 0, "1000")
+    assert engine.display(3, 3) == str(1000 * 2 + 1003.5)
+
+
+def test_small_or_chained_sheets_stay_serial():
+    engine = FormulaEngine(make_sheet(20))
+    engine.parallel = ParallelRecalc(workers=2)
+    engine.recalculate_all()
+    assert engine.parallel.pool is None
+    
+    chain = Sheet(num_rows=100, num_cols=1)
+    chain.set(0, 0, "1")
+    for row in range(1, 100):
+        chain.set(row, 0, f"=A{row}+1")
+    engine = FormulaEngine(chain)
+    engine.parallel = ParallelRecalc(workers=2, min_formulas=1)
+    engine.recalculate_all()
+    assert engine.parallel.pool is None
+    assert engine.display(99, 0) == "100"
+
+
+def test_components_are_balanced_in_dependency_order():
+    edges = {
+        (0, 0): {(0, 1)}, (0, 1): {(0, 2)}, (0, 2): set(),
+        (1, 0): {(1, 1)}, (1, 1): set(),
+        (2, 0): set(), (3, 0): set(),
+    }
+    groups = components(edges)
+    assert sorted(map(len, groups)) == [1, 1, 2, 3]
+    
+    parts = batches(groups, topological_order(edges), 2)
+    assert sorted(map(len, parts)) == [3, 4]
+    for part in parts:
+        if (0, 2) in part:
+            assert part.index((0, 0)) < part.index((0, 1)) < part.index((0, 2))
+
+
+def test_pool_warms_up_early_and_closes_with_the_document():
+    recalc = ParallelRecalc(workers=2, min_formulas=1)
+    recalc.warm(0)
+    assert recalc.pool is None
+    try:
+        recalc.warm(10)
+        assert recalc.pool is not None
+    finally:
+        recalc.close()
+    assert recalc.pool is None
+    
+    # Tras `close` el grupo se rehace si hace falta
+    engine = FormulaEngine(make_sheet())
+    engine.parallel = recalc
+    try:
+        engine.recalculate_all()
+        assert recalc.pool is not None
+    finally:
+        recalc.close()
+    
+    doc = SheetDocument(workers=2, run_thread=lambda fn, *args: fn(*args))
+    doc.engine.parallel.min_formulas = 1
+    doc.engine.parallel.warm(10)
+    assert doc.engine.parallel.pool is not None
+    doc.close()
+    assert doc.engine.parallel.pool is None
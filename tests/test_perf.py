@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+import perf
+from csv_io import CsvExport, CsvImport
+from sheet_document import SheetDocument
+
+
+@pytest.fixture
+def recorder():
+    perf.recorder.clear()
+    perf.recorder.enabled = True
+    yield perf.recorder
+    perf.recorder.enabled = False
+    perf.recorder.clear()
+
+
+def test_disabled_recorder_records_nothing():
+    perf.recorder.clear()
+    assert perf.span("nada") is perf.NULL_SPAN
+    with perf.span("nada"):
+        perf.count("celdas", 10)
+    assert perf.recorder.summary() == ([], [])
+
+
+def test_spans_and_counters_of_csv_round_trip(recorder, tmp_path):
+    source = str(tmp_path / "datos.csv")
+    content = "A,B\ncaja,1\nbanco,2\n"
+    with open(source, "w") as f:
+        f.write(content)
+    doc = SheetDocument(run_thread=lambda fn, *args: fn(*args))
+    doc.load_csv(CsvImport(source))
+    doc.save_csv(CsvExport(str(tmp_path / "copia.csv")))
+    
+    spans, counters = recorder.summary()
+    names = {name: times for name, times, total, longest in spans}
+    assert names["csv.load"] == 1 and names["csv.save"] == 1
+    counters = dict(counters)
+    assert counters["csv.bytes_read"] == len(content)
+    assert counters["csv.bytes_written"] > 0
+
+
+def test_export_trace_writes_chrome_events(recorder, tmp_path):
+    @perf.traced("suma")
+    def add(a, b):
+        return a + b
+    
+    assert add(2, 3) == 5
+    perf.count("celdas", 4)
+    path = tmp_path / "traza.json"
+    recorder.export_trace(str(path))
+    
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [event["name"] for event in events if event["ph"] == "X"] == ["suma"]
+    assert {"name": "celdas", "ph": "C"}.items() <= events[-1].items()
+    assert events[-1]["args"] == {"celdas": 4}
@@ -0,0 +1,88 @@
+import pytest
+
+from csv_io import CsvImport
+from pivot import parse_keys, parse_measures
+from sheet_document import SheetDocument
+
+
+def make_document():
+    return SheetDocument(run_thread=lambda fn, *args: fn(*args))
+
+
+def table(doc, num_cols):
+    rows = []
+    for row in range(doc.sheet.num_rows):
+        texts = [doc.engine.display(row, col) for col in range(num_cols)]
+        if any(texts):
+            rows.append(texts)
+    return rows
+
+
+def test_groups_are_summed_counted_and_averaged():
+    doc = make_document()
+    doc.paste(0, 0, "1101\tcaja\t100\n4101\tventas\t50.5\n1101\tcaja\t-30\n2101\tprov\t7\n")
+    doc.set_cell(4, 0, "=A1")
+    doc.set_cell(4, 2, "=C2*2")
+    
+    index = doc.add_pivot([0], [(2, "sum"), (2, "count"), (2, "avg")])
+    assert doc.sheet_names()[index] == "Resumen Hoja1"
+    assert table(doc, 4) == [
+        ["A", "Suma de C", "Cantidad de C", "Promedio de C"],
+        ["1101", "171", "3", "57"],
+        ["2101", "7", "1", "7"],
+        ["4101", "50.5", "1", "50.5"],
+    ]
+
+
+def test_source_edits_update_only_their_groups():
+    doc = make_document()
+    doc.paste(0, 0, "b\t1\na\t2\nb\t3\n")
+    index = doc.add_pivot([0], [(1, "sum")])
+    
+    doc.switch_sheet(0)
+    doc.set_cell(0, 1, "10")
+    pivot = doc.workbook.sheets[index].pivot
+    assert pivot.dirty == {("b",)} and not pivot.layout_changed
+    doc.switch_sheet(index)
+    assert table(doc, 2) == [["A", "Suma de B"], ["a", "2"], ["b", "13"]]
+    
+    # Un grupo que desaparece deja su fila vacía; uno nuevo entra en orden
+    doc.switch_sheet(0)
+    doc.set_cell(1, 0, "c")
+    doc.paste(3, 0, "1\t0.1\n1\t0.2\n")
+    doc.switch_sheet(index)
+    assert table(doc, 2) == [["A", "Suma de B"], ["1", "0.3"], ["b", "13"], ["c", "2"]]
+    
+    doc.switch_sheet(0)
+    doc.undo()
+    doc.clear()
+    doc.switch_sheet(index)
+    assert table(doc, 2) == [["A", "Suma de B"]]
+
+
+def test_typed_columns_keep_their_format(tmp_path):
+    source = tmp_path / "diario.csv"
+    lines = ["fecha,cuenta,monto"]
+    lines += [f'0{day}/01/2024,{4100 + day % 2},"$1.000,{day}0"' for day in range(1, 10)]
+    source.write_text("\n".join(lines) + "\n")
+    doc = make_document()
+    doc.load_csv(CsvImport(str(source)))
+    assert doc.sheet.column(2).kind == "numeric"
+    
+    doc.add_pivot([1], [(2, "sum"), (0, "count")])
+    assert table(doc, 3) == [
+        ["B", "Suma de C", "Cantidad de A"],
+        ["4100", "$4.002,00", "4"],
+        ["4101", "$5.002,50", "5"],
+    ]
+
+
+def test_pivot_specs_are_read_from_text():
+    assert parse_keys("a, B") == [0, 1]
+    assert parse_measures("suma C, promedio D,cantidad C, E") == [
+        (2, "sum"), (3, "avg"), (2, "count"), (4, "sum"),
+    ]
+    with pytest.raises(ValueError):
+        parse_keys("A1")
+    with pytest.raises(ValueError):
+        parse_measures("mediana C")
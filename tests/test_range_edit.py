@@ -0,0 +1,102 @@
+import time
+
+from addressing import parse_area
+from range_edit import parse_clipboard
+from sheet_document import SheetDocument
+
+
+def make_document():
+    return SheetDocument(run_thread=lambda fn, *args: fn(*args))
+
+
+def test_clipboard_blocks_are_split_by_tab_or_csv_separator():
+    assert parse_clipboard("a\tb\r\n1\t2\r\n") == [["a", "b"], ["1", "2"]]
+    assert parse_clipboard('nombre,monto\n"Pérez, Ana",10\n') == [["nombre", "monto"], ["Pérez, Ana", "10"]]
+    assert parse_clipboard("x;1\ny;2") == [["x", "1"], ["y", "2"]]
+    assert parse_clipboard("solo texto, con coma\notra línea") == [["solo texto, con coma"], ["otra línea"]]
+    assert parse_clipboard("") == []
+
+
+def test_paste_is_one_undo_entry_with_one_recalc():
+    doc = make_document()
+    doc.set_cell(0, 2, "=SUM(A1:A3)")
+    doc.set_cell(3, 1, "=B1+B3")
+    
+    area, changed = doc.paste(0, 0, "1\t10\n2\t20\n3\t30\n")
+    assert str(area) == "A1:B3"
+    assert doc.engine.display(0, 2) == "6"
+    assert doc.engine.display(3, 1) == "40"
+    assert {(0, 2), (3, 1), (2, 1)} <= changed
+    
+    doc.undo()
+    assert doc.sheet.get(0, 0) == ""
+    assert doc.engine.display(0, 2) == "0"
+    assert doc.engine.display(3, 1) == "0"
+    doc.redo()
+    assert doc.engine.display(0, 2) == "6"
+
+
+def test_paste_replaces_formulas_in_the_block():
+    doc = make_document()
+    doc.set_cell(0, 0, "=B1+1")
+    doc.set_cell(0, 2, "=A1*2")
+    doc.paste(0, 0, "5\n")
+    
+    assert doc.engine.display(0, 2) == "10"
+    doc.set_cell(0, 1, "100")
+    assert doc.engine.display(0, 0) == "5"
+
+
+def test_fill_down_shifts_relative_references():
+    doc = make_document()
+    for row in range(4):
+        doc.set_cell(row, 0, str(row + 1))
+    doc.set_cell(0, 1, "=A1*$A$1+SUM(A$1:A1)")
+    
+    doc.fill_down(parse_area("B1:B4"))
+    assert doc.sheet.get(3, 1) == "=A4*$A$1+SUM(A$1:A4)"
+    assert doc.engine.display(3, 1) == "14"
+    
+    doc.fill_right(parse_area("B1:C1"))
+    assert doc.sheet.get(0, 2) == "=B1*$A$1+SUM(B$1:B1)"
+
+
+def test_series_continue_numbers_and_numbered_text():
+    doc = make_document()
+    doc.set_cell(0, 0, "0.1")
+    doc.set_cell(1, 0, "0.2")
+    doc.set_cell(0, 1, "Semana 08")
+    doc.set_cell(0, 2, "x")
+    
+    doc.fill_series(parse_area("A1:A4"))
+    doc.fill_series(parse_area("B1:B3"))
+    doc.autofill(parse_area("C1"), parse_area("C1:C3"))
+    assert [doc.sheet.get(row, 0) for row in range(4)] == ["0.1", "0.2", "0.3", "0.4"]
+    assert [doc.sheet.get(row, 1) for row in range(3)] == ["Semana 08", "Semana 09", "Semana 10"]
+    assert [doc.sheet.get(row, 2) for row in range(3)] == ["x", "x", "x"]
+
+
+def test_fill_must_follow_its_source():
+    doc = make_document()
+    doc.set_cell(0, 0, "1")
+    try:
+        doc.autofill(parse_area("A1"), parse_area("B2:B3"))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("se esperaba ValueError")
+
+
+def test_large_paste_is_a_single_batched_write():
+    doc = make_document()
+    text = "\n".join("\t".join(str(row * 10 + col) for col in range(10)) for row in range(10000))
+    doc.set_cell(0, 10, "=SUM(A:J)")
+    
+    start = time.perf_counter()
+    area, changed = doc.paste(0, 0, text)
+    elapsed = time.perf_counter() - start
+    assert area.size == 100_000
+    assert doc.engine.display(0, 10) == str(sum(range(100_000)))
+    assert len(doc.history.undo_stack) == 2
+    # Holgado para máquinas lentas; en una normal tarda bastante menos
+    assert elapsed < 5
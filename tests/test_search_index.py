@@ -0,0 +1,44 @@
+from formula_engine import FormulaEngine
+from search_index import SearchIndex
+from sheet_model import Sheet
+
+
+def make_index(rows):
+    sheet = Sheet()
+    sheet.append_rows(rows)
+    engine = FormulaEngine(sheet)
+    index = SearchIndex(engine)
+    index.ensure()
+    return engine, index
+
+
+def test_find_matches_word_prefixes_in_reading_order():
+    engine, index = make_index([["Caja chica", "banco"], ["x", "CAJA"], ["encaja", "caja grande"]])
+    assert list(index.find("caj")) == [(0, 0), (1, 1), (2, 1)]
+    assert list(index.find("caja ch")) == [(0, 0)]
+    assert index.find_next("caja", (1, 1)) == (2, 1)
+    assert index.find_next("caja", (2, 1)) == (0, 0)
+    assert index.find_next("nada") is None
+
+
+def test_updates_keep_the_index_current():
+    engine, index = make_index([["caja"], ["banco"]])
+    engine.set_cell(0, 0, "efectivo")
+    index.update(0, 0, "caja", "efectivo")
+    engine.set_cell(5, 3, "Caja nueva")
+    index.update(5, 3, "", "Caja nueva")
+    
+    assert list(index.find("caja")) == []
+    assert "caja" not in index.words
+    index.ensure()
+    assert list(index.find("caja")) == [(5, 3)]
+    assert list(index.find("efe")) == [(0, 0)]
+
+
+def test_replacements_and_queries_without_words():
+    engine, index = make_index([["1.234,50", "Caja"], ["caja caja", "-"]])
+    assert index.replacements("caja", "Banco") == [
+        (0, 1, "Caja", "Banco"), (1, 0, "caja caja", "Banco Banco"),
+    ]
+    assert list(index.find("-")) == [(1, 1)]
+    assert list(index.find("234,5")) == [(0, 0)]
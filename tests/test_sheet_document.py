@@ -0,0 +1,57 @@
+import benchmark
+from csv_io import CsvExport, CsvImport
+from sheet_document import SheetDocument
+
+
+def run_now(fn, *args):
+    fn(*args)
+
+
+def test_edits_undo_and_search_share_one_document():
+    doc = SheetDocument(run_thread=run_now)
+    for text in ("c", "ca", "caja"):
+        doc.set_cell(0, 0, text, merge=True)
+    changed = doc.set_cell(0, 1, '=A1&" chica"')
+    assert (0, 1) in changed
+    assert doc.engine.display(0, 1) == "caja chica"
+    
+    replaced, changed = doc.replace_all("caja", "banco")
+    assert replaced == 1 and (0, 1) in changed
+    assert doc.engine.display(0, 1) == "banco chica"
+    
+    doc.undo()
+    assert doc.sheet.get(0, 0) == "caja"
+    assert list(doc.search.find("caja")) == [(0, 0)]
+    doc.undo()
+    doc.undo()
+    assert doc.sheet.get(0, 0) == ""
+
+
+def test_load_and_save_csv_replace_the_sheet(tmp_path):
+    source = str(tmp_path / "datos.csv")
+    with open(source, "w") as f:
+        f.write('A,B\ncaja,"1.234,50"\nbanco,10\n')
+    resets = []
+    doc = SheetDocument(run_thread=run_now, on_reset=lambda: resets.append(True))
+    doc.set_cell(5, 5, "anterior")
+    
+    assert doc.load_csv(CsvImport(source)) == (True, 0)
+    assert (doc.sheet.num_rows, doc.sheet.num_cols) == (2, 2)
+    assert doc.sheet.number(0, 1) == 1234.5
+    assert resets
+    
+    target = str(tmp_path / "copia.csv")
+    assert doc.save_csv(CsvExport(target))
+    with open(target) as f:
+        assert f.read().splitlines() == ["A,B", 'caja,"1.234,50"', "banco,10"]
+    
+    doc.undo()
+    assert doc.sheet.get(5, 5) == "anterior"
+
+
+def test_benchmark_runs_headless():
+    report = benchmark.run_benchmarks([200], repeat=1, edits=5, memory=False)
+    result = report["results"][0]
+    assert result["rows"] == 20
+    assert result["grid_full_controls"] == 200
+    assert result["load_csv_s"] > 0 and result["edit_median_ms"] > 0
@@ -0,0 +1,50 @@
+import random
+
+from formula_engine import FormulaEngine
+from sheet_model import Sheet
+from sheet_view import SheetView, cell_key, parse_filters
+
+
+def make_view(rows):
+    sheet = Sheet()
+    sheet.append_rows(rows)
+    engine = FormulaEngine(sheet)
+    engine.recalculate_all()
+    return engine, SheetView(engine)
+
+
+def test_sort_puts_numbers_then_text_and_blanks_last():
+    engine, view = make_view([["5"], [""], ["banco"], ["2"], ["=A1*3"]])
+    view.sort_by(0)
+    assert view.rows() == [3, 0, 4, 2, 1]
+    view.sort_by(0, descending=True)
+    assert view.rows() == [2, 4, 0, 3, 1]
+
+
+def test_incremental_update_matches_full_sort():
+    random.seed(7)
+    engine, view = make_view([[str(random.randint(0, 50)), "=A{}*2".format(row + 1)] for row in range(300)])
+    view.sort_by(1)
+    view.rows()
+    for _ in range(50):
+        row = random.randrange(300)
+        view.cells_changed(engine.set_cell(row, 0, random.choice(["", "x", str(random.randint(0, 50))])))
+    
+    expected = sorted(range(300), key=lambda row: (cell_key(engine, row, 1), row))
+    assert view.rows() == expected
+
+
+def test_filters_combine_and_follow_edits():
+    engine, view = make_view([["10", "caja"], ["200", "Caja chica"], ["300", "banco"], ["400", "caja"]])
+    view.set_filter(0, ">100")
+    view.set_filter(1, "caja*")
+    assert view.rows() == [1, 3]
+    
+    assert view.cells_changed(engine.set_cell(3, 1, "banco"))
+    assert view.rows() == [1]
+    view.set_filter(1, "")
+    assert view.rows() == [1, 2, 3]
+
+
+def test_parse_filters():
+    assert parse_filters("B>100; c=caja* ;") == {1: ">100", 2: "=caja*"}
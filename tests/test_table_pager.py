@@ -0,0 +1,90 @@
+import threading
+
+from formula_engine import FormulaEngine
+from sheet_model import Sheet
+from sheet_view import SheetView
+from table_pager import TablePager
+
+
+def make_pager(num_rows, page_size=10):
+    sheet = Sheet()
+    sheet.append_rows([[str(row), f"fila {row}"] for row in range(num_rows)])
+    engine = FormulaEngine(sheet)
+    engine.recalculate_all()
+    view = SheetView(engine)
+    
+    def read_row(row):
+        return [engine.display(row, col) for col in range(sheet.num_cols)]
+    
+    pager = TablePager(view, read_row, threading.RLock(), page_size, run_thread=lambda fn, *args: fn(*args))
+    return engine, view, pager
+
+
+def test_page_stays_inside_a_view_that_shrinks():
+    engine, view, pager = make_pager(95)
+    assert pager.count(95) == 10
+    rows, texts = pager.go_to(99)
+    assert pager.index == 9
+    assert rows == list(range(90, 95))
+    assert texts[0] == ["90", "fila 90"]
+    
+    # El filtro deja 3 páginas: se muestra la última
+    view.set_filter(0, "<25")
+    assert pager.rows() == [20, 21, 22, 23, 24]
+    assert pager.index == 2
+    
+    # Una vista vacía sigue teniendo una página
+    view.set_filter(0, ">1000")
+    assert pager.rows() == []
+    assert pager.index == 0
+    assert pager.go_to(-3) == ([], [])
+
+
+def test_first_row_stays_visible_when_the_page_size_changes():
+    engine, view, pager = make_pager(1000, page_size=100)
+    pager.go_to(7)
+    assert pager.rows()[0] == 700
+    
+    pager.resize(50)
+    assert pager.index == 14
+    assert pager.rows()[0] == 700
+    
+    pager.resize(500)
+    assert pager.index == 1
+    assert 700 in pager.rows()
+    
+    # Sin paginar: una sola página con todas las filas
+    pager.resize(0)
+    assert pager.index == 0
+    assert pager.count(1000) == 1
+    assert len(pager.rows()) == 1000
+
+
+def test_prefetched_pages_are_dropped_after_edits_and_view_changes():
+    engine, view, pager = make_pager(50)
+    pager.go_to(2)
+    pager.prefetch()
+    assert sorted(pager.prefetched) == [1, 3]
+    assert pager.go_to(3)[1][0] == ["30", "fila 30"]
+    
+    # Una edición descarta lo precargado: la página se vuelve a leer
+    pager.prefetch()
+    engine.set_cell(40, 1, "editada")
+    pager.drop()
+    assert pager.prefetched == {}
+    assert pager.go_to(4)[1][0] == ["40", "editada"]
+    
+    # Con otro orden las filas de cada página son otras
+    pager.prefetch()
+    view.sort_by(0, descending=True)
+    pager.drop()
+    assert pager.go_to(3)[0] == list(range(19, 9, -1))
+    
+    # Una lectura que termina después del cambio no se guarda
+    def read_and_change(row):
+        pager.drop()
+        return [engine.display(row, 0)]
+    
+    pager.read_row = read_and_change
+    pager.prefetch()
+    assert pager.prefetched == {}
@@ -0,0 +1,71 @@
+from formula_engine import FormulaEngine
+from sheet_model import Sheet
+from undo_history import UndoHistory, sheet_state
+
+
+def make_engine():
+    return FormulaEngine(Sheet(num_rows=20, num_cols=10))
+
+
+def edit(engine, history, row, col, text, merge=False):
+    old = engine.sheet.get(row, col)
+    engine.set_cell(row, col, text)
+    history.record("Editar celda", [(row, col, old, text)], merge=merge)
+
+
+def test_undo_and_redo_recalculate_dependents():
+    engine, history = make_engine(), UndoHistory()
+    edit(engine, history, 0, 0, "2")
+    edit(engine, history, 0, 1, "=A1*10")
+    edit(engine, history, 0, 0, "5")
+    assert engine.display(0, 1) == "50"
+    
+    _, changed = history.undo(engine)
+    assert (0, 1) in changed
+    assert engine.display(0, 1) == "20"
+    history.redo(engine)
+    assert engine.display(0, 1) == "50"
+
+
+def test_keystrokes_merge_until_sealed():
+    engine, history = make_engine(), UndoHistory()
+    for text in ("1", "12", "123"):
+        edit(engine, history, 0, 0, text, merge=True)
+    history.seal()
+    edit(engine, history, 0, 0, "9", merge=True)
+    assert len(history.undo_stack) == 2
+    
+    history.undo(engine)
+    assert engine.sheet.get(0, 0) == "123"
+    history.undo(engine)
+    assert engine.sheet.get(0, 0) == ""
+    assert history.undo(engine) is None
+
+
+def test_sheet_entry_swaps_content_back():
+    engine, history = make_engine(), UndoHistory()
+    edit(engine, history, 3, 2, "=1+1")
+    state = sheet_state(engine.sheet)
+    engine.clear()
+    history.record_sheet("Limpiar todo", state)
+    assert engine.display(3, 2) == ""
+    
+    _, changed = history.undo(engine)
+    assert changed is None
+    assert engine.display(3, 2) == "2"
+    history.redo(engine)
+    assert engine.display(3, 2) == ""
+
+
+def test_new_edit_drops_redo_and_memory_cap_evicts_oldest():
+    engine, history = make_engine(), UndoHistory(max_bytes=1000)
+    for row in range(20):
+        edit(engine, history, row, 0, "x" * 40)
+    assert history.size <= 1000
+    assert 0 < len(history.undo_stack) < 20
+    
+    history.undo(engine)
+    assert history.can_redo()
+    edit(engine, history, 0, 1, "nuevo")
+    assert not history.can_redo()
+    assert history.size == sum(entry.cost for entry in history.undo_stack)
@@ -0,0 +1,45 @@
+from update_scheduler import UpdateScheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+        self.threads = []
+    
+    def update(self, *controls):
+        self.sent.append(controls)
+    
+    def run_thread(self, fn, *args):
+        self.threads.append(fn)
+
+
+def test_keystrokes_are_coalesced_into_one_send():
+    page = Recorder()
+    updates = UpdateScheduler(page.update, run_thread=page.run_thread, delay=0)
+    committed = []
+    bar, cell = object(), object()
+    for text in ("c", "ca", "caj", "caja"):
+        updates.call((0, 0), committed.append, text)
+        updates.update(bar)
+    updates.call((0, 1), lambda: updates.update(cell))
+    
+    # Un solo temporizador para toda la ventana
+    assert len(page.threads) == 1
+    page.threads[0]()
+    assert committed == ["caja"]
+    assert page.sent == [(bar, cell)]
+
+
+def test_flush_sends_pending_with_immediate_controls():
+    page = Recorder()
+    updates = UpdateScheduler(page.update, run_thread=page.run_thread)
+    pending, focused = object(), object()
+    updates.update(pending)
+    updates.flush(focused, pending)
+    assert page.sent == [(pending, focused)]
+    
+    # Sin nada pendiente el temporizador no envía nada
+    updates.flush()
+    assert page.sent == [(pending, focused)]
+    updates.update(pending)
+    assert len(page.threads) == 2
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from addressing import column_letter
+from virtual_grid import VirtualGrid
+
+
+def make_grid(events):
+    grid = VirtualGrid(
+        1000,
+        50,
+        get_value=lambda row, col: f"{column_letter(col)}{row + 1}",
+        on_focus=lambda e, row, col: events.append(("focus", row, col)),
+        on_change=lambda e, row, col: events.append(("change", row, col)),
+        on_blur=lambda e, row, col: events.append(("blur", row, col)),
+        column_letter=column_letter,
+    )
+    grid.build()
+    return grid
+
+
+def scroll(grid, first_row, first_col):
+    grid.render(first_row, first_col)
+
+
+def test_scrolling_rebinds_cells_instead_of_creating_them():
+    events = []
+    grid = make_grid(events)
+    # Una ventana lejos de los bordes (la primera es más chica: no tiene overscan arriba)
+    scroll(grid, 100, 5)
+    controls = {id(cell) for cell in grid.cells.values()}
+    
+    scroll(grid, 500, 5)
+    assert grid.cells[(500, 5)].value == "F501"
+    assert {id(cell) for cell in grid.cells.values()} == controls
+    
+    # Otra ventana de columnas: las mismas filas con celdas de otras columnas
+    scroll(grid, 500, 30)
+    assert grid.cells[(500, 30)].value == "AE501"
+    assert {id(cell) for cell in grid.cells.values()} == controls
+    
+    # Los manejadores leen las coordenadas actuales del control
+    cell = grid.cells[(501, 31)]
+    grid.change_cell(SimpleNamespace(control=cell))
+    assert events == [("change", 501, 31)]
+
+
+def test_row_with_focused_cell_is_not_reused():
+    events = []
+    grid = make_grid(events)
+    focused = grid.cells[(3, 2)]
+    grid.focus_cell(SimpleNamespace(control=focused))
+    
+    scroll(grid, 500, 0)
+    assert all(cell is not focused for cell in grid.cells.values())
+    assert focused.data == (3, 2)
+    grid.blur_cell(SimpleNamespace(control=focused))
+    assert grid.focused is None
+    assert events == [("focus", 3, 2), ("blur", 3, 2)]
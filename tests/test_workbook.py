@@ -0,0 +1,140 @@
+from csv_io import CsvImport
+from sheet_document import SheetDocument
+from workbook_format import WorkbookTask, workbook_tabs
+
+
+def make_document():
+    return SheetDocument(run_thread=lambda fn, *args: fn(*args))
+
+
+def test_switching_between_resident_sheets_keeps_their_state(tmp_path):
+    doc = make_document()
+    doc.set_cell(0, 0, "5")
+    doc.set_cell(0, 1, "=A1*2")
+    
+    assert doc.add_sheet() == 1
+    assert doc.sheet_names() == ["Hoja1", "Hoja2"]
+    assert doc.sheet.get(0, 0) == ""
+    doc.set_cell(0, 0, "=1+1")
+    values = doc.engine.values
+    
+    doc.switch_sheet(0)
+    assert doc.engine.display(0, 1) == "10"
+    doc.set_cell(0, 0, "7")
+    assert doc.engine.display(0, 1) == "14"
+    doc.undo()
+    assert doc.engine.display(0, 1) == "10"
+    
+    # La hoja residente vuelve sin recalcular: el mismo grafo de antes
+    doc.switch_sheet(1)
+    assert doc.engine.values is values
+    assert doc.engine.display(0, 0) == "2"
+    assert doc.history.can_undo()
+
+
+def test_least_recently_used_sheet_waits_on_disk(tmp_path):
+    doc = make_document()
+    doc.workbook.max_resident = 2
+    doc.workbook.directory = str(tmp_path)
+    doc.set_cell(0, 0, "3")
+    doc.set_cell(1, 0, "=SUM(A1:A1)+1")
+    doc.add_sheet("enero")
+    doc.set_cell(0, 0, "enero")
+    doc.add_sheet("febrero")
+    
+    first, second, third = doc.workbook.sheets
+    assert not first.resident and first.path.startswith(str(tmp_path))
+    assert second.resident and third.resident
+    
+    doc.switch_sheet(0)
+    assert doc.engine.display(1, 0) == "4"
+    doc.set_cell(0, 0, "10")
+    assert doc.engine.display(1, 0) == "11"
+    # Volver a la primera solo bajó a disco la menos usada ("enero")
+    assert not second.resident and third.resident
+    
+    doc.switch_sheet(1)
+    assert doc.sheet.get(0, 0) == "enero"
+    assert first.resident and not third.resident
+    doc.switch_sheet(2)
+    assert not first.resident
+    doc.switch_sheet(0)
+    assert doc.engine.display(1, 0) == "11"
+
+
+def test_loaded_file_names_its_tab(tmp_path):
+    source = tmp_path / "enero.csv"
+    source.write_text("A,B\ncaja,1\n")
+    doc = make_document()
+    doc.rename_sheet(0, "enero")
+    doc.add_sheet()
+    doc.load_csv(CsvImport(str(source)))
+    
+    assert doc.sheet_names() == ["enero", "enero (2)"]
+    assert doc.sheet.get(0, 0) == "caja"
+    doc.switch_sheet(0)
+    assert doc.sheet.get(0, 0) == ""
+
+
+def test_all_tabs_are_saved_and_reopened(tmp_path):
+    path = str(tmp_path / "libro.csmt")
+    doc = make_document()
+    doc.workbook.max_resident = 2
+    doc.workbook.directory = str(tmp_path)
+    doc.rename_sheet(0, "enero")
+    doc.paste(0, 0, "caja\t100\nventas\t50\n")
+    doc.set_cell(2, 1, "=SUM(B1:B2)")
+    doc.add_sheet("febrero")
+    doc.set_cell(0, 0, "=1+2")
+    doc.add_sheet("marzo")
+    doc.set_cell(0, 0, "marzo")
+    doc.switch_sheet(1)
+    assert not doc.workbook.sheets[0].resident
+    assert doc.save_workbook(WorkbookTask(path))
+    
+    reopened = make_document()
+    reopened.open_workbook(WorkbookTask(path))
+    assert reopened.sheet_names() == ["enero", "febrero", "marzo"]
+    assert reopened.active_sheet() == 1
+    assert reopened.engine.display(0, 0) == "3"
+    reopened.switch_sheet(0)
+    assert reopened.engine.display(2, 1) == "150"
+    
+    # Guardar otra vez en el mismo libro solo agrega lo modificado
+    reopened.set_cell(1, 1, "70")
+    assert reopened.save_workbook(WorkbookTask(path))
+    # El punto de control de la pestaña activa conserva las demás
+    reopened.checkpoint()
+    assert workbook_tabs(path) == (["enero", "febrero", "marzo"], 0)
+    
+    again = make_document()
+    again.open_workbook(WorkbookTask(path))
+    assert again.engine.display(2, 1) == "170"
+    again.switch_sheet(2)
+    assert again.sheet.get(0, 0) == "marzo"
+
+
+def test_sheets_go_to_disk_off_the_lock(tmp_path):
+    jobs = []
+    doc = SheetDocument(run_thread=lambda fn, *args: jobs.append((fn, args)))
+    doc.workbook.max_resident = 1
+    doc.workbook.directory = str(tmp_path)
+    doc.set_cell(0, 0, "uno")
+    doc.add_sheet()
+    
+    # La primera sigue en memoria hasta que el hilo la escribe
+    first = doc.workbook.sheets[0]
+    assert first.resident and len(jobs) == 1
+    fn, args = jobs.pop()
+    fn(*args)
+    assert not first.resident
+    
+    # Si se vuelve a usar antes de que termine la escritura, sigue residente
+    doc.switch_sheet(0)
+    doc.set_cell(0, 0, "dos")
+    doc.switch_sheet(1)
+    doc.switch_sheet(0)
+    for fn, args in jobs:
+        fn(*args)
+    assert first.resident
+    assert doc.sheet.get(0, 0) == "dos"
@@ -0,0 +1,50 @@
+import sys
+import threading
+
+from sheet_document import SheetDocument
+from workbook_format import BLOCK_ROWS, WorkbookTask
+
+
+def make_document():
+    return SheetDocument(run_thread=lambda fn, *args: fn(*args))
+
+
+def test_columns_stay_readable_while_an_incremental_save_completes(tmp_path):
+    path = str(tmp_path / "libro.csmt")
+    rows = 3 * BLOCK_ROWS
+    doc = make_document()
+    doc.write_block(0, 0, [[str(row), f"fila {row}"] for row in range(rows)], "Cargar")
+    doc.sheet.make_numeric(0)
+    assert doc.save_workbook(WorkbookTask(path))
+    
+    errors = []
+    stop = threading.Event()
+    
+    def read_columns():
+        # Como la interfaz: lee sin el candado mientras el otro hilo guarda
+        row = 0
+        while not stop.is_set():
+            try:
+                assert doc.sheet.number(row, 0) is not None
+                assert doc.sheet.get(row, 1).startswith("fila")
+            except Exception as error:
+                errors.append(error)
+                return
+            row = (row + 997) % rows
+    
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    reader = threading.Thread(target=read_columns)
+    reader.start()
+    try:
+        for n in range(80):
+            doc.set_cell(n * 211 % rows, 1, f"fila editada {n}")
+            assert doc.save_workbook(WorkbookTask(path))
+    finally:
+        stop.set()
+        reader.join()
+        sys.setswitchinterval(interval)
+    
+    assert errors == []
+    assert doc.sheet.get(211, 1) == "fila editada 1"
+    assert doc.sheet.number(rows - 1, 0) == rows - 1
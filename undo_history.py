@@ -0,0 +1,162 @@
+from collections import deque
+
+from workbook_format import BLOCK_ROWS
+
+
+# Memoria aproximada de una celda guardada en el historial (tupla y textos cortos)
+CELL_COST = 96
+
+
+def sheet_state(sheet):
+    """Contenido de la hoja como (columnas, filas, columnas visibles), sin copiarlo"""
+    return sheet.columns, sheet.num_rows, sheet.num_cols
+
+
+def restore_state(sheet, state):
+    sheet.columns, sheet.num_rows, sheet.num_cols = state
+
+
+def state_cost(state):
+    """Memoria aproximada de un contenido guardado con `sheet_state`"""
+    cost = 0
+    for column in state[0]:
+        if column is None:
+            continue
+        if column.kind == "mapped":
+            # Lo no modificado sigue en el archivo: solo cuentan los bloques sucios
+            cost += len(column.dirty) * BLOCK_ROWS * 8
+        elif column.kind == "numeric":
+            cost += len(column.values) * 8 + len(column.text) * CELL_COST
+        else:
+            cost += len(column.values) * CELL_COST
+    return cost
+
+
+class CellsEntry:
+    """Cambio de celdas sueltas o de un rango: (fila, col, antes, después)"""
+    
+    def __init__(self, label, changes, mergeable=False):
+        self.label = label
+        self.changes = changes
+        self.mergeable = mergeable
+        self.cost = sum(CELL_COST + len(old) + len(new) for _, _, old, new in changes)
+    
+    def apply(self, engine, undo):
+        """Aplica el cambio hacia atrás o hacia adelante; devuelve las celdas afectadas"""
+        return engine.set_cells(self.texts(undo))
+    
+    def texts(self, undo):
+        """Textos que quedan en las celdas al aplicar el cambio (fila, col, texto)"""
+        if undo:
+            return [(row, col, old) for row, col, old, _ in reversed(self.changes)]
+        return [(row, col, new) for row, col, _, new in self.changes]
+
+
+class SheetEntry:
+    """Operación que reemplaza toda la hoja (cargar, limpiar): guarda el contenido
+    anterior tal cual y deshacer lo intercambia con el actual"""
+    
+    def __init__(self, label, state):
+        self.label = label
+        self.state = state
+        self.mergeable = False
+        self.cost = state_cost(state)
+    
+    def apply(self, engine, undo):
+        current = sheet_state(engine.sheet)
+        restore_state(engine.sheet, self.state)
+        self.state = current
+        self.cost = state_cost(current)
+        engine.recalculate_all()
+        return None
+
+
+class UndoHistory:
+    """Historial de deshacer/rehacer por diferencias.
+    
+    Cada entrada guarda solo lo que cambió, así deshacer cuesta lo que el
+    cambio y no lo que la hoja. Las operaciones masivas son una sola entrada.
+    Si el historial supera `max_bytes` se descartan las entradas más viejas.
+    """
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0
+    
+    def can_undo(self):
+        return bool(self.undo_stack)
+    
+    def can_redo(self):
+        return bool(self.redo_stack)
+    
+    def record(self, label, changes, merge=False):
+        """Agrega un cambio de celdas (fila, col, antes, después).
+        
+        Con `merge`, las ediciones seguidas de una misma celda (p. ej. cada
+        tecla) se juntan en una entrada hasta que se llama a `seal`.
+        """
+        changes = [change for change in changes if change[2] != change[3]]
+        if not changes:
+            return
+        if merge and len(changes) == 1 and self.undo_stack:
+            last = self.undo_stack[-1]
+            if last.mergeable and last.changes[0][:2] == changes[0][:2]:
+                row, col, old, _ = last.changes[0]
+                self.drop_redo()
+                self.size -= last.cost
+                self.undo_stack[-1] = CellsEntry(label, [(row, col, old, changes[0][3])], True)
+                self.size += self.undo_stack[-1].cost
+                return
+        self.push(CellsEntry(label, changes, merge and len(changes) == 1))
+    
+    def record_sheet(self, label, state):
+        """Agrega una operación sobre toda la hoja; `state` es el contenido
+        anterior (`sheet_state`) que la operación ya no usa"""
+        self.push(SheetEntry(label, state))
+    
+    def seal(self):
+        """La próxima edición empieza una entrada nueva"""
+        if self.undo_stack:
+            self.undo_stack[-1].mergeable = False
+    
+    def push(self, entry):
+        self.drop_redo()
+        self.undo_stack.append(entry)
+        self.size += entry.cost
+        self.evict()
+    
+    def drop_redo(self):
+        """Un cambio nuevo invalida lo que se había deshecho"""
+        self.size -= sum(entry.cost for entry in self.redo_stack)
+        self.redo_stack.clear()
+    
+    def evict(self):
+        while self.size > self.max_bytes and self.undo_stack:
+            self.size -= self.undo_stack.popleft().cost
+    
+    def undo(self, engine):
+        """Deshace la última entrada; devuelve (entrada, celdas afectadas o None
+        si cambió toda la hoja), o None si no hay nada que deshacer"""
+        return self.move(self.undo_stack, self.redo_stack.append, engine, True)
+    
+    def redo(self, engine):
+        return self.move(self.redo_stack, self.undo_stack.append, engine, False)
+    
+    def move(self, source, target, engine, undo):
+        if not source:
+            return None
+        entry = source.pop()
+        entry.mergeable = False
+        self.size -= entry.cost
+        changed = entry.apply(engine, undo)
+        target(entry)
+        self.size += entry.cost
+        self.evict()
+        return entry, changed
+    
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.size = 0
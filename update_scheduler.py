@@ -0,0 +1,78 @@
+import threading
+import time
+
+import perf
+from sheet_document import start_thread
+
+
+# Ventana en la que se juntan los cambios antes de enviarlos (un cuadro a ~20 fps)
+FRAME = 0.05
+
+
+class UpdateScheduler:
+    """Junta las tareas y los controles a refrescar de una ventana corta y los
+    envía en un solo `update`.
+    
+    `call(key, fn, ...)` deja pendiente una tarea: si llega otra con la misma
+    clave antes del envío reemplaza a la anterior (p. ej. confirmar una celda
+    con cada tecla: solo se confirma el último texto). `update(*controls)`
+    deja controles pendientes. Lo que no puede esperar (el eco de la celda con
+    el foco) se pasa a `flush`, que envía todo lo pendiente en el momento.
+    """
+    
+    def __init__(self, update, run_thread=start_thread, delay=FRAME):
+        self.send = update
+        self.run_thread = run_thread
+        self.delay = delay
+        self.lock = threading.Lock()
+        # Un envío a la vez: una tarea vieja nunca corre después de una nueva
+        self.flushing = threading.RLock()
+        self.calls = {}
+        self.controls = {}
+        self.scheduled = False
+    
+    def call(self, key, fn, *args):
+        with self.lock:
+            self.calls.pop(key, None)
+            self.calls[key] = (fn, args)
+        self.schedule()
+    
+    def update(self, *controls):
+        with self.lock:
+            for control in controls:
+                self.controls[id(control)] = control
+        self.schedule()
+    
+    def schedule(self):
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.run_thread(self.wait_and_flush)
+    
+    def wait_and_flush(self):
+        time.sleep(self.delay)
+        self.flush()
+    
+    def run_calls(self):
+        """Corre ya las tareas pendientes; sus controles siguen esperando el envío"""
+        with self.flushing:
+            with self.lock:
+                calls, self.calls = self.calls, {}
+            for fn, args in calls.values():
+                fn(*args)
+    
+    def flush(self, *controls):
+        """Corre las tareas pendientes y envía sus controles junto con `controls`"""
+        with self.flushing:
+            with self.lock:
+                self.scheduled = False
+            self.run_calls()
+            
+            with self.lock:
+                pending, self.controls = self.controls, {}
+            for control in controls:
+                pending[id(control)] = control
+            if pending:
+                perf.count("update.batched_controls", len(pending))
+                self.send(*pending.values())
@@ -0,0 +1,389 @@
+import math
+
+import flet as ft
+from flet import Colors, Border
+
+import perf
+
+
+class VirtualGrid:
+    """Rejilla con ventana: solo crea controles para las celdas visibles.
+    
+    Las filas que salen de la ventana (y las de una rejilla reconstruida) se
+    guardan para volver a usarlas con otra fila: no se crean controles al
+    desplazarse. Cada celda lleva sus coordenadas en `data` y todas comparten
+    los mismos manejadores.
+    """
+    
+    ROW_HEIGHT = 35
+    COL_WIDTH = 100
+    HEADER_WIDTH = 40
+    
+    def __init__(self, num_rows, num_cols, get_value, on_focus, on_change,
+                 column_letter, on_blur=None, on_submit=None, visible_rows=20,
+                 visible_cols=10, overscan_rows=5, overscan_cols=2):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        
+        # Callbacks de la aplicación
+        self.get_value = get_value
+        self.on_focus = on_focus
+        self.on_change = on_change
+        self.on_blur = on_blur
+        self.on_submit = on_submit
+        self.column_letter = column_letter
+        
+        # Tamaño del viewport (se ajusta con los eventos de scroll)
+        self.visible_rows = visible_rows
+        self.visible_cols = visible_cols
+        self.overscan_rows = overscan_rows
+        self.overscan_cols = overscan_cols
+        
+        # Primera fila/columna visible y ventana renderizada:
+        # [row_start, row_end) x [col_start, col_end)
+        self.first_row = self.first_col = 0
+        self.row_start = self.row_end = 0
+        self.col_start = self.col_end = None
+        
+        # Filas renderizadas: fila -> ft.Row, y celdas: (fila, col) -> ft.TextField
+        self.row_controls = {}
+        self.cells = {}
+        
+        # Controles libres para reutilizar y celda con el foco (su fila no se
+        # reutiliza: un evento atrasado de la celda iría a otras coordenadas)
+        self.free_rows = []
+        self.free_cells = []
+        self.header_cells = []
+        self.focused = None
+        
+        self.header = None
+        self.body = None
+        self.scroller = None
+        self.top_spacer = None
+        self.bottom_spacer = None
+    
+    @perf.traced("grid.build")
+    def build(self):
+        """Construye el contenedor con scroll y la primera ventana.
+        
+        Si la rejilla ya estaba construida, sus filas se reutilizan.
+        """
+        for row, control in self.row_controls.items():
+            self.recycle_row(control)
+        self.row_controls = {}
+        self.col_start = self.col_end = None
+        
+        self.header = ft.Row(spacing=0)
+        self.top_spacer = ft.Container(height=0)
+        self.bottom_spacer = ft.Container(height=0)
+        
+        self.body = ft.Column(
+            spacing=0,
+            scroll=ft.ScrollMode.ALWAYS,
+            on_scroll=self.on_vertical_scroll,
+            scroll_interval=50,
+            expand=True,
+        )
+        self.content = ft.Column(
+            [self.header, self.body],
+            spacing=0,
+            width=self.total_width(),
+        )
+        
+        self.render(0, 0)
+        
+        self.scroller = ft.Row(
+            [self.content],
+            scroll=ft.ScrollMode.ALWAYS,
+            on_scroll=self.on_horizontal_scroll,
+            scroll_interval=50,
+            vertical_alignment=ft.CrossAxisAlignment.STRETCH,
+            expand=True,
+        )
+        return self.scroller
+    
+    def total_width(self):
+        return self.HEADER_WIDTH + self.num_cols * self.COL_WIDTH
+    
+    def window(self, first, visible, overscan, total):
+        """Calcula el rango [inicio, fin) a renderizar con buffer de overscan"""
+        start = max(0, first - overscan)
+        end = min(total, first + visible + overscan)
+        return start, max(start, end)
+    
+    @perf.traced("grid.render")
+    def render(self, first_row, first_col):
+        """Renderiza la ventana que contiene la fila/columna indicadas"""
+        self.first_row, self.first_col = first_row, first_col
+        row_start, row_end = self.window(
+            first_row, self.visible_rows, self.overscan_rows, self.num_rows
+        )
+        col_start, col_end = self.window(
+            first_col, self.visible_cols, self.overscan_cols, self.num_cols
+        )
+        
+        # Si solo crece el final de la ventana de columnas se agregan las
+        # celdas nuevas; si se desplaza hay que rehacer todas las filas
+        if col_start == self.col_start and col_end > self.col_end:
+            self.extend_columns(col_end)
+        elif (col_start, col_end) != (self.col_start, self.col_end):
+            self.col_start, self.col_end = col_start, col_end
+            # Las filas se vuelven a usar con las columnas nuevas
+            for control in self.row_controls.values():
+                self.recycle_row(control)
+            self.row_controls = {}
+            self.build_header()
+        
+        # Las filas que salen de la ventana quedan libres para las que entran
+        for row in list(self.row_controls):
+            if not row_start <= row < row_end:
+                self.recycle_row(self.row_controls.pop(row))
+        
+        # Conservar las filas que siguen visibles y preparar solo las nuevas
+        row_controls = {}
+        for row in range(row_start, row_end):
+            control = self.row_controls.get(row)
+            if control is None:
+                control = self.build_row(row)
+            row_controls[row] = control
+        self.row_controls = row_controls
+        self.row_start, self.row_end = row_start, row_end
+        
+        self.top_spacer.height = row_start * self.ROW_HEIGHT
+        self.bottom_spacer.height = (self.num_rows - row_end) * self.ROW_HEIGHT
+        self.body.controls = (
+            [self.top_spacer]
+            + [row_controls[row] for row in range(row_start, row_end)]
+            + [self.bottom_spacer]
+        )
+    
+    def build_header(self):
+        """Arma los encabezados de columna de la ventana (A, B, C, ...)"""
+        if not self.header.controls:
+            corner = ft.Container(
+                content=ft.Text("", width=self.HEADER_WIDTH, text_align=ft.TextAlign.CENTER),
+                bgcolor=Colors.GREY_300,
+                border=Border.all(1, Colors.GREY_400),
+            )
+            self.header.controls = [corner, self.left_spacer(), self.right_spacer()]
+        
+        controls = self.header.controls
+        controls[1].width = self.col_start * self.COL_WIDTH
+        controls[2:-1] = [self.header_cell(col) for col in range(self.col_start, self.col_end)]
+        controls[-1].width = self.right_spacer_width()
+    
+    def header_cell(self, col):
+        """Encabezado de la columna `col`, reutilizando el de su posición en la ventana"""
+        index = col - self.col_start
+        while len(self.header_cells) <= index:
+            self.header_cells.append(ft.Container(
+                content=ft.Text(
+                    width=self.COL_WIDTH,
+                    text_align=ft.TextAlign.CENTER,
+                    weight=ft.FontWeight.BOLD,
+                ),
+                bgcolor=Colors.BLUE_GREY_100,
+                border=Border.all(1, Colors.GREY_400),
+            ))
+            perf.count("controls.created", 2)
+        cell = self.header_cells[index]
+        cell.content.value = self.column_letter(col)
+        return cell
+    
+    def build_row(self, row):
+        """Prepara una fila para las columnas de la ventana: reutiliza una libre
+        o crea una nueva"""
+        if self.free_rows:
+            control = self.free_rows.pop()
+            perf.count("controls.recycled")
+        else:
+            number = ft.Container(
+                content=ft.Text(
+                    width=self.HEADER_WIDTH,
+                    text_align=ft.TextAlign.CENTER,
+                    weight=ft.FontWeight.BOLD,
+                ),
+                bgcolor=Colors.BLUE_GREY_100,
+                border=Border.all(1, Colors.GREY_400),
+            )
+            control = ft.Row(
+                [number, self.left_spacer(), self.right_spacer()],
+                spacing=0,
+                height=self.ROW_HEIGHT,
+            )
+            # El número de fila (contenedor y texto), los espaciadores y la fila
+            perf.count("controls.created", 5)
+        self.bind_row(control, row)
+        return control
+    
+    def bind_row(self, control, row):
+        """Asocia la fila a `row` con una celda por columna de la ventana"""
+        control.data = row
+        controls = control.controls
+        controls[0].content.value = str(row + 1)
+        controls[1].width = self.col_start * self.COL_WIDTH
+        
+        # Sobran o faltan celdas si la ventana de columnas cambió de ancho
+        cells = controls[2:-1]
+        num_cols = self.col_end - self.col_start
+        self.free_cells.extend(cells[num_cols:])
+        del cells[num_cols:]
+        while len(cells) < num_cols:
+            cells.append(self.new_cell())
+        for col, cell in zip(range(self.col_start, self.col_end), cells):
+            self.bind_cell(cell, row, col)
+        controls[2:-1] = cells
+        controls[-1].width = self.right_spacer_width()
+    
+    def recycle_row(self, control):
+        """Libera la fila para reutilizarla (la de la celda con el foco se descarta)"""
+        for cell in control.controls[2:-1]:
+            self.cells.pop(cell.data, None)
+        if self.focused is None or self.focused[0] != control.data:
+            self.free_rows.append(control)
+    
+    def new_cell(self):
+        """Campo de celda libre o nuevo; los manejadores leen las coordenadas de `data`"""
+        if self.free_cells:
+            return self.free_cells.pop()
+        perf.count("controls.created")
+        return ft.TextField(
+            width=self.COL_WIDTH,
+            height=self.ROW_HEIGHT,
+            text_size=12,
+            border_color=Colors.GREY_400,
+            focused_border_color=Colors.BLUE_400,
+            on_focus=self.focus_cell,
+            on_change=self.change_cell,
+            on_blur=self.blur_cell,
+            on_submit=self.submit_cell if self.on_submit else None,
+            dense=True,
+        )
+    
+    def bind_cell(self, cell, row, col):
+        """Asocia el campo a la celda y lo registra en el mapa (fila, col)"""
+        cell.data = (row, col)
+        cell.value = self.get_value(row, col)
+        self.cells[(row, col)] = cell
+    
+    def focus_cell(self, e):
+        self.focused = e.control.data
+        self.on_focus(e, *e.control.data)
+    
+    def change_cell(self, e):
+        self.on_change(e, *e.control.data)
+    
+    def blur_cell(self, e):
+        if self.focused == e.control.data:
+            self.focused = None
+        if self.on_blur:
+            self.on_blur(e, *e.control.data)
+    
+    def submit_cell(self, e):
+        self.on_submit(e, *e.control.data)
+    
+    def extend_columns(self, col_end):
+        """Agrega a las filas ya renderizadas solo las celdas de las columnas nuevas"""
+        new_cols = range(self.col_end, col_end)
+        self.col_end = col_end
+        
+        # El último control de cada fila es el espaciador derecho
+        self.header.controls[-1:-1] = [self.header_cell(col) for col in new_cols]
+        self.header.controls[-1].width = self.right_spacer_width()
+        for row, control in self.row_controls.items():
+            cells = []
+            for col in new_cols:
+                cell = self.new_cell()
+                self.bind_cell(cell, row, col)
+                cells.append(cell)
+            control.controls[-1:-1] = cells
+            control.controls[-1].width = self.right_spacer_width()
+    
+    def left_spacer(self):
+        return ft.Container(width=self.col_start * self.COL_WIDTH)
+    
+    def right_spacer(self):
+        return ft.Container(width=self.right_spacer_width())
+    
+    def right_spacer_width(self):
+        return (self.num_cols - self.col_end) * self.COL_WIDTH
+    
+    def patch_cell(self, row, col):
+        """Actualiza solo el control de la celda, si está en la ventana"""
+        self.patch_cells([(row, col)])
+    
+    def patch_cells(self, cells, send=None):
+        """Actualiza los controles renderizados de varias celdas en un solo envío.
+        
+        `send` recibe los controles en lugar de `page.update` (p. ej. para
+        juntarlos con otros cambios antes de enviarlos).
+        """
+        controls = []
+        if len(cells) > len(self.cells):
+            # Muchas celdas (un bloque pegado): se recorren solo las renderizadas
+            cells = cells if isinstance(cells, (set, frozenset, dict)) else set(cells)
+            for (row, col), cell in self.cells.items():
+                if (row, col) in cells:
+                    cell.value = self.get_value(row, col)
+                    controls.append(cell)
+        else:
+            for row, col in cells:
+                cell = self.cells.get((row, col))
+                if cell is not None:
+                    cell.value = self.get_value(row, col)
+                    controls.append(cell)
+        perf.count("cells.touched", len(controls))
+        if controls:
+            (send or self.body.page.update)(*controls)
+    
+    def patch_all(self):
+        """Refresca los valores de todas las celdas renderizadas"""
+        for (row, col), cell in self.cells.items():
+            cell.value = self.get_value(row, col)
+        perf.count("cells.touched", len(self.cells))
+        self.body.update()
+    
+    def resize(self, num_rows, num_cols):
+        """Ajusta el tamaño de la hoja creando solo los controles nuevos visibles"""
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.content.width = self.total_width()
+        
+        self.render(self.first_row, self.first_col)
+        
+        # Los espaciadores derechos dependen del número total de columnas
+        self.header.controls[-1].width = self.right_spacer_width()
+        for control in self.row_controls.values():
+            control.controls[-1].width = self.right_spacer_width()
+        self.content.update()
+    
+    async def scroll_to(self, row, col, focus=True):
+        """Lleva la celda a la vista (y le da el foco)"""
+        if not (self.row_start <= row < self.row_end and self.col_start <= col < self.col_end):
+            self.render(row, col)
+            self.content.update()
+        await self.body.scroll_to(offset=row * self.ROW_HEIGHT)
+        await self.scroller.scroll_to(offset=col * self.COL_WIDTH)
+        if focus:
+            await self.cells[(row, col)].focus()
+    
+    def on_vertical_scroll(self, e):
+        """Intercambia filas cuando el viewport sale de la ventana renderizada"""
+        self.visible_rows = max(1, math.ceil(e.viewport_dimension / self.ROW_HEIGHT))
+        first_row = max(0, int(e.pixels // self.ROW_HEIGHT))
+        last_row = min(self.num_rows, first_row + self.visible_rows)
+        
+        if first_row < self.row_start or last_row > self.row_end:
+            self.render(first_row, self.first_col)
+            self.body.update()
+    
+    def on_horizontal_scroll(self, e):
+        """Intercambia columnas cuando el viewport sale de la ventana renderizada"""
+        self.visible_cols = max(1, math.ceil(e.viewport_dimension / self.COL_WIDTH))
+        first_col = max(0, int((e.pixels - self.HEADER_WIDTH) // self.COL_WIDTH))
+        last_col = min(self.num_cols, first_col + self.visible_cols)
+        
+        if first_col < self.col_start or last_col > self.col_end:
+            self.render(self.first_row, first_col)
+            self.content.update()
+
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import perf
+from workbook_format import open_workbook, save_workbook
+
+
+# Hojas en memoria a la vez, contando la activa; las demás esperan en disco
+MAX_RESIDENT = 3
+
+SHEET_NAME = "Hoja"
+
+
+def sheet_name(path):
+    """Nombre de pestaña para un archivo: "ventas/enero.csv" -> "enero" """
+    return os.path.splitext(os.path.basename(path))[0] or SHEET_NAME
+
+
+class WorkbookSheet:
+    """Una pestaña del libro.
+    
+    Residente, `state` es el estado del motor de fórmulas (hoja, fórmulas,
+    valores y grafo, ver `FormulaEngine.state`) y `history` su historial.
+    Guardada, `state` es None y la hoja espera en el .csmt `path`: en su
+    archivo temporal (`spill`) o, si no se tocó desde que se abrió o guardó
+    el libro, en la pestaña `tab` del libro mismo.
+    """
+    
+    def __init__(self, name, state, history, autosave):
+        self.name = name
+        self.state = state
+        self.history = history
+        self.autosave = autosave
+        self.path = None
+        self.tab = None
+        self.spill = None
+        # Tabla dinámica que llena la hoja (ver pivot.PivotTable), o None
+        self.pivot = None
+    
+    @property
+    def resident(self):
+        return self.state is not None
+
+
+class Workbook:
+    """Pestañas de un libro con a lo sumo `max_resident` hojas en memoria.
+    
+    Las residentes se ordenan por uso; al pasar el límite la menos usada se
+    guarda en un .csmt de `directory` (una carpeta temporal si no se indica)
+    y suelta la memoria; la escritura va en un hilo aparte (ver `park`). Al
+    volver a ella el archivo se mapea sin decodificar (solo se leen los
+    bloques que se muestran) y las demás hojas no se tocan.
+    """
+    
+    def __init__(self, max_resident=MAX_RESIDENT, directory=None):
+        self.sheets = []
+        self.active = 0
+        self.max_resident = max_resident
+        # id(pestaña) -> pestaña residente, de la menos a la más usada
+        self.recent = OrderedDict()
+        self.directory = directory
+        self.temp_dir = None
+        self.spilled = 0
+        # Una pestaña a la vez: dos bajadas de la misma hoja no se pisan
+        self.park_lock = threading.Lock()
+    
+    @property
+    def current(self):
+        return self.sheets[self.active]
+    
+    def names(self):
+        return [entry.name for entry in self.sheets]
+    
+    def unique_name(self, base=None, skip=None):
+        """`base` si no lo usa otra pestaña (salvo la `skip`); si no, con un número"""
+        names = {entry.name for index, entry in enumerate(self.sheets) if index != skip}
+        if base is None:
+            number = len(self.sheets) + 1
+            while f"{SHEET_NAME}{number}" in names:
+                number += 1
+            return f"{SHEET_NAME}{number}"
+        name, number = base, 2
+        while name in names:
+            name = f"{base} ({number})"
+            number += 1
+        return name
+    
+    def add(self, entry):
+        """Agrega la pestaña al final; devuelve su índice"""
+        self.sheets.append(entry)
+        return len(self.sheets) - 1
+    
+    def insert(self, index, entry):
+        """Agrega la pestaña en la posición `index` (la activa sigue siéndolo)"""
+        self.sheets.insert(index, entry)
+        if index <= self.active:
+            self.active += 1
+    
+    def rename(self, index, name):
+        self.sheets[index].name = self.unique_name(name, skip=index)
+    
+    def touch(self, entry):
+        """La pestaña pasa a ser la más usada. Devuelve las que sobran, para
+        `park`, con una copia de su hoja (con el candado de la hoja tomado:
+        copiar es rápido, escribirla no)"""
+        self.recent.pop(id(entry), None)
+        self.recent[id(entry)] = entry
+        spills = []
+        while len(self.recent) > max(1, self.max_resident):
+            oldest = self.recent.pop(next(iter(self.recent)))
+            sheet, formulas = oldest.state[:2]
+            spills.append((oldest, oldest.state, sheet.copy(), list(formulas)))
+        return spills
+    
+    def park(self, spill, lock):
+        """Guarda en su .csmt la copia de una pestaña de `touch` (sin el
+        candado `lock` de la hoja; si ya estaba ahí solo se agregan los bloques
+        modificados) y, si mientras tanto no se volvió a usar, suelta su memoria"""
+        entry, state, sheet, formulas = spill
+        with self.park_lock:
+            if entry.spill is None:
+                entry.spill = self.spill_path()
+            with perf.span("workbook.park"):
+                save_workbook(sheet, entry.spill, formulas, tabs=[])
+        with lock:
+            # Si se volvió a usar tiene otro estado: sigue residente
+            if entry.state is state:
+                entry.state = None
+                entry.path, entry.tab = entry.spill, None
+                # Las copias del historial retendrían la hoja en memoria
+                entry.history.clear()
+    
+    def load(self, entry):
+        """(hoja mapeada, celdas con fórmula) de una pestaña guardada en disco"""
+        with perf.span("workbook.load"):
+            return open_workbook(entry.path, entry.tab)
+    
+    def spill_path(self):
+        directory = self.directory
+        if directory is None:
+            if self.temp_dir is None:
+                self.temp_dir = tempfile.TemporaryDirectory(prefix="contsmart-hojas-", ignore_cleanup_errors=True)
+            directory = self.temp_dir.name
+        self.spilled += 1
+        return os.path.join(directory, f"hoja-{self.spilled}.csmt")
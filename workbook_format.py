@@ -0,0 +1,715 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+
+from column_types import type_from_spec
+from sheet_model import NAN, Sheet, format_number, parse_number, update_numeric_view
+
+
+# Formato .csmt:
+#   cabecera | bloques de columna | índice JSON | pie
+# Cada bloque guarda BLOCK_ROWS filas de una columna, como doubles empaquetados
+# (bloque "numeric") o como offsets + UTF-8 (bloque "text"). Un guardado
+# incremental agrega al final solo los bloques modificados y un índice nuevo.
+# El índice guarda también el tipo de las columnas tipadas ("1.234,56", fechas),
+# que se usa para codificar sus bloques numéricos y volver a mostrarlos.
+# Un libro con varias pestañas describe la activa como uno de una sola hoja
+# y agrega "tabs": en orden, el nombre de cada pestaña con sus columnas y
+# fórmulas, salvo la activa, marcada con "active".
+
+MAGIC = b"CSMT"
+VERSION = 1
+BLOCK_ROWS = 4096
+
+HEADER = struct.Struct("<4sHH")
+FOOTER = struct.Struct("<QQI8s")
+FOOTER_MARK = b"CSMTINDX"
+NUMBER = struct.Struct("<d")
+
+# Si la basura de guardados incrementales supera esta fracción se reescribe todo
+# (en Windows no: no se puede reemplazar un archivo que sigue mapeado)
+MAX_GARBAGE = 0.5
+COMPACT = os.name != "nt"
+
+
+def to_little_endian(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def parsers(column_type):
+    """(parse, format) de los números de una columna con ese tipo"""
+    if column_type is None:
+        return parse_number, format_number
+    return column_type.parse, column_type.format
+
+
+def encode_block(values, column_type=None):
+    """Codifica los textos de un bloque; devuelve (tipo, bytes, no vacías) o None si está vacío"""
+    count = len(values) - values.count("")
+    if count == 0:
+        return None
+    
+    parse, render = parsers(column_type)
+    numbers = array("d", [NAN]) * len(values)
+    for row, value in enumerate(values):
+        if value == "":
+            continue
+        number = parse(value)
+        if number is None or render(number) != value:
+            break
+        numbers[row] = number
+    else:
+        return "numeric", to_little_endian(numbers).tobytes(), count
+    
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = array("I", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    return "text", to_little_endian(offsets).tobytes() + b"".join(encoded), count
+
+
+def decode_numbers(data):
+    numbers = array("d")
+    numbers.frombytes(data)
+    return to_little_endian(numbers)
+
+
+def decode_block(data, kind, rows, column_type=None):
+    """Devuelve los textos de un bloque (lista de BLOCK_ROWS elementos)"""
+    if kind == "numeric":
+        render = parsers(column_type)[1]
+        values = [render(value) if value == value else "" for value in decode_numbers(data)]
+    else:
+        offsets = array("I")
+        offsets.frombytes(data[:(rows + 1) * offsets.itemsize])
+        offsets = to_little_endian(offsets)
+        blob = bytes(data[(rows + 1) * offsets.itemsize:])
+        values = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(rows)]
+    if len(values) < BLOCK_ROWS:
+        values.extend([""] * (BLOCK_ROWS - len(values)))
+    return values
+
+
+class WorkbookFile:
+    """Archivo .csmt abierto con mmap: los bloques se decodifican bajo demanda.
+    
+    Lo comparten las columnas mapeadas de la hoja y de sus copias; se cierra
+    cuando la última lo suelta.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.refs = 0
+        self.refs_lock = threading.Lock()
+        self.reload()
+    
+    def acquire(self):
+        with self.refs_lock:
+            self.refs += 1
+    
+    def release(self):
+        with self.refs_lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+        self.close()
+    
+    def reload(self):
+        """(Re)abre el mapeo, p. ej. después de agregar bloques al final.
+        
+        Lo llama el guardado incremental desde su hilo mientras la interfaz
+        lee las columnas: el mapeo nuevo se arma entero antes de cambiarlo, y
+        el anterior no se cierra a mano, sino cuando lo suelta la última
+        lectura que lo esté usando (los bloques viejos no se mueven, así que
+        cualquiera de los dos sirve mientras tanto).
+        """
+        file = open(self.path, "rb")
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _ = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version > VERSION:
+                raise ValueError(f"No es un libro ContSmart válido: {self.path}")
+            index, end = self.read_index(data)
+        except BaseException:
+            data.close()
+            file.close()
+            raise
+        
+        old_file = self.file
+        self.file, self.map = file, data
+        self.index, self.end = index, end
+        if old_file is not None:
+            old_file.close()
+    
+    def read_index(self, data):
+        """Busca desde el final el último pie válido (un guardado incremental
+        interrumpido deja bytes sueltos después)"""
+        pos = len(data)
+        while True:
+            pos = data.rfind(FOOTER_MARK, HEADER.size, pos)
+            if pos < 0:
+                raise ValueError(f"Libro dañado, no se encontró el índice: {self.path}")
+            start = pos + len(FOOTER_MARK) - FOOTER.size
+            if start < HEADER.size:
+                continue
+            offset, length, crc, _ = FOOTER.unpack_from(data, start)
+            if offset + length == start and zlib.crc32(data[offset:start]) == crc:
+                return json.loads(data[offset:start]), start + FOOTER.size
+    
+    def raw(self, entry):
+        _, offset, length, _, _ = entry
+        return self.map[offset:offset + length]
+    
+    def block(self, entry, column_type=None):
+        kind, _, _, rows, _ = entry
+        return decode_block(self.raw(entry), kind, rows, column_type)
+    
+    def live_bytes(self):
+        sheets = [self.index] + [tab for tab in self.index.get("tabs", ()) if not tab.get("active")]
+        return sum(
+            entry[2] for sheet in sheets for blocks in sheet["columns"].values() for entry in blocks.values()
+        )
+    
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = self.file = None
+
+
+class MappedColumn:
+    """Columna respaldada por un archivo .csmt: decodifica solo los bloques que se leen"""
+    
+    kind = "mapped"
+    
+    # Bloques sin modificar que se conservan decodificados
+    MAX_DECODED = 64
+    
+    def __init__(self, source, blocks):
+        self.source = None
+        self.bind(source, blocks)
+        self.decoded = {}
+        # Bloques modificados -> versión de la columna en su último cambio
+        self.dirty = {}
+        self.numeric_view = None
+        self.column_type = None
+        self.version = 0
+    
+    def bind(self, source, blocks):
+        """Apunta la columna a los bloques de `source` y suelta el archivo anterior"""
+        source.acquire()
+        if self.source is not None:
+            self.source.release()
+        self.source = source
+        self.blocks = blocks
+    
+    def __del__(self):
+        if self.source is not None:
+            self.source.release()
+    
+    def block(self, index):
+        values = self.decoded.get(index)
+        if values is None:
+            entry = self.blocks.get(index)
+            if entry is not None:
+                values = self.source.block(entry, self.column_type)
+            else:
+                values = [""] * BLOCK_ROWS
+            if len(self.decoded) - len(self.dirty) >= self.MAX_DECODED:
+                self.evict()
+            self.decoded[index] = values
+        return values
+    
+    def evict(self):
+        for index in self.decoded:
+            if index not in self.dirty:
+                del self.decoded[index]
+                return
+    
+    def num_blocks(self):
+        return max(max(self.blocks, default=-1), max(self.dirty, default=-1)) + 1
+    
+    def get(self, row):
+        index = row // BLOCK_ROWS
+        if index not in self.blocks and index not in self.dirty:
+            return ""
+        return self.block(index)[row % BLOCK_ROWS]
+    
+    def number(self, row):
+        index, offset = divmod(row, BLOCK_ROWS)
+        entry = self.blocks.get(index)
+        if entry is not None and entry[0] == "numeric" and index not in self.dirty:
+            # Bloque numérico sin editar: el double se lee directamente del archivo
+            if offset >= entry[3]:
+                return None
+            value = NUMBER.unpack_from(self.source.map, entry[1] + offset * NUMBER.size)[0]
+            return value if value == value else None
+        return parsers(self.column_type)[0](self.get(row))
+    
+    def set(self, row, value):
+        index = row // BLOCK_ROWS
+        if value == "" and index not in self.blocks and index not in self.dirty:
+            return
+        self.block(index)[row % BLOCK_ROWS] = value
+        self.version += 1
+        self.dirty[index] = self.version
+        update_numeric_view(self.numeric_view, row, value, parsers(self.column_type)[0])
+    
+    def numbers(self):
+        """Vista numérica array('d'); los bloques numéricos se copian sin decodificar"""
+        if self.numeric_view is None:
+            parse = parsers(self.column_type)[0]
+            view = array("d")
+            empty = array("d", [NAN]) * BLOCK_ROWS
+            for index in range(self.num_blocks()):
+                entry = self.blocks.get(index)
+                if index in self.decoded:
+                    view.extend(array(
+                        "d", [NAN if number is None else number
+                              for number in map(parse, self.decoded[index])]
+                    ))
+                elif entry is None:
+                    view.extend(empty)
+                elif entry[0] == "numeric":
+                    view.extend(decode_numbers(self.source.raw(entry)))
+                    if entry[3] < BLOCK_ROWS:
+                        view.extend(array("d", [NAN]) * (BLOCK_ROWS - entry[3]))
+                else:
+                    view.extend(array(
+                        "d", [NAN if number is None else number
+                              for number in map(parse, self.source.block(entry))]
+                    ))
+            self.numeric_view = view
+        return self.numeric_view
+    
+    def copy(self):
+        """Copia que comparte los bloques del archivo y duplica solo los modificados"""
+        column = MappedColumn(self.source, dict(self.blocks))
+        column.column_type = self.column_type
+        column.decoded = {index: list(self.decoded[index]) for index in self.dirty}
+        column.dirty = dict(self.dirty)
+        column.version = self.version
+        return column
+    
+    def count(self):
+        total = 0
+        for index in range(self.num_blocks()):
+            if index in self.dirty:
+                values = self.decoded[index]
+                total += len(values) - values.count("")
+            elif index in self.blocks:
+                total += self.blocks[index][4]
+        return total
+    
+    def items(self):
+        result = []
+        for index in range(self.num_blocks()):
+            if index in self.blocks or index in self.dirty:
+                start = index * BLOCK_ROWS
+                result.extend(
+                    (start + offset, value)
+                    for offset, value in enumerate(self.block(index)) if value != ""
+                )
+        return result
+    
+    def slice(self, start, stop):
+        values = []
+        row = start
+        while row < stop:
+            index, offset = divmod(row, BLOCK_ROWS)
+            end = min(stop, (index + 1) * BLOCK_ROWS)
+            if index in self.blocks or index in self.dirty:
+                values.extend(self.block(index)[offset:offset + end - row])
+            else:
+                values.extend([""] * (end - row))
+            row = end
+        return values
+
+
+def column_blocks(column):
+    """Textos de la columna por bloque: {bloque: lista}, omitiendo los vacíos"""
+    blocks = {}
+    for row, value in column.items():
+        index, offset = divmod(row, BLOCK_ROWS)
+        values = blocks.get(index)
+        if values is None:
+            values = blocks[index] = [""] * BLOCK_ROWS
+        values[offset] = value
+    return blocks
+
+
+def trimmed(values):
+    """Quita las filas vacías del final del bloque (el último suele estar a medias)"""
+    end = len(values)
+    while end and values[end - 1] == "":
+        end -= 1
+    return values[:end]
+
+
+class BlockWriter:
+    """Escribe bloques en un archivo abierto y arma el índice"""
+    
+    def __init__(self, f):
+        self.f = f
+        self.columns = {}
+        self.types = {}
+    
+    def write_raw(self, col, index, kind, data, rows, count):
+        offset = self.f.tell()
+        self.f.write(data)
+        entry = [kind, offset, len(data), rows, count]
+        self.columns.setdefault(str(col), {})[str(index)] = entry
+    
+    def write_values(self, col, index, values, column_type=None):
+        values = trimmed(values)
+        block = encode_block(values, column_type)
+        if block is not None:
+            kind, data, count = block
+            self.write_raw(col, index, kind, data, len(values), count)
+    
+    def write_column(self, col, column, source):
+        """Escribe una columna; de las mapeadas solo los bloques modificados,
+        salvo que `source` sea None (reescritura completa, se copian en crudo)"""
+        if column.column_type is not None:
+            self.types[str(col)] = column.column_type.spec()
+        if isinstance(column, MappedColumn):
+            for index, entry in column.blocks.items():
+                if index in column.dirty:
+                    continue
+                if column.source is source:
+                    self.columns.setdefault(str(col), {})[str(index)] = entry
+                else:
+                    kind, _, _, rows, count = entry
+                    self.write_raw(col, index, kind, column.source.raw(entry), rows, count)
+            for index in sorted(column.dirty):
+                self.write_values(col, index, column.decoded[index], column.column_type)
+        elif column.kind == "numeric":
+            self.write_numbers(col, column)
+        else:
+            for index, values in sorted(column_blocks(column).items()):
+                self.write_values(col, index, values, column.column_type)
+    
+    def write_numbers(self, col, column):
+        """Columna numérica: los bloques sin textos aparte se copian del array
+        tal cual, sin pasar por texto"""
+        values = column.values
+        with_text = {row // BLOCK_ROWS for row in column.text}
+        for index in range((len(values) + BLOCK_ROWS - 1) // BLOCK_ROWS):
+            start = index * BLOCK_ROWS
+            if index in with_text:
+                self.write_values(col, index, column.slice(start, start + BLOCK_ROWS), column.column_type)
+                continue
+            numbers = values[start:start + BLOCK_ROWS]
+            count = sum(1 for value in numbers if value == value)
+            if count:
+                self.write_raw(col, index, "numeric", to_little_endian(numbers).tobytes(), len(numbers), count)
+    
+    def descriptor(self, sheet, formulas):
+        """Lo que guarda el índice de una hoja escrita con este escritor"""
+        return {
+            "num_rows": sheet.num_rows,
+            "num_cols": sheet.num_cols,
+            "columns": self.columns,
+            "types": self.types,
+            "formulas": sorted(formulas),
+        }
+    
+    def write_index(self, sheet, formulas, tabs=None):
+        index = {"version": VERSION, "block_rows": BLOCK_ROWS, **self.descriptor(sheet, formulas)}
+        if tabs:
+            index["tabs"] = tabs
+        data = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        offset = self.f.tell()
+        self.f.write(data)
+        self.f.write(FOOTER.pack(offset, len(data), zlib.crc32(data), FOOTER_MARK))
+
+
+def mapped_source(sheet):
+    """Archivo del que proviene la hoja (el de sus columnas mapeadas) o None"""
+    for column in sheet.columns:
+        if isinstance(column, MappedColumn):
+            return column.source
+    return None
+
+
+def is_same_file(source, path):
+    return (
+        source is not None and source.map is not None and os.path.exists(path)
+        and os.path.samefile(source.path, path)
+    )
+
+
+def file_tabs(source, sheet, formulas):
+    """Pestañas guardadas en `source` como las recibe `save_workbook`: la
+    activa pasa a ser `sheet` y las demás se mapean sin decodificarlas"""
+    tabs = []
+    for tab in source.index.get("tabs", ()):
+        if tab.get("active"):
+            tabs.append((tab["name"], sheet, formulas))
+        else:
+            tabs.append((tab["name"], mapped_sheet(source, tab), tab["formulas"]))
+    return tabs
+
+
+def tab_entries(tabs, sheet, writers):
+    """Entradas "tabs" del índice; `writers` son los de las pestañas que no
+    son `sheet`, en orden"""
+    writers = iter(writers)
+    entries = []
+    for name, tab_sheet, tab_formulas in tabs:
+        if tab_sheet is sheet:
+            entries.append({"name": name, "active": True})
+        else:
+            entries.append({"name": name, **next(writers).descriptor(tab_sheet, tab_formulas)})
+    return entries
+
+
+def rebind(sheet, source, columns):
+    """Deja todas las columnas escritas mapeadas sobre `source`: las siguientes
+    ediciones solo marcan bloques y el próximo guardado es incremental"""
+    for col, column in enumerate(sheet.columns):
+        if column is None:
+            continue
+        blocks = {int(index): entry for index, entry in columns.get(str(col), {}).items()}
+        if isinstance(column, MappedColumn):
+            column.bind(source, blocks)
+            column.dirty.clear()
+        elif blocks:
+            mapped = MappedColumn(source, blocks)
+            mapped.column_type = column.column_type
+            mapped.numeric_view = column.values if column.kind == "numeric" else column.numeric_view
+            sheet.columns[col] = mapped
+        else:
+            sheet.columns[col] = None
+
+
+def snapshot_sheet(sheet):
+    """Copia de la hoja para guardarla fuera del candado.
+    
+    Devuelve (copia, origen) donde origen guarda cada columna de la hoja y su
+    versión al copiarla, para `adopt_saved`.
+    """
+    origin = [
+        (column, column.version) if column is not None else None for column in sheet.columns
+    ]
+    return sheet.copy(), origin
+
+
+def adopt_saved(sheet, saved, origin):
+    """Pasa a la hoja viva el resultado de guardar su copia `saved`.
+    
+    Las columnas que no cambiaron desde la copia pasan a estar mapeadas sobre
+    el archivo; las ya mapeadas solo siguen marcando los bloques editados
+    después de la copia.
+    """
+    for col, entry in enumerate(origin):
+        if entry is None or col >= len(sheet.columns):
+            continue
+        column, version = entry
+        if sheet.columns[col] is not column:
+            continue
+        written = saved.columns[col] if col < len(saved.columns) else None
+        
+        if isinstance(column, MappedColumn):
+            if written is not None:
+                column.bind(written.source, dict(written.blocks))
+            else:
+                column.blocks = {}
+            column.dirty = {
+                index: changed for index, changed in column.dirty.items() if changed > version
+            }
+        elif column.version == version:
+            sheet.columns[col] = written
+            saved.columns[col] = None
+
+
+class WorkbookTask:
+    """Guardado de un libro en segundo plano, con progreso y cancelación"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.total = 0
+        self.done = 0
+        self.cancelled = False
+        self.on_chunk = None
+    
+    @property
+    def progress(self):
+        """Fracción de columnas escritas (0.0 a 1.0)"""
+        if not self.total:
+            return 1.0
+        return self.done / self.total
+    
+    def cancel(self):
+        self.cancelled = True
+    
+    def save(self, sheet, formulas=(), on_chunk=None, tabs=None):
+        """Guarda `sheet` (y las pestañas `tabs`, ver `save_workbook`); devuelve
+        False si se canceló (el archivo queda como estaba)"""
+        self.on_chunk = on_chunk
+        return save_workbook(sheet, self.path, formulas, task=self, tabs=tabs)
+    
+    def step(self):
+        """Cuenta una columna escrita; devuelve False si hay que cancelar"""
+        self.done += 1
+        if self.on_chunk is not None:
+            self.on_chunk(self)
+        return not self.cancelled
+
+
+def write_columns(f, sheets, source, task):
+    """Escribe las columnas de `sheets`; devuelve un BlockWriter por hoja, o
+    None si `task` se canceló"""
+    if task is not None:
+        task.total = sum(1 for sheet in sheets for column in sheet.columns if column is not None)
+    writers = []
+    for sheet in sheets:
+        writer = BlockWriter(f)
+        for col, column in enumerate(sheet.columns):
+            if column is None:
+                continue
+            writer.write_column(col, column, source)
+            if task is not None and not task.step():
+                return None
+        writers.append(writer)
+    return writers
+
+
+def open_existing(path):
+    """El .csmt de `path` abierto, o None si no existe o no se puede leer"""
+    try:
+        return WorkbookFile(path)
+    except (OSError, ValueError):
+        return None
+
+
+def save_workbook(sheet, path, formulas=(), task=None, tabs=None):
+    """Guarda la hoja en `path` (.csmt) y deja sus columnas mapeadas sobre él.
+    
+    `tabs` son las pestañas del libro en orden, [(nombre, hoja, celdas con
+    fórmula)], una de ellas con `sheet` (la activa, la que devuelve
+    `open_workbook`); las demás hojas también quedan mapeadas. Con None se
+    conservan las pestañas que ya tenía el archivo (el punto de control de
+    la activa no toca las demás).
+    
+    Si las hojas se abrieron de ese mismo archivo solo se agregan al final los
+    bloques modificados y un índice nuevo; si no (o si hay demasiada basura
+    acumulada) se escribe un archivo completo en un temporal que lo reemplaza.
+    Devuelve False si `task` se canceló (el archivo queda como estaba).
+    """
+    sheets = [sheet] + [tab_sheet for _, tab_sheet, _ in tabs or () if tab_sheet is not sheet]
+    source = next((s for s in map(mapped_source, sheets) if is_same_file(s, path)), None)
+    if tabs is None:
+        existing = source
+        if existing is None and os.path.exists(path):
+            existing = open_existing(path)
+        tabs = file_tabs(existing, sheet, formulas) if existing is not None else []
+        if tabs:
+            # Los bloques de las demás pestañas quedan donde están
+            source = existing
+            sheets = [sheet] + [tab_sheet for _, tab_sheet, _ in tabs if tab_sheet is not sheet]
+        elif existing is not source:
+            existing.close()
+    
+    same_file = source is not None
+    garbage = same_file and source.end - source.live_bytes() > source.end * MAX_GARBAGE
+    if same_file and not (COMPACT and garbage):
+        with open(path, "r+b") as f:
+            f.seek(source.end)
+            f.truncate()
+            writers = write_columns(f, sheets, source, task)
+            if writers is not None:
+                writers[0].write_index(sheet, formulas, tab_entries(tabs, sheet, writers[1:]))
+            else:
+                f.truncate(source.end)
+            f.flush()
+            os.fsync(f.fileno())
+        if writers is None:
+            return False
+        source.reload()
+        for tab_sheet, writer in zip(sheets, writers):
+            rebind(tab_sheet, source, writer.columns)
+        return True
+    
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".csmt-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0))
+            writers = write_columns(f, sheets, None, task)
+            if writers is not None:
+                writers[0].write_index(sheet, formulas, tab_entries(tabs, sheet, writers[1:]))
+                f.flush()
+                os.fsync(f.fileno())
+        if writers is None:
+            os.remove(temp_path)
+            return False
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    # El archivo anterior se cierra cuando lo suelta la última columna (o copia)
+    source = WorkbookFile(path)
+    for tab_sheet, writer in zip(sheets, writers):
+        rebind(tab_sheet, source, writer.columns)
+    if source.refs == 0:
+        source.close()
+    return True
+
+
+def open_workbook(path, tab=None, source=None):
+    """Abre un libro .csmt sin decodificar sus bloques: su pestaña activa o la
+    de la posición `tab`. `source` es el archivo de `path` si ya está abierto.
+    
+    Devuelve (hoja, celdas con fórmula como (fila, col, texto)).
+    """
+    if source is None:
+        source = WorkbookFile(path)
+    index = source.index
+    if tab is not None and not index["tabs"][tab].get("active"):
+        index = index["tabs"][tab]
+    sheet = mapped_sheet(source, index)
+    formulas = [(row, col, sheet.get(row, col)) for row, col in index["formulas"]]
+    if source.refs == 0:
+        source.close()
+    return sheet, formulas
+
+
+def workbook_tabs(path):
+    """(nombres de las pestañas, posición de la activa) del libro de `path`,
+    o None si tiene una sola hoja"""
+    source = WorkbookFile(path)
+    tabs = source.index.get("tabs")
+    source.close()
+    if not tabs:
+        return None
+    active = next(position for position, tab in enumerate(tabs) if tab.get("active"))
+    return [tab["name"] for tab in tabs], active
+
+
+def mapped_sheet(source, index):
+    """Hoja con las columnas del índice mapeadas sobre los bloques de `source`"""
+    sheet = Sheet(index["num_rows"], index["num_cols"])
+    types = index.get("types", {})
+    for col, blocks in index["columns"].items():
+        column = MappedColumn(source, {int(block): entry for block, entry in blocks.items()})
+        if col in types:
+            column.column_type = type_from_spec(types[col])
+        col = int(col)
+        if col >= len(sheet.columns):
+            sheet.columns.extend([None] * (col + 1 - len(sheet.columns)))
+        sheet.columns[col] = column
+    return sheet